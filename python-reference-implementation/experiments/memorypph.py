@@ -0,0 +1,70 @@
+import accountstore
+
+import os
+import sys
+
+# Compares the memory used per account by the old accountdict layout (a dict
+# of lists of dicts) and by the columnar AccountStore.   The usernames are
+# the same in both, so I leave them out.
+
+count = 100000
+if len(sys.argv) > 1:
+  count = int(sys.argv[1])
+
+ISOLATED_CHECK_BITS = 2
+
+
+def make_entry(num):
+  thisentry = {}
+  thisentry['sharenumber'] = num % 255 + 1
+  thisentry['salt'] = os.urandom(16)
+  thisentry['passhash'] = os.urandom(32 + ISOLATED_CHECK_BITS)
+  return thisentry
+
+
+def old_layout_size(accountdict):
+  # the dict's share of the table, plus the list, the entry dicts and what
+  # they hold.   Small ints are shared, so they aren't counted.
+  total = sys.getsizeof(accountdict)
+  for username in accountdict:
+    entries = accountdict[username]
+    total += sys.getsizeof(entries)
+    for entry in entries:
+      total += sys.getsizeof(entry)
+      total += sys.getsizeof(entry['salt'])
+      total += sys.getsizeof(entry['passhash'])
+      if entry['sharenumber'] > 256:
+        total += sys.getsizeof(entry['sharenumber'])
+  return total
+
+
+def new_layout_size(store):
+  total = sys.getsizeof(store._index)
+  total += sys.getsizeof(store._salts)
+  total += sys.getsizeof(store._passhashes)
+  total += sys.getsizeof(store._passhashlengths)
+  total += sys.getsizeof(store._sharenumbers)
+  total += sys.getsizeof(store._entrycounts)
+  # the row numbers in the index (above 256 they are all separate objects)
+  for username in store._index:
+    if store._index[username] > 256:
+      total += sys.getsizeof(store._index[username])
+  return total
+
+
+usernames = ['user'+str(num) for num in range(count)]
+
+accountdict = {}
+for num in range(count):
+  accountdict[usernames[num]] = [make_entry(num)]
+
+store = accountstore.AccountStore(16, 32 + ISOLATED_CHECK_BITS)
+for num in range(count):
+  store[usernames[num]] = accountdict[usernames[num]]
+
+rawsize = 2 + 16 + 32 + ISOLATED_CHECK_BITS
+
+print "Accounts:", count
+print "Raw data bytes per account:", rawsize
+print "Old layout bytes per account:", old_layout_size(accountdict) / float(count)
+print "New layout bytes per account:", new_layout_size(store) / float(count)
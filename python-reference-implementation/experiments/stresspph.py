@@ -0,0 +1,81 @@
+import polypasswordhasher
+
+import random
+import sys
+import threading
+import time
+
+# Logins from several threads while others keep creating accounts, the way a
+# burst of signups lands next to steady login traffic.   Reports the verify
+# latencies (p99 is what a global lock would hurt) and both throughputs.
+#
+# python stresspph.py [readers] [writers] [seconds] [accounts]
+
+readers = 4
+writers = 2
+seconds = 5.0
+accounts = 10000
+if len(sys.argv) > 1:
+  readers = int(sys.argv[1])
+if len(sys.argv) > 2:
+  writers = int(sys.argv[2])
+if len(sys.argv) > 3:
+  seconds = float(sys.argv[3])
+if len(sys.argv) > 4:
+  accounts = int(sys.argv[4])
+
+THRESHOLD = 10
+
+pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD)
+pph.create_account('admin', 'correct horse', THRESHOLD)
+
+# a mix of threshold and shielded accounts to log in to
+records = [('user'+str(num), 'password'+str(num), 1 if num < 200 else 0)
+    for num in range(accounts)]
+pph.create_accounts(records, processes = 1)
+
+stopping = threading.Event()
+latencies = [[] for num in range(readers)]
+created = [0] * writers
+
+
+def verify(threadnumber):
+  mylatencies = latencies[threadnumber]
+  while not stopping.is_set():
+    num = random.randrange(accounts)
+    starttime = time.time()
+    result = pph.is_valid_login('user'+str(num), 'password'+str(num))
+    mylatencies.append(time.time() - starttime)
+    assert(result == True)
+
+
+def create(threadnumber):
+  num = 0
+  while not stopping.is_set():
+    pph.create_account('new'+str(threadnumber)+'.'+str(num), 'signup', 0)
+    num += 1
+    created[threadnumber] = num
+
+
+threads = [threading.Thread(target=verify, args=(num,)) for num in
+    range(readers)]
+threads += [threading.Thread(target=create, args=(num,)) for num in
+    range(writers)]
+for thread in threads:
+  thread.start()
+time.sleep(seconds)
+stopping.set()
+for thread in threads:
+  thread.join()
+
+
+def percentile(values, fraction):
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+alllatencies = sorted(sum(latencies, []))
+print "readers", readers, "writers", writers, "accounts", accounts
+print "verifies/s:", "%.0f" % (len(alllatencies) / seconds), \
+    "creates/s:", "%.0f" % (sum(created) / seconds)
+print "verify p50: %.1f us  p99: %.1f us  max: %.1f us" % (
+    percentile(alllatencies, 0.5) * 1e6, percentile(alllatencies, 0.99) * 1e6,
+    alllatencies[-1] * 1e6)
@@ -200,3 +200,26 @@ endtime = time.time()
 
 print "Salted Hash creation time "+str((endtime-starttime)/count),"perf:",1/((endtime-starttime)/count)
 
+
+
+
+######################## Batched Salted Hash Time #######################
+import fastpolymath_c
+
+count = 10000
+salts = [os.urandom(16) for num in range(count)]
+passwords = ['kitten'+str(num) for num in range(count)]
+
+starttime= time.time()
+saltedpasswordhashes = [sha256(salt + password).digest() for (salt, password) in zip(salts, passwords)]
+endtime = time.time()
+
+print "Salted Hash hashlib loop time "+str((endtime-starttime)/count),"perf:",count/(endtime-starttime)
+
+starttime= time.time()
+batchedhashes = fastpolymath_c.sha256_many(salts, passwords)
+endtime = time.time()
+
+assert(batchedhashes == ''.join(saltedpasswordhashes))
+
+print "Salted Hash batched time (multi-buffer "+str(fastpolymath_c.SHA256_MULTIBUFFER)+") "+str((endtime-starttime)/count),"perf:",count/(endtime-starttime)
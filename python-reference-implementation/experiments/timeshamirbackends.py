@@ -0,0 +1,51 @@
+import shamirbackend
+
+import os
+import sys
+import time
+
+# Times each Shamir backend that can be imported here on the work that
+# PolyPasswordHasher does with it: computing every share for a new password
+# file, recovering the secret on unlock and checking a share on login.
+#
+# python timeshamirbackends.py [backend ...]
+
+backendnames = sys.argv[1:] or shamirbackend.available_backends()
+
+SECRET = os.urandom(32)
+
+
+def timeit(function, count):
+  starttime = time.time()
+  for num in range(count):
+    function()
+  return (time.time() - starttime) / count
+
+
+for THRESHOLD in [2,8,32,128,253]:
+  for name in backendnames:
+    backend = shamirbackend.get_backend(name)
+
+    # the slower backends get fewer tries at the big thresholds
+    count = max(1, 2000 // THRESHOLD)
+    if name == 'shamirsecret':
+      count = max(1, count // 20)
+
+    def createshares():
+      backend.ShamirSecret(THRESHOLD, SECRET).precompute_shares(range(1, 256))
+    createtime = timeit(createshares, count)
+
+    shares = backend.ShamirSecret(THRESHOLD, SECRET).compute_shares(
+        range(1, THRESHOLD+1))
+    def recover():
+      backend.ShamirSecret(THRESHOLD).recover_secretdata(shares)
+    recovertime = timeit(recover, count)
+
+    secret = backend.ShamirSecret(THRESHOLD)
+    secret.recover_secretdata(shares)
+    secret.precompute_shares([1])
+    share = secret.compute_share(1)
+    checktime = timeit(lambda: secret.is_valid_share(share), 10000)
+
+    print "T", THRESHOLD, name.ljust(19), "all shares:", "%.6f" % createtime, \
+        "recover:", "%.6f" % recovertime, "check:", "%.7f" % checktime
@@ -0,0 +1,364 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  A compact, columnar store for PolyPasswordHasher's accounts.   A dict of
+  lists of dicts costs several hundred bytes of Python objects per account on
+  top of the 50 or so bytes of actual data.   This keeps the salts, passhashes
+  and share numbers in contiguous bytearray / array columns (one row per
+  entry, an account's rows together) with a dict from username to its first
+  row.
+
+  It acts like the dict it replaces: store[username] is a list of entries
+  that can be indexed with 'salt', 'sharenumber' and 'passhash' (and
+  assigning to them updates the columns), and store[username] = entries
+  adds or replaces an account.   Replaced and deleted accounts leave dead
+  rows behind until the store is written out and loaded again.
+
+  AccountIndex is a read-only snapshot of the accounts that PolyPasswordHasher
+  publishes for its logins to look up without a lock.   Adding accounts
+  makes a new snapshot that shares all but the newest accounts with the old
+  one, so a snapshot never changes once it has been handed out.
+
+<Usage>
+  import accountstore
+
+  store = accountstore.AccountStore(saltsize = 16, passhashsize = 34)
+  store['alice'] = [{'sharenumber':1, 'salt':salt, 'passhash':passhash}]
+  print store['alice'][0]['passhash']
+
+  index = accountstore.AccountIndex(store, 16, 34)
+  index = index.with_accounts([('bob', [{'sharenumber':0, 'salt':salt,
+      'passhash':passhash}])])
+"""
+
+__license__ = 'MIT'
+__all__ = ['AccountStore', 'AccountEntry', 'AccountIndex']
+
+
+from array import array
+
+
+_ENTRY_KEYS = ['salt', 'sharenumber', 'passhash']
+
+
+
+
+class AccountEntry(object):
+  """ A view of one row of an AccountStore that acts like the entry dicts
+      PolyPasswordHasher uses."""
+
+  __slots__ = ['_store', '_row']
+
+  def __init__(self, store, row):
+    self._store = store
+    self._row = row
+
+
+
+  def __getitem__(self, key):
+    store = self._store
+    row = self._row
+    if key == 'passhash':
+      start = row * store.passhashsize
+      return str(store._passhashes[start:start+store._passhashlengths[row]])
+    if key == 'salt':
+      start = row * store.saltsize
+      return str(store._salts[start:start+store.saltsize])
+    if key == 'sharenumber':
+      return store._sharenumbers[row]
+    raise KeyError(key)
+
+
+
+  def __setitem__(self, key, value):
+    store = self._store
+    row = self._row
+    if key == 'passhash':
+      store._set_passhash(row, value)
+    elif key == 'salt':
+      store._set_salt(row, value)
+    elif key == 'sharenumber':
+      store._sharenumbers[row] = value
+    else:
+      raise KeyError(key)
+
+
+
+  def keys(self):
+    return list(_ENTRY_KEYS)
+
+
+
+  def __eq__(self, other):
+    try:
+      for key in _ENTRY_KEYS:
+        if self[key] != other[key]:
+          return False
+    except (KeyError, TypeError):
+      return False
+    return len(other) == len(_ENTRY_KEYS)
+
+
+
+  def __ne__(self, other):
+    return not self == other
+
+
+
+  def __len__(self):
+    return len(_ENTRY_KEYS)
+
+
+
+  def __repr__(self):
+    return repr(dict((key, self[key]) for key in _ENTRY_KEYS))
+
+
+
+
+class AccountStore(object):
+  """ Keeps accounts in columns.   passhashsize is the largest passhash
+      (the hash plus any isolated check bytes)."""
+
+  def __init__(self, saltsize = 16, passhashsize = 32):
+
+    self.saltsize = saltsize
+    self.passhashsize = passhashsize
+
+    # one row per entry...
+    self._salts = bytearray()
+    self._passhashes = bytearray()
+    self._passhashlengths = array('B')
+    self._sharenumbers = array('h')
+    # ...the number of entries an account has (at its first row)...
+    self._entrycounts = array('H')
+
+    # ...and where each account starts
+    self._index = {}
+
+
+
+  def _set_salt(self, row, salt):
+    if len(salt) != self.saltsize:
+      raise ValueError("Salt must be "+str(self.saltsize)+" bytes")
+    start = row * self.saltsize
+    self._salts[start:start+self.saltsize] = salt
+
+
+
+  def _set_passhash(self, row, passhash):
+    if len(passhash) > self.passhashsize:
+      raise ValueError("Passhash is longer than "+str(self.passhashsize)+" bytes")
+    start = row * self.passhashsize
+    self._passhashes[start:start+len(passhash)] = passhash
+    self._passhashlengths[row] = len(passhash)
+
+
+
+  def __contains__(self, username):
+    return username in self._index
+
+
+
+  def __getitem__(self, username):
+    firstrow = self._index[username]
+    return [AccountEntry(self, row) for row in
+        range(firstrow, firstrow + self._entrycounts[firstrow])]
+
+
+
+  def __setitem__(self, username, entries):
+    # check all of them before changing anything
+    for entry in entries:
+      if len(entry['salt']) != self.saltsize or len(entry['passhash']) > self.passhashsize:
+        raise ValueError("Entry for user '"+username+"' has the wrong size")
+
+    # I copy the values out first in case entries are views of my own rows
+    values = [(entry['sharenumber'], str(entry['salt']), str(entry['passhash']))
+        for entry in entries]
+
+    # always add new rows.   This leaves any old ones dead.
+    firstrow = len(self._sharenumbers)
+    for (sharenumber, salt, passhash) in values:
+      self._sharenumbers.append(sharenumber)
+      self._entrycounts.append(0)
+      self._salts += salt
+      self._passhashes += passhash + '\0' * (self.passhashsize - len(passhash))
+      self._passhashlengths.append(len(passhash))
+
+    if values:
+      self._entrycounts[firstrow] = len(values)
+    else:
+      # an account with no entries still needs a row to hold its count
+      self._sharenumbers.append(0)
+      self._entrycounts.append(0)
+      self._salts += '\0' * self.saltsize
+      self._passhashes += '\0' * self.passhashsize
+      self._passhashlengths.append(0)
+
+    self._index[username] = firstrow
+
+
+
+  def __delitem__(self, username):
+    del self._index[username]
+
+
+
+  def __iter__(self):
+    return iter(self._index)
+
+
+
+  def __len__(self):
+    return len(self._index)
+
+
+
+  def keys(self):
+    return self._index.keys()
+
+
+
+  def extend(self, other):
+    """Adds (or replaces) every account in other, an AccountStore with the
+       same sizes, by appending its rows to mine."""
+
+    if (other.saltsize, other.passhashsize) != (self.saltsize, self.passhashsize):
+      raise ValueError("Can only extend with a store of the same sizes")
+
+    firstrow = len(self._sharenumbers)
+    self._salts += other._salts
+    self._passhashes += other._passhashes
+    self._passhashlengths.extend(other._passhashlengths)
+    self._sharenumbers.extend(other._sharenumbers)
+    self._entrycounts.extend(other._entrycounts)
+    for (username, row) in other._index.iteritems():
+      self._index[username] = firstrow + row
+
+
+
+  def copy(self):
+    """Returns a copy that doesn't share any columns with this one."""
+
+    newcopy = AccountStore(self.saltsize, self.passhashsize)
+    newcopy._salts = bytearray(self._salts)
+    newcopy._passhashes = bytearray(self._passhashes)
+    newcopy._passhashlengths = array('B', self._passhashlengths)
+    newcopy._sharenumbers = array('h', self._sharenumbers)
+    newcopy._entrycounts = array('H', self._entrycounts)
+    newcopy._index = dict(self._index)
+    return newcopy
+
+
+
+
+class AccountIndex(object):
+  """ An immutable snapshot of the accounts.   base is the store the accounts
+      were loaded into (an AccountStore or a MappedAccountDict), which must
+      not be changed once it is wrapped.   Accounts added later are kept in
+      a small dict of the most recent ones and a few AccountStores (with
+      saltsize and passhashsize), newest first, that are never changed once
+      made either.   A lookup checks each of them and then base."""
+
+  # The recent accounts are copied each time one is added, so once there are
+  # this many they are moved into a new store...
+  RECENT_LIMIT = 64
+
+  # ...which is merged with the newest one while that is no more than this
+  # many times its size.   So each store is several times the size of the
+  # one before it, there are only a handful, and an account is copied a
+  # handful of times in all.
+  MERGE_FACTOR = 4
+
+  def __init__(self, base, saltsize, passhashsize):
+    self.base = base
+    self.saltsize = saltsize
+    self.passhashsize = passhashsize
+    self._recent = {}
+    self._levels = ()
+
+
+
+  def with_accounts(self, accounts):
+    """Returns a new index with the (username, entries) in accounts added (or
+       replacing those already here).   This one is left as it was."""
+
+    # the recent ones aren't in a store yet, so I check their sizes here
+    for (username, entries) in accounts:
+      for entry in entries:
+        if len(entry['salt']) != self.saltsize or len(entry['passhash']) > self.passhashsize:
+          raise ValueError("Entry for user '"+username+"' has the wrong size")
+
+    recent = dict(self._recent)
+    recent.update(accounts)
+    levels = self._levels
+
+    if len(recent) >= self.RECENT_LIMIT:
+      newest = AccountStore(self.saltsize, self.passhashsize)
+      for username in recent:
+        newest[username] = recent[username]
+      recent = {}
+
+      levels = list(levels)
+      while levels and len(levels[0]) <= self.MERGE_FACTOR * len(newest):
+        # the newer accounts win, so they go into a copy of the older
+        merged = levels.pop(0).copy()
+        merged.extend(newest)
+        newest = merged
+      levels = tuple([newest] + levels)
+
+    newindex = AccountIndex(self.base, self.saltsize, self.passhashsize)
+    newindex._recent = recent
+    newindex._levels = levels
+    return newindex
+
+
+
+  def __contains__(self, username):
+    if username in self._recent:
+      return True
+    for level in self._levels:
+      if username in level:
+        return True
+    return username in self.base
+
+
+
+  def __getitem__(self, username):
+    entries = self._recent.get(username)
+    if entries is not None:
+      return entries
+    for level in self._levels:
+      if username in level:
+        return level[username]
+    return self.base[username]
+
+
+
+  def __iter__(self):
+    seen = set()
+    for level in (self._recent,) + self._levels + (self.base,):
+      for username in level:
+        if username not in seen:
+          seen.add(username)
+          yield username
+
+
+
+  def __len__(self):
+    return len(self.keys())
+
+
+
+  def keys(self):
+    # (not list(self), which would ask for my length)
+    return [username for username in self]
+
+
+
+  def copy(self):
+    """Nothing changes a snapshot, so it is its own copy."""
+    return self
@@ -0,0 +1,208 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  An asyncio front end for PolyPasswordHasher.   Checking a login inline
+  would block the event loop for the whole hash and share check, so this
+  does the work on an executor and hands back futures to await.
+
+  Logins that arrive while the loop is busy (or within batchdelay seconds)
+  are checked together with one is_valid_login_many call, so under load
+  there are fewer, bigger executor jobs rather than more of them.   No more
+  than maxconcurrency jobs run at once; the rest wait their turn.
+
+  Cancelling a future that hasn't been started yet drops its request.   Once
+  a request is running in the executor it can't be stopped (an account will
+  still be created, say), but the result is thrown away.
+
+  This works with asyncio, or trollius (its Python 2 backport).   It doesn't
+  use the newer coroutine syntax itself, so it can be imported by either.
+
+<Usage>
+  import asyncpph
+
+  asyncpph = asyncpph.AsyncPolyPasswordHasher(pph, maxconcurrency = 4)
+
+  # in a coroutine...
+  if await asyncpph.is_valid_login('alice', 'kitten'):
+    ...
+  await asyncpph.create_account('bob', 'puppy', 0)
+"""
+
+__license__ = 'MIT'
+__all__ = ['AsyncPolyPasswordHasher']
+
+
+try:
+  import asyncio
+except ImportError:
+  import trollius as asyncio
+
+import collections
+
+
+
+
+class AsyncPolyPasswordHasher(object):
+  """ Wraps a PolyPasswordHasher so its methods return futures that are
+      completed on the event loop once the work is done.   Only use this
+      from the loop's thread."""
+
+  def __init__(self, pph, loop = None, executor = None, maxconcurrency = 4,
+      maxbatch = 64, batchdelay = 0):
+    """executor is where the work runs (the loop's default if None).
+       maxbatch is the most logins checked in one call, and batchdelay is
+       how long (in seconds) to wait for more logins to join a batch."""
+
+    if maxconcurrency < 1 or maxbatch < 1:
+      raise ValueError("maxconcurrency and maxbatch must be at least 1")
+
+    self.pph = pph
+    self.maxconcurrency = maxconcurrency
+    self.maxbatch = maxbatch
+    self.batchdelay = batchdelay
+
+    if loop is None:
+      loop = asyncio.get_event_loop()
+    self._loop = loop
+    self._executor = executor
+
+    # (future, username, password) for logins that haven't started...
+    self._pendinglogins = collections.deque()
+    # ...and (future, method, args) for everything else
+    self._pendingcalls = collections.deque()
+
+    self._running = 0
+    self._dispatchscheduled = False
+
+
+
+  def is_valid_login(self, username, password):
+    """Returns a future for pph.is_valid_login(username, password)."""
+
+    future = self._new_future()
+    self._pendinglogins.append((future, username, password))
+    self._schedule_dispatch()
+    return future
+
+
+
+  def is_valid_login_many(self, pairs):
+    """Returns a future for pph.is_valid_login_many(pairs)."""
+    return self._call(self.pph.is_valid_login_many, pairs)
+
+
+
+  def create_account(self, username, password, shares):
+    """Returns a future for pph.create_account(username, password, shares)."""
+    return self._call(self.pph.create_account, username, password, shares)
+
+
+
+  def unlock_password_data(self, logindata):
+    """Returns a future for pph.unlock_password_data(logindata)."""
+    return self._call(self.pph.unlock_password_data, logindata)
+
+
+
+  def pending_count(self):
+    """How many requests are waiting for their turn."""
+    return len(self._pendinglogins) + len(self._pendingcalls)
+
+
+
+  def _call(self, method, *args):
+    future = self._new_future()
+    self._pendingcalls.append((future, method, args))
+    self._schedule_dispatch()
+    return future
+
+
+
+  def _new_future(self):
+    if hasattr(self._loop, 'create_future'):
+      return self._loop.create_future()
+    return asyncio.Future(loop=self._loop)
+
+
+
+  def _schedule_dispatch(self):
+    # Waiting for the loop to come round again lets the logins from
+    # everything that is ready to run now join the same batch.
+    if self._dispatchscheduled:
+      return
+    self._dispatchscheduled = True
+    if self.batchdelay:
+      self._loop.call_later(self.batchdelay, self._dispatch)
+    else:
+      self._loop.call_soon(self._dispatch)
+
+
+
+  def _dispatch(self):
+    """Starts as much waiting work as maxconcurrency allows."""
+
+    self._dispatchscheduled = False
+
+    while self._running < self.maxconcurrency:
+      if self._pendingcalls:
+        (future, method, args) = self._pendingcalls.popleft()
+        if future.cancelled():
+          continue
+        self._start(method, args, self._finish_call, future)
+
+      elif self._pendinglogins:
+        batch = []
+        while self._pendinglogins and len(batch) < self.maxbatch:
+          request = self._pendinglogins.popleft()
+          if not request[0].cancelled():
+            batch.append(request)
+        if not batch:
+          continue
+        pairs = [(username, password) for (future, username, password) in batch]
+        futures = [future for (future, username, password) in batch]
+        self._start(self.pph.check_logins, (pairs,), self._finish_logins,
+            futures)
+
+      else:
+        return
+
+
+
+  def _start(self, function, args, finish, futures):
+    self._running += 1
+    executorfuture = self._loop.run_in_executor(self._executor, function, *args)
+
+    def done(executorfuture):
+      self._running -= 1
+      finish(executorfuture, futures)
+      self._dispatch()
+
+    executorfuture.add_done_callback(done)
+
+
+
+  def _finish_call(self, executorfuture, future):
+    if future.cancelled():
+      return
+    if executorfuture.exception() is not None:
+      future.set_exception(executorfuture.exception())
+    else:
+      future.set_result(executorfuture.result())
+
+
+
+  def _finish_logins(self, executorfuture, futures):
+    if executorfuture.exception() is not None:
+      results = [(None, executorfuture.exception())] * len(futures)
+    else:
+      results = executorfuture.result()
+
+    for (future, (result, error)) in zip(futures, results):
+      if future.cancelled():
+        continue
+      if error is not None:
+        future.set_exception(error)
+      else:
+        future.set_result(result)
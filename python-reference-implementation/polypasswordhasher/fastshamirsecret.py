@@ -15,7 +15,9 @@ Purpose:
 
   1) built expressly to have the APIs I need
   
-  2) definitely not performance tuned. (It's geared for readability.)
+  2) performance tuned.   The GF256 math is done by fastpolymath_c (with
+     SIMD where the CPU has it), which works on any buffer in place and can
+     write into a caller-supplied one, so little is copied.
 
   This is just a proof-of-concept!!!
   
@@ -64,19 +66,90 @@ __all__ = ['ShamirSecret']
 # Use the C-based GF256 optimization code.
 import fastpolymath_c
 
-def full_lagrange(xs, fxs):
-  newxs = bytearray('')
-  for item in xs:
-    newxs.append(item)
+# Reed-Solomon decoding for recover_secretdata_robust only touches a byte or
+# two, so I share the pure Python version.
+from shamirsecret import _locate_bad_shares
+
+# fastpolymath_c takes any buffer (str, bytearray, memoryview, array...) as
+# is, so these only copy what isn't one already (like a list of xs).   Those
+# that build a result can put it in a writable buffer, out, instead of a new
+# string.
+from array import array
+
+def _as_buffer(values):
+  if isinstance(values, (str, bytearray, memoryview, buffer, array)):
+    return values
+  return bytearray(values)
+
+def _join(sharedatalist):
+  # one copy of the share data, back to back
+  return bytearray().join(sharedatalist)
+
+def _call(function, out, *args):
+  if out is None:
+    return function(*args)
+  function(*(args + (out,)))
+  return out
+
+def full_lagrange(xs, fxs, out = None):
+  return _call(fastpolymath_c.full_lagrange, out, _as_buffer(xs),
+      _as_buffer(fxs))
+
+def full_lagrange_many(xs, sharedatalist):
+  # one row of coefficients comes back per byte of the shares
+  if not sharedatalist:
+    return []
+
+  sharelength = len(sharedatalist[0])
+  if sharelength == 0:
+    return []
+
+  allcoefficients = fastpolymath_c.full_lagrange_many(_as_buffer(xs),
+      _join(sharedatalist))
+
+  rowlength = len(xs)
+  return [allcoefficients[pos*rowlength:(pos+1)*rowlength] for pos in
+      range(sharelength)]
+
+def lagrange_at(xs, sharedatalist, points):
+  # one share's worth of data comes back per point
+  sharelength = len(sharedatalist[0])
+
+  allresults = bytearray(len(points) * sharelength)
+  fastpolymath_c.lagrange_at(_as_buffer(xs), _join(sharedatalist),
+      _as_buffer(points), allresults)
+
+  return [allresults[pos*sharelength:(pos+1)*sharelength] for pos in
+      range(len(points))]
+
+def newton_add(xs, columns, x, sharedata, out = None):
+  # columns can be a list of them or all of them in one buffer
+  if isinstance(columns, list):
+    columns = _join(columns)
+  if out is None:
+    out = bytearray(len(sharedata))
+  return _call(fastpolymath_c.newton_add, out, _as_buffer(xs), columns, x,
+      sharedata)
+
+def newton_coefficients(xs, columns):
+  # one row of coefficients comes back per byte of the shares
+  if isinstance(columns, list):
+    columns = _join(columns)
+  allcoefficients = fastpolymath_c.newton_coefficients(_as_buffer(xs), columns)
+
+  rowlength = len(xs)
+  return [allcoefficients[pos*rowlength:(pos+1)*rowlength] for pos in
+      range(len(columns) / rowlength)]
 
-  newfxs = bytearray('')
-  for item in fxs:
-    newfxs.append(item)
+def f(x, coefficients):
+  return fastpolymath_c.f(x, coefficients)
 
-  return fastpolymath_c.full_lagrange(str(newxs), str(newfxs))
+# XORs the buffers a and b into the writable buffer out, a word at a time
+xor_into = fastpolymath_c.xor_into
 
-def f(x, coefficients):
-  return fastpolymath_c.f(chr(x), str(coefficients))
+def compute_shares(xs, coefficientmatrix, rowlength, out = None):
+  return _call(fastpolymath_c.compute_shares, out, _as_buffer(xs),
+      coefficientmatrix, rowlength)
 
 
 
@@ -94,6 +167,23 @@ class ShamirSecret(object):
 
     self._coefficients = None
 
+    # The share for a given x never changes once the coefficients are known,
+    # so I keep the ones I've computed here (keyed by x).   This must be
+    # cleared whenever the coefficients change!
+    self._sharecache = {}
+
+    # Shares added one at a time with add_share are interpolated in Newton
+    # form.   These are their xs, the share data for each x (to spot
+    # duplicates), and the Newton coefficients (a column per x, back to back
+    # in a buffer with room for threshold of them).
+    self._newtonxs = bytearray()
+    self._newtonsharedata = {}
+    self._newtoncolumns = None
+
+    # All of the coefficients back to back in one string, which is the form
+    # fastpolymath_c wants them in.   Built when first needed.
+    self._coefficientmatrix = None
+
     # if we're given data, let's compute the random coefficients.   I do this
     # here so I can later iteratively compute the shares
     if secretdata is not None:
@@ -123,21 +213,47 @@ class ShamirSecret(object):
       raise ValueError("Share is of incorrect length: "+str(share))
 
     
+    return self.is_valid_sharedata(share[0], share[1])
+
+
+
+  def is_valid_sharedata(self, x, fx):
+    """ Like is_valid_share, but takes the share number and data separately.
+        fx can be any buffer (such as a memoryview), so the caller needn't
+        copy it or build a share tuple."""
+
     if self._coefficients is None:
       raise ValueError("Must initialize coefficients before checking is_valid_share")
-      
-    if len(self._coefficients) != len(share[1]):
+
+    if len(self._coefficients) != len(fx):
       raise ValueError("Must initialize coefficients before checking is_valid_share")
-    
-    x, fx = share
 
-    # let's just compute the right value
-    correctshare = self.compute_share(x)
-    
-    if correctshare == share:
-      return True
-    else:
-      return False
+    # let's just look up the right value (compute_share checks x for me and
+    # fills the cache)
+    if x not in self._sharecache:
+      self.compute_share(x)
+
+    return self._sharecache[x] == fx
+
+
+
+
+  def is_valid_hashed_share(self, x, saltedpassword, storedhash):
+    """ Checks a threshold login: True if sha256(saltedpassword) XOR
+        storedhash is share x.   Both are buffers.   (In the C version, all
+        of this runs without the GIL, so many threads can do it at once.)"""
+
+    if self._coefficients is None:
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if len(self._coefficients) != len(storedhash):
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if x not in self._sharecache:
+      self.compute_share(x)
+
+    return fastpolymath_c.sha256_xor_equals(saltedpassword, storedhash,
+        self._sharecache[x])
     
 
 
@@ -159,14 +275,87 @@ class ShamirSecret(object):
     if self._coefficients is None:
       raise ValueError("Must initialize coefficients before computing a share")
       
-    sharebytes = bytearray()
-    # go through the coefficients and compute f(x) for each value.   
-    # Append that byte to the share
-    for thiscoefficient in self._coefficients:
-      thisshare = f(x,thiscoefficient)
-      sharebytes.append(thisshare)
-    
-    return (x,sharebytes)
+    # hand back a copy so that the caller can't change my cached share
+    return (x, bytearray(self._get_sharedata(x)))
+
+
+
+
+  def compute_shares(self, xs):
+    """ This computes the shares for a list of xs with one call into
+        fastpolymath_c.   It returns a list of (x, bytearray) tuples in the
+        same order as xs, just like calling compute_share on each."""
+
+    for x in xs:
+      if type(x) is not int:
+        raise TypeError("In compute_shares, x is of incorrect type: "+str(type(x)))
+
+      if x<=0 or x>=256:
+        raise ValueError("In compute_shares, x must be between 1 and 255, not: "+
+                str(x))
+
+    # nothing to do (the pure Python version also allows this before the
+    # coefficients are known)
+    if not xs:
+      return []
+
+    if self._coefficients is None:
+      raise ValueError("Must initialize coefficients before computing a share")
+
+    self._fill_sharecache(xs)
+
+    # hand back copies so that the caller can't change my cached shares
+    return [(x, bytearray(self._sharecache[x])) for x in xs]
+
+
+
+
+  def precompute_shares(self, xs):
+    """ Fill the share cache for every x in xs, so that later share checks
+        for these xs are just a comparison."""
+
+    self.compute_shares(list(xs))
+
+
+
+
+  def _get_sharedata(self, x):
+    """ Returns the (cached) share bytes for x.   The caller must not
+        modify them!   Assumes x has already been checked."""
+
+    if x not in self._sharecache:
+      self._fill_sharecache([x])
+
+    return self._sharecache[x]
+
+
+
+
+  def _fill_sharecache(self, xs):
+    """ Computes every share in xs that isn't cached yet in one bulk call.
+        Assumes the xs have already been checked."""
+
+    missingxs = []
+    for x in xs:
+      if x not in self._sharecache and x not in missingxs:
+        missingxs.append(x)
+
+    if not missingxs:
+      return
+
+    if self._coefficientmatrix is None:
+      self._coefficientmatrix = ''.join([str(thiscoefficient) for
+          thiscoefficient in self._coefficients])
+
+    rowlength = len(self._coefficients[0])
+    sharelength = len(self._coefficients)
+
+    # the shares come back one after another...
+    allshares = compute_shares(missingxs, self._coefficientmatrix, rowlength,
+        bytearray(len(missingxs) * sharelength))
+
+    for pos in range(len(missingxs)):
+      self._sharecache[missingxs[pos]] = allshares[pos*sharelength:(pos+1)*sharelength]
 
 
 
@@ -177,71 +366,205 @@ class ShamirSecret(object):
         shares.   Note, if any provided share does not decode, an error is 
         raised."""
 
-    # discard duplicate shares
-    newshares = []
-    for share in shares:
-      if share not in newshares:
-        newshares.append(share)
-    shares = newshares
+    if self.secretdata is not None:
+      raise ValueError("Recovering secretdata when some is stored. Use check_share instead.")
+
+    # This checks that any surplus shares agree before I do the (much more
+    # expensive) work of building the coefficients.
+    mysecretdata = self.recover_secret_at_zero(shares)
+
+    # The first threshold (unique) shares fully determine the polynomials and
+    # the others have been checked against them, so only use those.
+    shares = _unique_shares(shares)[:self.threshold]
+    xs = [share[0] for share in shares]
+
+    mycoefficients = []
+
+    # do lagrange interpolation for every byte of the secret at once.   The
+    # basis polynomials only depend on the xs, so this builds them once
+    # instead of once per byte.
+    resulting_polys = full_lagrange_many(xs, [share[1] for share in shares])
 
+    for resulting_poly in resulting_polys:
+      # track this byte...
+      mycoefficients.append(bytearray(resulting_poly))
+
+    # this can't happen unless the math is broken...
+    assert(''.join([poly[0] for poly in resulting_polys]) == mysecretdata)
+
+    # they check out!   Assign to the real ones!
+    self._coefficients = mycoefficients
+    self._sharecache = {}
+    self._coefficientmatrix = None
+
+    self.secretdata = mysecretdata
+
+
+
+
+  def add_share(self, share):
+    """ This adds one share to an incremental interpolation of the secret
+        data.   Each share costs work proportional to the number of shares
+        so far, rather than a whole new interpolation.   Once threshold
+        unique shares have been added, the coefficients and secret data are
+        filled in (just as recover_secretdata would do).   Duplicate shares
+        are ignored.   Returns True once the secret data is known."""
+
+    if self.secretdata is not None:
+      raise ValueError("Adding shares when secretdata is stored.   Use is_valid_share instead.")
+
+    x, fx = share
+
+    if type(x) is not int:
+      raise TypeError("In add_share, x is of incorrect type: "+str(type(x)))
+
+    if x<=0 or x>=256:
+      raise ValueError("In add_share, x must be between 1 and 255, not: "+str(x))
+
+    if x in self._newtonsharedata:
+      # a share I already have...
+      if self._newtonsharedata[x] == str(fx):
+        return False
+      raise ValueError("Different shares with the same first byte! '"+str(x)+"'")
+
+    sharelength = len(fx)
+    if self._newtoncolumns is None:
+      self._newtoncolumns = bytearray(self.threshold * sharelength)
+    elif len(self._newtoncolumns) != self.threshold * sharelength:
+      raise ValueError("Shares have different lengths!")
+
+    # the new column goes right after the others
+    columns = memoryview(self._newtoncolumns)
+    used = len(self._newtonxs) * sharelength
+    newton_add(self._newtonxs, columns[:used], x, fx,
+        columns[used:used+sharelength])
+    self._newtonxs.append(x)
+    self._newtonsharedata[x] = str(fx)
+
+    if len(self._newtonxs) < self.threshold:
+      return False
+
+    # I have threshold shares, which determine the polynomials.
+    resulting_polys = newton_coefficients(self._newtonxs, self._newtoncolumns)
+
+    mycoefficients = []
+    for resulting_poly in resulting_polys:
+      mycoefficients.append(bytearray(resulting_poly))
+
+    self._coefficients = mycoefficients
+    self._sharecache = {}
+    self._coefficientmatrix = None
+
+    self.secretdata = ''.join([poly[0] for poly in resulting_polys])
+
+    self._newtonxs = bytearray()
+    self._newtonsharedata = {}
+    self._newtoncolumns = None
+
+    return True
+
+
+
+
+  def incremental_share_count(self):
+    """ Returns the number of unique shares added with add_share that are
+        waiting for the threshold to be reached."""
+
+    return len(self._newtonxs)
+
+
+
+
+  def recover_secretdata_robust(self, shares):
+    """ This is like recover_secretdata, except that it tolerates wrong
+        shares as long as there are enough surplus ones.   With n unique
+        shares, up to (n-threshold)/2 wrong ones are found (by Reed-Solomon
+        decoding, not by trying subsets) and left out.   Returns the xs of
+        the wrong shares.   Raises a ValueError if there are too many."""
+
+    if self.secretdata is not None:
+      raise ValueError("Recovering secretdata when some is stored. Use check_share instead.")
+
+    shares = _unique_shares(shares)
 
     if self.threshold > len(shares):
       raise ValueError("Threshold:"+str(self.threshold)+
         " is smaller than the number of unique shares:"+str(len(shares))+".")
 
-    if self.secretdata is not None:
-      raise ValueError("Recovering secretdata when some is stored. Use check_share instead.")
+    badpositions = _locate_bad_shares(self, shares)
 
-    # the first byte of each share is the 'x'.
-    xs = []
-    for share in shares:
-      # the first byte should be unique...
-      if share[0] in xs:
-        raise ValueError("Different shares with the same first byte! '"+
-                str(share[0])+"'")
+    self.recover_secretdata([shares[pos] for pos in range(len(shares)) if pos
+        not in badpositions])
 
-      # ...and all should be the same length
-      if len(share[1])!=len(shares[0][1]):
-        raise ValueError("Shares have different lengths!")
+    return [shares[pos][0] for pos in badpositions]
 
-      xs.append(share[0])
-      
 
-    mycoefficients = []
-    mysecretdata = ''
 
-    # now walk through each byte of the secret and do lagrange interpolation
-    # to compute the coefficient...
-    for byte_to_use in range(0,len(shares[0][1])):
 
-      # we need to get the f(x)s from the appropriate bytes
-      fxs = []
-      for share in shares:
-        fxs.append(share[1][byte_to_use])
+  def recover_secret_at_zero(self, shares):
+    """ This recovers just the secret data (f(0) for each byte) given at least
+        threshold shares, without building the coefficients.   Only the first
+        threshold unique shares are interpolated.   Any others are checked by
+        evaluating at their x and a ValueError is raised if they don't match.
+        Nothing is stored in this object."""
 
-      # build this polynomial
-      resulting_poly = full_lagrange(xs,fxs)
+    shares = _unique_shares(shares)
 
+    if self.threshold > len(shares):
+      raise ValueError("Threshold:"+str(self.threshold)+
+        " is smaller than the number of unique shares:"+str(len(shares))+".")
 
-      # If I have more shares than the threshold, the higher order coefficients
-      # (those greater than threshold) must be zero (by Lagrange)...
-      if resulting_poly[:self.threshold] + '\0'*(len(shares)-self.threshold) != resulting_poly:
-        raise ValueError("Shares do not match.   Cannot decode")
-      
-      # track this byte...
-      mycoefficients.append(bytearray(resulting_poly))
-      
-      mysecretdata += resulting_poly[0]
+    basisshares = shares[:self.threshold]
+    surplusshares = shares[self.threshold:]
 
+    xs = [share[0] for share in basisshares]
+    sharedatalist = [share[1] for share in basisshares]
 
+    # evaluate at 0 (the secret) and at each surplus x all in one call...
+    results = lagrange_at(xs, sharedatalist,
+        [0] + [share[0] for share in surplusshares])
 
-    # they check out!   Assign to the real ones!
-    self._coefficients = mycoefficients
+    # If I have more shares than the threshold, the extra ones must be on the
+    # same polynomials (by Lagrange)...
+    for pos in range(len(surplusshares)):
+      if results[pos+1] != surplusshares[pos][1]:
+        raise ValueError("Shares do not match.   Cannot decode")
 
-    self.secretdata = mysecretdata
+    return str(results[0])
   
 
 
 
 
 ####################### END OF MAIN CLASS #######################
+
+
+
+def _unique_shares(shares):
+  """ Discards duplicate shares (keeping the first of each, in order) and
+      checks that the rest have unique xs and the same length."""
+
+  newshares = []
+  seenshares = set()
+  # one flag per possible x
+  seenxs = bytearray(256)
+
+  for share in shares:
+    sharekey = (share[0], str(share[1]))
+    if sharekey in seenshares:
+      continue
+    seenshares.add(sharekey)
+
+    # the first byte should be unique...
+    if seenxs[share[0]]:
+      raise ValueError("Different shares with the same first byte! '"+
+              str(share[0])+"'")
+    seenxs[share[0]] = 1
+
+    # ...and all should be the same length
+    if len(share[1])!=len(shares[0][1]):
+      raise ValueError("Shares have different lengths!")
+
+    newshares.append(share)
+
+  return newshares
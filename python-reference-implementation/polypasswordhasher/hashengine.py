@@ -0,0 +1,284 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  The password hash functions PolyPasswordHasher can use.   Every engine
+  turns a salt and a password into a 32 byte hash, which is what is XORed
+  with a share or encrypted with the shielded key, so the choice of engine
+  doesn't change anything else.   The engine's name and cost parameters are
+  kept in the password file.
+
+    sha256          sha256(salt + password).   This is the original behavior
+                    and has no cost parameter.
+    pbkdf2-sha256   PBKDF2-HMAC-SHA256 with cost iterations.
+    scrypt          scrypt with N = 2**cost, r and p.   Needs the scrypt
+                    package.
+    blake2b         keyed BLAKE2b (the salt is the key), iterated cost times.
+                    Needs the pyblake2 package.
+
+  scrypt and pyblake2 are optional dependencies (see requirements.txt).
+  Without them, getting those engines (or loading a password file that uses
+  one) raises an ImportError that says what to install.
+
+  Every engine also has hash_many(), which hashes a list of salts and
+  passwords.   For sha256 this is done by the C extension in one call.
+
+  calibrate() picks the cost for an engine so that a hash takes about a
+  target time on this machine.
+
+<Usage>
+  import hashengine
+
+  engine = hashengine.calibrate('pbkdf2-sha256', 0.05)
+  pph = polypasswordhasher.PolyPasswordHasher(threshold = 10,
+      hashengine = engine)
+
+  print engine.name, engine.parameters()
+"""
+
+__license__ = 'MIT'
+__all__ = ['SHA256Engine', 'PBKDF2Engine', 'ScryptEngine', 'Blake2Engine',
+    'get_engine', 'calibrate', 'ENGINES']
+
+
+import hashlib
+import time
+
+# scrypt and BLAKE2 come from optional packages, if they are installed.
+try:
+  import scrypt as _scryptmodule
+except ImportError:
+  _scrypt = None
+else:
+  def _scrypt(password, salt, n, r, p, dklen):
+    return _scryptmodule.hash(password, salt, n, r, p, dklen)
+
+try:
+  from pyblake2 import blake2b as _blake2b
+except ImportError:
+  _blake2b = None
+
+
+# The C extension can hash a whole batch of salted passwords with sha256 at
+# once (and without the GIL).
+try:
+  from fastpolymath_c import sha256_many as _sha256_many
+except ImportError:
+  _sha256_many = None
+
+
+# the size of the hashes every engine produces
+HASH_SIZE = 32
+
+
+
+
+class SHA256Engine(object):
+  """ sha256(salt + password), with no cost parameter."""
+
+  name = 'sha256'
+
+  def __init__(self):
+    pass
+
+  def hash(self, salt, password):
+    return hashlib.sha256(salt + password).digest()
+
+  def hash_many(self, salts, passwords):
+    if _sha256_many is not None:
+      # The C extension only takes strings.   For anything else hash()
+      # takes (like a bytearray), I do them one at a time instead.
+      try:
+        digests = _sha256_many(salts, passwords)
+      except TypeError:
+        pass
+      else:
+        return [digests[pos:pos+HASH_SIZE] for pos in
+            range(0, len(digests), HASH_SIZE)]
+    return [self.hash(salt, password) for (salt, password) in
+        zip(salts, passwords)]
+
+  def parameters(self):
+    return ()
+
+  def with_cost(self, cost):
+    return self
+
+
+
+
+class PBKDF2Engine(object):
+  """ PBKDF2-HMAC-SHA256 with a number of iterations."""
+
+  name = 'pbkdf2-sha256'
+
+  def __init__(self, iterations = 100000):
+    if iterations < 1:
+      raise ValueError("Need at least one iteration")
+    self.iterations = iterations
+
+  def hash(self, salt, password):
+    return hashlib.pbkdf2_hmac('sha256', password, salt, self.iterations,
+        HASH_SIZE)
+
+  def hash_many(self, salts, passwords):
+    return [self.hash(salt, password) for (salt, password) in zip(salts, passwords)]
+
+  def parameters(self):
+    return (self.iterations,)
+
+  def with_cost(self, cost):
+    return PBKDF2Engine(cost)
+
+
+
+
+class ScryptEngine(object):
+  """ scrypt with N = 2**logn."""
+
+  name = 'scrypt'
+
+  def __init__(self, logn = 14, r = 8, p = 1):
+    if _scrypt is None:
+      raise ImportError("The scrypt hash engine needs the scrypt package "
+          "(pip install scrypt)")
+    if logn < 1 or logn > 31 or r < 1 or p < 1:
+      raise ValueError("Invalid scrypt parameters")
+    self.logn = logn
+    self.r = r
+    self.p = p
+
+  def hash(self, salt, password):
+    return _scrypt(password, salt = salt, n = 2 ** self.logn, r = self.r,
+        p = self.p, dklen = HASH_SIZE)
+
+  def hash_many(self, salts, passwords):
+    return [self.hash(salt, password) for (salt, password) in zip(salts, passwords)]
+
+  def parameters(self):
+    return (self.logn, self.r, self.p)
+
+  def with_cost(self, cost):
+    return ScryptEngine(cost, self.r, self.p)
+
+
+
+
+class Blake2Engine(object):
+  """ BLAKE2b keyed with the salt, iterated over its own output."""
+
+  name = 'blake2b'
+
+  def __init__(self, rounds = 1):
+    if _blake2b is None:
+      raise ImportError("The blake2b hash engine needs the pyblake2 "
+          "package (pip install pyblake2)")
+    if rounds < 1:
+      raise ValueError("Need at least one round")
+    self.rounds = rounds
+
+  def hash(self, salt, password):
+    digest = _blake2b(password, digest_size = HASH_SIZE, key = salt).digest()
+    for roundnumber in range(1, self.rounds):
+      digest = _blake2b(digest, digest_size = HASH_SIZE, key = salt).digest()
+    return digest
+
+  def hash_many(self, salts, passwords):
+    return [self.hash(salt, password) for (salt, password) in zip(salts, passwords)]
+
+  def parameters(self):
+    return (self.rounds,)
+
+  def with_cost(self, cost):
+    return Blake2Engine(cost)
+
+
+
+
+ENGINES = {
+  SHA256Engine.name: SHA256Engine,
+  PBKDF2Engine.name: PBKDF2Engine,
+  ScryptEngine.name: ScryptEngine,
+  Blake2Engine.name: Blake2Engine,
+}
+
+# where calibration starts for each engine
+_MINIMUM_COST = {
+  PBKDF2Engine.name: 1000,
+  ScryptEngine.name: 10,
+  Blake2Engine.name: 1,
+}
+
+
+
+
+def get_engine(name, parameters = ()):
+  """Returns the engine with this name and parameters (as stored in a
+     password file).   Raises an ImportError if the engine needs a package
+     that isn't installed."""
+
+  if name not in ENGINES:
+    raise ValueError("Unknown hash engine '"+name+"'")
+
+  return ENGINES[name](*parameters)
+
+
+
+
+def calibrate(name, targetseconds, maximumcost = None):
+  """Returns the engine called name with the largest cost whose hash takes
+     no more than about targetseconds on this machine.   (So a login's
+     verify time is about this, plus a few microseconds for the rest.)"""
+
+  engine = get_engine(name)
+  if name not in _MINIMUM_COST:
+    # nothing to tune
+    return engine
+
+  cost = _MINIMUM_COST[name]
+  engine = engine.with_cost(cost)
+
+  # double the cost until a hash is too slow...
+  while True:
+    elapsed = _time_hash(engine)
+    if elapsed >= targetseconds or (maximumcost and cost >= maximumcost):
+      break
+    if name == ScryptEngine.name:
+      # the cost is log2(N), so this doubles the work
+      nextcost = cost + 1
+    elif elapsed > 0:
+      # jump most of the way there rather than doubling each time
+      nextcost = max(cost * 2, int(cost * targetseconds / elapsed * 0.5))
+    else:
+      nextcost = cost * 2
+    if maximumcost:
+      nextcost = min(nextcost, maximumcost)
+    cost = nextcost
+    engine = engine.with_cost(cost)
+
+  if elapsed <= targetseconds or cost == _MINIMUM_COST[name]:
+    return engine
+
+  # ...then come back down.   The time is linear in the cost for the other
+  # engines, and scrypt just takes one step back.
+  if name == ScryptEngine.name:
+    return engine.with_cost(cost - 1)
+
+  return engine.with_cost(max(_MINIMUM_COST[name],
+      int(cost * targetseconds / elapsed)))
+
+
+
+
+def _time_hash(engine, tries = 3):
+  """The fastest of a few hashes with engine, in seconds."""
+
+  best = None
+  for trynumber in range(tries):
+    starttime = time.time()
+    engine.hash('s' * 16, 'calibration password')
+    elapsed = time.time() - starttime
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
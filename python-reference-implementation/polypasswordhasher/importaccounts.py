@@ -0,0 +1,120 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  Creates a new password file from an existing user base.   Each line of
+  the input is a username, the number of shares for the account (0 for a
+  shielded account) and the password, separated by tabs:
+
+    alice	1	kitten
+    dennis	0	menace
+
+  The passwords are hashed by a pool of worker processes (see
+  PolyPasswordHasher.create_accounts), and the accounts get their share
+  numbers in the order they are listed.   The accounts need more than
+  threshold shares between them, or the password file can't be written.
+
+<Usage>
+  python importaccounts.py [options] threshold recordfile passwordfile
+
+  recordfile can be - to read the records from stdin.
+"""
+
+__license__ = 'MIT'
+__all__ = ['read_records', 'import_accounts']
+
+
+import polypasswordhasher
+import hashengine
+
+import optparse
+import os
+import sys
+import time
+
+
+
+
+def read_records(recordfile):
+  """Yields (username, password, shares) for each line of recordfile."""
+
+  for (linenumber, line) in enumerate(recordfile):
+    line = line.rstrip('\r\n')
+    if not line:
+      continue
+    fields = line.split('\t', 2)
+    if len(fields) != 3:
+      raise ValueError("Line "+str(linenumber+1)+
+          " is not username, shares and password separated by tabs")
+    try:
+      shares = int(fields[1])
+    except ValueError:
+      raise ValueError("Line "+str(linenumber+1)+" has a bad share count")
+    yield (fields[0], fields[2], shares)
+
+
+
+
+def import_accounts(threshold, recordfile, passwordfile, processes = None,
+    isolated_check_bits = 0, engine = None, chunksize = 1000,
+    progress = None):
+  """Creates passwordfile with an account for each record in recordfile (a
+     file object).   Returns the number of accounts."""
+
+  if os.path.exists(passwordfile):
+    raise ValueError("'"+passwordfile+"' exists already")
+
+  pph = polypasswordhasher.PolyPasswordHasher(threshold,
+      isolated_check_bits = isolated_check_bits, hashengine = engine)
+
+  count = pph.create_accounts(read_records(recordfile), processes,
+      chunksize, progress)
+
+  pph.write_password_data(passwordfile)
+  return count
+
+
+
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(
+      usage = "python importaccounts.py [options] threshold recordfile passwordfile")
+  parser.add_option('-p', '--processes', type = 'int', default = None,
+      help = "number of hashing processes (default: one per CPU)")
+  parser.add_option('-i', '--isolated-check-bits', type = 'int', default = 0,
+      help = "isolated check bytes per account")
+  parser.add_option('-e', '--hash-engine', default = 'sha256',
+      help = "password hash engine (one of: "+
+      ', '.join(sorted(hashengine.ENGINES))+")")
+  parser.add_option('-t', '--target-time', type = 'float', default = None,
+      help = "calibrate the hash engine to take this many seconds")
+  (options, args) = parser.parse_args()
+
+  if len(args) != 3:
+    parser.print_usage()
+    sys.exit(1)
+
+  if options.target_time is None:
+    engine = hashengine.get_engine(options.hash_engine)
+  else:
+    engine = hashengine.calibrate(options.hash_engine, options.target_time)
+
+  starttime = time.time()
+  def progress(count):
+    elapsed = time.time() - starttime
+    sys.stderr.write("\r%d accounts (%.0f per second)" %
+        (count, count / max(elapsed, 0.001)))
+    sys.stderr.flush()
+
+  if args[1] == '-':
+    recordfile = sys.stdin
+  else:
+    recordfile = open(args[1])
+
+  count = import_accounts(int(args[0]), recordfile, args[2],
+      options.processes, options.isolated_check_bits, engine,
+      progress = progress)
+
+  sys.stderr.write("\n")
+  print "Imported", count, "accounts into", args[2]
@@ -0,0 +1,551 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  A version of shamirsecret.py that does the GF(256) math with NumPy, for
+  when the fastpolymath_c extension can't be built.   It has the same
+  ShamirSecret class (and xor_into) as the other two, and gives the same
+  results.
+
+  Rather than one polynomial per byte of the secret, the coefficients are
+  kept as a single (secret length x threshold) matrix of uint8s.   GF(256)
+  multiplication is a lookup in a precomputed 256x256 table, so each step
+  works on whole rows or matrices at a time with fancy indexing:
+
+    - shares are computed by Horner's rule over every byte (and every x)
+      at once, one column of coefficients per step.
+    - Lagrange interpolation is a matrix product: the share data times the
+      matrix of basis polynomials (which only depend on the xs).
+    - shares added one at a time build up a Newton form interpolation, a
+      row of coefficients per share, over every byte at once.
+
+<Usage>
+  import numpyshamirsecret as shamirsecret
+
+  # just like shamirsecret.py...
+  mysecret = shamirsecret.ShamirSecret(2, 'my shared secret')
+  a = mysecret.compute_share(4)
+  b = mysecret.compute_share(6)
+
+  newsecret = shamirsecret.ShamirSecret(2)
+  newsecret.recover_secretdata([a,b])
+"""
+
+__license__ = 'MIT'
+__all__ = ['ShamirSecret']
+
+
+import numpy
+
+import hashlib
+import os
+
+# The shares are checked and Reed-Solomon decoded the same way as in the pure
+# Python version (decoding only touches a byte or two), and xor_into doesn't
+# need NumPy.
+from shamirsecret import _GF256_EXP, _GF256_LOG, _locate_bad_shares, \
+    _unique_shares, xor_into
+
+
+
+
+##### GF256 tables #####
+
+# the logs of every byte (entry 0 is undefined and is 0 here)...
+_LOG = numpy.array(_GF256_LOG, dtype=numpy.intp)
+# ...and the exponents, twice over, so that the sum of two logs needs no
+# modulo.
+_EXP = numpy.array(_GF256_EXP[:255] * 2, dtype=numpy.uint8)
+
+# _MUL[a, b] is a times b.   _MULFLAT is the same table as one row, so that
+# a times b is _MULFLAT[a*256 + b], which is quicker to index.
+_MUL = _EXP[_LOG[:, None] + _LOG[None, :]]
+_MUL[0, :] = 0
+_MUL[:, 0] = 0
+_MULFLAT = _MUL.ravel()
+
+
+
+
+def _mul(a, b):
+  """Multiplies a and b elementwise (any shapes that broadcast)."""
+  return _MULFLAT.take(numpy.left_shift(a, 8, dtype=numpy.intp) + b)
+
+
+
+def _as_array(values):
+  """xs and the like (str, bytearray, list of ints, ...) as a uint8 array."""
+  if isinstance(values, (str, bytearray)):
+    return numpy.frombuffer(values, dtype=numpy.uint8)
+  return numpy.array(values, dtype=numpy.uint8)
+
+
+
+def _share_matrix(sharedatalist):
+  """The share data (buffers of the same length) as the rows of a matrix."""
+  return numpy.frombuffer(bytearray().join(sharedatalist),
+      dtype=numpy.uint8).reshape(len(sharedatalist), -1)
+
+
+
+def _horner(coefficientmatrix, xs):
+  """ Evaluates every row of coefficientmatrix (lowest power first) at each
+      of xs.   Returns a (len(xs) x rows) matrix: the share for each x."""
+
+  # a * x for every a is the x row of the multiplication table
+  xoffsets = numpy.left_shift(xs, 8, dtype=numpy.intp)[:, None]
+
+  results = numpy.zeros((len(xs), coefficientmatrix.shape[0]),
+      dtype=numpy.uint8)
+  for column in coefficientmatrix.T[::-1]:
+    results = _MULFLAT.take(xoffsets + results)
+    results ^= column
+
+  return results
+
+
+
+def _gf256_matmul(a, b):
+  """The matrix product of a and b over GF(256)."""
+
+  result = numpy.zeros((a.shape[0], b.shape[1]), dtype=numpy.uint8)
+  for pos in range(a.shape[1]):
+    result ^= _mul(a[:, pos:pos+1], b[pos])
+  return result
+
+
+
+def _denominator_logs(xs):
+  """The log of prod(x_i - x_j) over j != i, for each x_i in xs."""
+
+  differences = xs[:, None] ^ xs[None, :]
+  # (the diagonal is 0, whose log is 0 here, so it doesn't count)
+  return _LOG[differences].sum(axis=1) % 255
+
+
+
+def _lagrange_basis(xs):
+  """ Returns a matrix whose ith row is the coefficients (lowest power
+      first) of the Lagrange basis polynomial that is 1 at xs[i] and 0 at
+      the other xs."""
+
+  length = len(xs)
+
+  # the master polynomial, prod(x - x_j) over all of the xs...
+  master = numpy.zeros(length + 1, dtype=numpy.uint8)
+  master[0] = 1
+  for x in xs:
+    shifted = master[:-1].copy()
+    master = _mul(master, x)
+    master[1:] ^= shifted
+
+  # ...divided by (x - x_i) for every x_i at once, by synthetic division.
+  quotients = numpy.empty((length, length), dtype=numpy.uint8)
+  quotients[:, length-1] = master[length]
+  for power in range(length-1, 0, -1):
+    quotients[:, power-1] = master[power] ^ _mul(xs, quotients[:, power])
+
+  # and scaled so that each is 1 at its own x
+  inversedenominators = _EXP[(255 - _denominator_logs(xs)) % 255]
+  return _mul(quotients, inversedenominators[:, None])
+
+
+
+def _lagrange_weights(xs, points):
+  """ Returns a (len(points) x len(xs)) matrix of the Lagrange basis
+      polynomials for xs evaluated at each point.   Multiplying the share
+      data by this gives the value of each polynomial at the points."""
+
+  differences = points[:, None] ^ xs[None, :]
+  onxs = differences == 0
+
+  # for points that aren't one of the xs, the weight for x_i is
+  #   prod(point - x_j) / (point - x_i) / prod(x_i - x_j)
+  logs = _LOG[differences]
+  weights = _EXP[(logs.sum(axis=1)[:, None] - logs -
+      _denominator_logs(xs)[None, :]) % 255]
+
+  # a point that is one of the xs just picks out that share
+  hits = onxs.any(axis=1)
+  weights[hits] = onxs[hits]
+
+  return weights
+
+
+
+def _newton_add(xs, columns, x, sharedata):
+  """ Adds the point x (with a value per byte in sharedata) to a Newton form
+      interpolation through xs.   columns holds the Newton coefficients so
+      far, one array per x.   Returns the new column."""
+
+  # Horner's rule on the Newton form, for every byte at once:
+  # c_0 + (x - x_0)(c_1 + (x - x_1)(c_2 + ...))
+  value = numpy.zeros(len(sharedata), dtype=numpy.uint8)
+  for j in range(len(xs)-1, -1, -1):
+    value = _mul(x ^ xs[j], value)
+    value ^= columns[j]
+
+  # the new coefficient is (f(x) - N(x)) divided by the product of (x - x_j),
+  # where N is the interpolation so far.
+  productlog = sum([_GF256_LOG[x ^ xj] for xj in xs])
+  value ^= sharedata
+  return _mul(_EXP[-productlog % 255], value)
+
+
+
+def _newton_coefficients(xs, columns):
+  """ Turns a Newton form interpolation (from _newton_add) into the usual
+      (share length x len(xs)) coefficient matrix."""
+
+  # This multiplies out from the innermost term:  p = p * (x - x_j) + c_j
+  # for every byte at once, with a row of terms (over the bytes) per power.
+  terms = columns[-1][None, :]
+  for j in range(len(xs)-2, -1, -1):
+    newterms = numpy.zeros((terms.shape[0] + 1, terms.shape[1]),
+        dtype=numpy.uint8)
+    newterms[:-1] = _mul(xs[j], terms)
+    newterms[1:] ^= terms
+    newterms[0] ^= columns[j]
+    terms = newterms
+
+  return numpy.ascontiguousarray(terms.T)
+
+
+
+def _coefficients_from_shares(xs, sharematrix):
+  """ Interpolates the shares (a row of share data per x) and returns the
+      (share length x len(xs)) coefficient matrix."""
+  return _gf256_matmul(sharematrix.T, _lagrange_basis(xs))
+
+
+
+
+class ShamirSecret(object):
+  """
+    This performs Shamir Secret Sharing operations in an incremental way
+    that is useful for PolyPasswordHasher.  It allows checking membership, generating
+    shares one at a time, etc.
+  """
+
+  def __init__(self, threshold, secretdata=None):
+    """Creates an object.   One must provide the threshold.   If you want
+       to have it create the coefficients, etc. call it with secret data"""
+    self.threshold=threshold
+    self.secretdata=secretdata
+
+    # The coefficients: a row per byte of the secret, lowest power first.
+    self._coefficientmatrix = None
+
+    # The share for a given x never changes once the coefficients are known,
+    # so I keep the ones I've computed here (keyed by x).   This must be
+    # cleared whenever the coefficients change!
+    self._sharecache = {}
+
+    # The Newton form interpolation of the shares added with add_share:
+    # their xs, their data by x (to spot duplicates) and a uint8 array of
+    # Newton coefficients (over the bytes) per x.
+    self._newtonxs = []
+    self._newtonsharedata = {}
+    self._newtoncolumns = []
+
+    # if we're given data, let's compute the random coefficients.   The
+    # first column is the secretdata.   The next threshold-1 are (crypto)
+    # random coefficients.
+    if secretdata is not None:
+      coefficientmatrix = numpy.empty((len(secretdata), threshold),
+          dtype=numpy.uint8)
+      coefficientmatrix[:, 0] = _as_array(secretdata)
+      coefficientmatrix[:, 1:] = numpy.frombuffer(os.urandom(len(secretdata) *
+          (threshold-1)), dtype=numpy.uint8).reshape(len(secretdata), -1)
+      self._coefficientmatrix = coefficientmatrix
+
+
+
+  @property
+  def _coefficients(self):
+    # The coefficients as a list of bytearrays (one per byte of the secret),
+    # the way the other versions keep them.
+    if self._coefficientmatrix is None:
+      return None
+    return [bytearray(row.tostring()) for row in self._coefficientmatrix]
+
+
+
+  def is_valid_share(self, share):
+    """ This validates that a share is correct given the secret data.
+        It returns True if it is valid, False if it is not, and raises
+        various errors when given bad data.
+        """
+
+    # the share is of the format x, f(x)f(x)
+    if type(share) is not tuple:
+      raise TypeError("Share is of incorrect type: "+str(type(share)))
+
+    if len(share) !=2:
+      raise ValueError("Share is of incorrect length: "+str(share))
+
+
+    return self.is_valid_sharedata(share[0], share[1])
+
+
+
+  def is_valid_sharedata(self, x, fx):
+    """ Like is_valid_share, but takes the share number and data separately.
+        fx can be any buffer (such as a memoryview), so the caller needn't
+        copy it or build a share tuple."""
+
+    if self._coefficientmatrix is None:
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if self._coefficientmatrix.shape[0] != len(fx):
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    # let's just look up the right value (compute_share checks x for me and
+    # fills the cache)
+    if x not in self._sharecache:
+      self.compute_share(x)
+
+    return self._sharecache[x] == fx
+
+
+
+
+  def is_valid_hashed_share(self, x, saltedpassword, storedhash):
+    """ Checks a threshold login: True if sha256(saltedpassword) XOR
+        storedhash is share x.   Both are buffers."""
+
+    if self._coefficientmatrix is None:
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if self._coefficientmatrix.shape[0] != len(storedhash):
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if x not in self._sharecache:
+      self.compute_share(x)
+
+    sharedata = bytearray(len(storedhash))
+    xor_into(sharedata, hashlib.sha256(saltedpassword).digest(), storedhash)
+
+    return self._sharecache[x] == sharedata
+
+
+
+
+
+  def compute_share(self, x):
+    """ This computes a share, given x.   It returns a tuple with x and the
+        individual f(x_0)f(x_1)f(x_2)... bytes for each byte of the secret.
+        This raises various errors when given bad data.
+        """
+
+    return self.compute_shares([x])[0]
+
+
+
+
+  def compute_shares(self, xs):
+    """ This computes the shares for a list of xs, all in one evaluation.
+        It returns a list of (x, bytearray) tuples in the same order as xs,
+        just like calling compute_share on each."""
+
+    for x in xs:
+      if type(x) is not int:
+        raise TypeError("In compute_share, x is of incorrect type: "+str(type(x)))
+
+      if x<=0 or x>=256:
+        raise ValueError("In compute_share, x must be between 1 and 255, not: "+str(x))
+
+    # nothing to do (the pure Python version also allows this before the
+    # coefficients are known)
+    if not xs:
+      return []
+
+    if self._coefficientmatrix is None:
+      raise ValueError("Must initialize coefficients before computing a share")
+
+    self._fill_sharecache(xs)
+
+    # hand back copies so that the caller can't change my cached shares
+    return [(x, bytearray(self._sharecache[x])) for x in xs]
+
+
+
+
+  def precompute_shares(self, xs):
+    """ Fill the share cache for every x in xs, so that later share checks
+        for these xs are just a comparison."""
+
+    self.compute_shares(list(xs))
+
+
+
+
+  def _fill_sharecache(self, xs):
+    """ Computes every share in xs that isn't cached yet in one evaluation.
+        Assumes the xs have already been checked."""
+
+    missingxs = []
+    for x in xs:
+      if x not in self._sharecache and x not in missingxs:
+        missingxs.append(x)
+
+    if not missingxs:
+      return
+
+    allshares = _horner(self._coefficientmatrix, _as_array(missingxs))
+
+    for pos in range(len(missingxs)):
+      self._sharecache[missingxs[pos]] = bytearray(allshares[pos].tostring())
+
+
+
+
+
+  def recover_secretdata(self, shares):
+    """ This recovers the secret data and coefficients given at least threshold
+        shares.   Note, if any provided share does not decode, an error is
+        raised."""
+
+    if self.secretdata is not None:
+      raise ValueError("Recovering secretdata when some is stored.   Use check_share instead.")
+
+    # This checks that any surplus shares agree before I do the (much more
+    # expensive) work of building the coefficients.
+    mysecretdata = self.recover_secret_at_zero(shares)
+
+    # The first threshold (unique) shares fully determine the polynomials and
+    # the others have been checked against them, so only use those.
+    shares = _unique_shares(shares)[:self.threshold]
+
+    coefficientmatrix = _coefficients_from_shares(
+        _as_array([share[0] for share in shares]),
+        _share_matrix([share[1] for share in shares]))
+
+    # this can't happen unless the math is broken...
+    assert(coefficientmatrix[:, 0].tostring() == mysecretdata)
+
+    # they check out!   Assign to the real ones!
+    self._coefficientmatrix = coefficientmatrix
+    self._sharecache = {}
+
+    self.secretdata = mysecretdata
+
+
+
+
+  def add_share(self, share):
+    """ This adds one share to an incremental interpolation of the secret
+        data.   Each share costs work proportional to the number of shares
+        so far, rather than a whole new interpolation.   Once threshold
+        unique shares have been added, the coefficients and secret data are
+        filled in (just as recover_secretdata would do).   Duplicate shares
+        are ignored.   Returns True once the secret data is known."""
+
+    if self.secretdata is not None:
+      raise ValueError("Adding shares when secretdata is stored.   Use is_valid_share instead.")
+
+    x, fx = share
+
+    if type(x) is not int:
+      raise TypeError("In add_share, x is of incorrect type: "+str(type(x)))
+
+    if x<=0 or x>=256:
+      raise ValueError("In add_share, x must be between 1 and 255, not: "+str(x))
+
+    if x in self._newtonsharedata:
+      # a share I already have...
+      if self._newtonsharedata[x] == str(fx):
+        return False
+      raise ValueError("Different shares with the same first byte! '"+str(x)+"'")
+
+    if self._newtoncolumns and len(fx) != len(self._newtoncolumns[0]):
+      raise ValueError("Shares have different lengths!")
+
+    self._newtonsharedata[x] = str(fx)
+    self._newtoncolumns.append(_newton_add(self._newtonxs,
+        self._newtoncolumns, x, _as_array(self._newtonsharedata[x])))
+    self._newtonxs.append(x)
+
+    if len(self._newtonxs) < self.threshold:
+      return False
+
+    # I have threshold shares, which determine the polynomials.
+    self._coefficientmatrix = _newton_coefficients(self._newtonxs,
+        self._newtoncolumns)
+    self._sharecache = {}
+
+    self.secretdata = self._coefficientmatrix[:, 0].tostring()
+
+    self._newtonxs = []
+    self._newtonsharedata = {}
+    self._newtoncolumns = []
+
+    return True
+
+
+
+
+  def incremental_share_count(self):
+    """ Returns the number of unique shares added with add_share that are
+        waiting for the threshold to be reached."""
+
+    return len(self._newtonxs)
+
+
+
+
+  def recover_secretdata_robust(self, shares):
+    """ This is like recover_secretdata, except that it tolerates wrong
+        shares as long as there are enough surplus ones.   With n unique
+        shares, up to (n-threshold)/2 wrong ones are found (by Reed-Solomon
+        decoding, not by trying subsets) and left out.   Returns the xs of
+        the wrong shares.   Raises a ValueError if there are too many."""
+
+    if self.secretdata is not None:
+      raise ValueError("Recovering secretdata when some is stored.   Use check_share instead.")
+
+    shares = _unique_shares(shares)
+
+    if self.threshold > len(shares):
+      raise ValueError("Threshold:"+str(self.threshold)+" is smaller than the number of unique shares:"+str(len(shares))+".")
+
+    badpositions = _locate_bad_shares(self, shares)
+
+    self.recover_secretdata([shares[pos] for pos in range(len(shares)) if pos
+        not in badpositions])
+
+    return [shares[pos][0] for pos in badpositions]
+
+
+
+
+  def recover_secret_at_zero(self, shares):
+    """ This recovers just the secret data (f(0) for each byte) given at least
+        threshold shares, without building the coefficients.   Only the first
+        threshold unique shares are interpolated.   Any others are checked by
+        evaluating at their x and a ValueError is raised if they don't match.
+        Nothing is stored in this object."""
+
+    shares = _unique_shares(shares)
+
+    if self.threshold > len(shares):
+      raise ValueError("Threshold:"+str(self.threshold)+" is smaller than the number of unique shares:"+str(len(shares))+".")
+
+    basisshares = shares[:self.threshold]
+    surplusshares = shares[self.threshold:]
+
+    xs = _as_array([share[0] for share in basisshares])
+    sharematrix = _share_matrix([share[1] for share in basisshares])
+
+    # evaluate at 0 (the secret) and at each surplus x in one product...
+    points = _as_array([0] + [share[0] for share in surplusshares])
+    results = _gf256_matmul(_lagrange_weights(xs, points), sharematrix)
+
+    # If I have more shares than the threshold, the extra ones must be on the
+    # same polynomials (by Lagrange)...
+    for pos in range(len(surplusshares)):
+      if bytearray(results[pos+1].tostring()) != surplusshares[pos][1]:
+        raise ValueError("Shares do not match.   Cannot decode")
+
+    return results[0].tostring()
@@ -0,0 +1,366 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  An append-only journal of account changes for PolyPasswordHasher password
+  files.   Rather than rewriting the whole password file for every new
+  account, each change is appended to a journal segment next to it
+  (passwordfile.journal.1, passwordfile.journal.2, ...).   Loading reads the
+  password file and then replays the segments in order.
+
+  Appends use group commit: a writer doesn't fsync itself, it waits for a
+  flusher thread that fsyncs everything written so far at most commitdelay
+  seconds after the first pending write.   So many concurrent writers share
+  one fsync, and no writer waits much longer than commitdelay.
+
+  Compaction rotates to a new segment, writes a fresh password file from
+  the accounts as of the rotation, and then removes the old segments.
+  Replaying a segment that is already folded into the password file just
+  sets the same accounts again, so a crash at any point is safe.
+
+  Each record is:
+
+    op ('A' to set an account, 'D' to delete one), the next available share,
+    the username length and the number of entries, then the username, then
+    for each entry its share number, salt length, passhash length, salt and
+    passhash, and last a CRC32 of all of this.
+
+  A torn record at the end of a segment (from a crash mid-write) fails its
+  CRC and it and anything after it are ignored.
+
+<Usage>
+  import passwordjournal
+
+  journal = passwordjournal.PasswordJournal('securepasswords')
+  journal.append_account('alice', pph.accountdict['alice'], pph.nextavailableshare)
+  journal.close()
+
+  # and when loading...
+  nextavailableshare = passwordjournal.replay('securepasswords', accountdict)
+"""
+
+__license__ = 'MIT'
+__all__ = ['PasswordJournal', 'replay', 'journal_segments']
+
+
+import passwordstore
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+MAGIC = 'PPHJ'
+VERSION = 1
+
+_FILEHEADER_FORMAT = '!4sH'
+_FILEHEADER_SIZE = struct.calcsize(_FILEHEADER_FORMAT)
+
+# op, next available share, username length, entry count
+_RECORDHEADER_FORMAT = '!cHHH'
+_RECORDHEADER_SIZE = struct.calcsize(_RECORDHEADER_FORMAT)
+
+# share number, salt length, passhash length
+_ENTRYHEADER_FORMAT = '!hBB'
+_ENTRYHEADER_SIZE = struct.calcsize(_ENTRYHEADER_FORMAT)
+
+_CRC_FORMAT = '!I'
+_CRC_SIZE = struct.calcsize(_CRC_FORMAT)
+
+
+
+
+def journal_segments(passwordfile):
+  """Returns a sorted list of (segment number, filename) for the journal
+     segments of passwordfile."""
+
+  directory = os.path.dirname(passwordfile) or '.'
+  prefix = os.path.basename(passwordfile) + '.journal.'
+
+  segments = []
+  for filename in os.listdir(directory):
+    suffix = filename[len(prefix):]
+    if filename.startswith(prefix) and suffix.isdigit():
+      segments.append((int(suffix), os.path.join(
+          os.path.dirname(passwordfile), filename)))
+
+  segments.sort()
+  return segments
+
+
+
+
+def replay(passwordfile, accountdict):
+  """Applies every journal segment of passwordfile to accountdict (which
+     should hold the accounts from passwordfile).   Returns the largest
+     next available share number recorded, or 0 if there are no records."""
+
+  nextavailableshare = 0
+  for (segmentnumber, filename) in journal_segments(passwordfile):
+    with open(filename, 'rb') as fileobj:
+      data = fileobj.read()
+
+    if len(data) < _FILEHEADER_SIZE:
+      continue
+    (magic, version) = struct.unpack_from(_FILEHEADER_FORMAT, data, 0)
+    if magic != MAGIC or version != VERSION:
+      raise ValueError("Journal '"+filename+"' is not a password journal")
+
+    position = _FILEHEADER_SIZE
+    while True:
+      record = _decode_record(data, position)
+      if record is None:
+        break
+      (op, recordshare, username, entries, position) = record
+
+      if op == 'A':
+        accountdict[username] = entries
+      elif username in accountdict:
+        del accountdict[username]
+
+      nextavailableshare = max(nextavailableshare, recordshare)
+
+  return nextavailableshare
+
+
+
+
+def _encode_record(op, username, entries, nextavailableshare):
+  pieces = [struct.pack(_RECORDHEADER_FORMAT, op, nextavailableshare,
+      len(username), len(entries)), username]
+
+  for entry in entries:
+    salt = str(entry['salt'])
+    passhash = str(entry['passhash'])
+    pieces.append(struct.pack(_ENTRYHEADER_FORMAT, entry['sharenumber'],
+        len(salt), len(passhash)))
+    pieces.append(salt)
+    pieces.append(passhash)
+
+  record = ''.join(pieces)
+  return record + struct.pack(_CRC_FORMAT, zlib.crc32(record) & 0xffffffff)
+
+
+
+
+def _decode_record(data, position):
+  """Returns (op, next available share, username, entries, next position)
+     or None if there isn't a whole, intact record at position."""
+
+  start = position
+  if position + _RECORDHEADER_SIZE > len(data):
+    return None
+  (op, nextavailableshare, usernamelength, entrycount) = struct.unpack_from(
+      _RECORDHEADER_FORMAT, data, position)
+  position += _RECORDHEADER_SIZE
+
+  username = data[position:position+usernamelength]
+  position += usernamelength
+
+  entries = []
+  for entrynumber in range(entrycount):
+    if position + _ENTRYHEADER_SIZE > len(data):
+      return None
+    (sharenumber, saltlength, passhashlength) = struct.unpack_from(
+        _ENTRYHEADER_FORMAT, data, position)
+    position += _ENTRYHEADER_SIZE
+
+    thisentry = {}
+    thisentry['sharenumber'] = sharenumber
+    thisentry['salt'] = data[position:position+saltlength]
+    position += saltlength
+    thisentry['passhash'] = data[position:position+passhashlength]
+    position += passhashlength
+    entries.append(thisentry)
+
+  if position + _CRC_SIZE > len(data):
+    return None
+  crc = struct.unpack_from(_CRC_FORMAT, data, position)[0]
+  if zlib.crc32(data[start:position]) & 0xffffffff != crc or op not in 'AD':
+    return None
+
+  return (op, nextavailableshare, username, entries, position + _CRC_SIZE)
+
+
+
+
+class PasswordJournal(object):
+  """ Appends account changes to the journal of a password file.   The
+      append calls return once the change is on disk."""
+
+  def __init__(self, passwordfile, commitdelay = 0.01):
+    """Starts a new segment after any that exist.   commitdelay is the
+       longest (in seconds) a write waits for others to share its fsync."""
+
+    self.passwordfile = passwordfile
+    self.commitdelay = commitdelay
+
+    # the number of records written and the number known to be on disk
+    self._written = 0
+    self._synced = 0
+    self._closed = False
+    self._error = None
+
+    # protects everything above and the file, and is signalled whenever
+    # either count changes
+    self._condition = threading.Condition()
+
+    segments = journal_segments(passwordfile)
+    if segments:
+      self._segmentnumber = segments[-1][0]
+    else:
+      self._segmentnumber = 0
+    self._open_segment()
+
+    self._flusher = threading.Thread(target=self._flush_loop)
+    self._flusher.daemon = True
+    self._flusher.start()
+
+
+
+  def _open_segment(self):
+    self._segmentnumber += 1
+    self.segmentfilename = self.passwordfile + '.journal.' + str(self._segmentnumber)
+    self._fileobj = open(self.segmentfilename, 'wb')
+    self._fileobj.write(struct.pack(_FILEHEADER_FORMAT, MAGIC, VERSION))
+    self.segmentsize = _FILEHEADER_SIZE
+    # The flusher fsyncs what is written, but the new file itself isn't on
+    # disk until its directory is.
+    passwordstore.fsync_directory(self.segmentfilename)
+
+
+
+  def append_account(self, username, entries, nextavailableshare, wait = True):
+    """Records that username now has these entries.   Unless wait is
+       False, this returns once the record is on disk.   Returns the
+       record's sequence number (for wait_for)."""
+    return self._append(_encode_record('A', username, entries,
+        nextavailableshare), wait)
+
+
+
+  def append_delete(self, username, nextavailableshare, wait = True):
+    """Records that username was removed."""
+    return self._append(_encode_record('D', username, [], nextavailableshare),
+        wait)
+
+
+
+  def _append(self, record, wait):
+    with self._condition:
+      if self._closed:
+        raise ValueError("The journal is closed")
+
+      self._fileobj.write(record)
+      self.segmentsize += len(record)
+      self._written += 1
+      mysequence = self._written
+      self._condition.notify_all()
+
+    if wait:
+      self.wait_for(mysequence)
+
+    return mysequence
+
+
+
+  def wait_for(self, sequence):
+    """Waits until the record with this sequence number (and so every one
+       before it) is on disk."""
+
+    with self._condition:
+      # wait for the flusher to get this onto the disk...
+      while self._synced < sequence and self._error is None:
+        self._condition.wait()
+
+      if self._error is not None:
+        raise self._error
+
+
+
+  def _flush_loop(self):
+    while True:
+      with self._condition:
+        while self._written == self._synced and not self._closed:
+          self._condition.wait()
+        if self._written == self._synced:
+          return
+
+      # let other writers join this commit...
+      if self.commitdelay:
+        time.sleep(self.commitdelay)
+
+      with self._condition:
+        target = self._written
+        fileobj = self._fileobj
+        try:
+          fileobj.flush()
+        except (IOError, OSError), e:
+          self._error = e
+          self._condition.notify_all()
+          return
+
+      # ...and fsync without holding the lock so they can keep writing.
+      # (A rotation fsyncs the old segment itself before it closes it.)
+      try:
+        if not fileobj.closed:
+          os.fsync(fileobj.fileno())
+      except (IOError, OSError, ValueError), e:
+        if not fileobj.closed:
+          with self._condition:
+            self._error = e
+            self._condition.notify_all()
+          return
+
+      with self._condition:
+        self._synced = max(self._synced, target)
+        self._condition.notify_all()
+
+
+
+  def rotate(self):
+    """Finishes the current segment and starts a new one.   Returns the
+       number of the finished segment; it and the ones before it can be
+       removed once a password file holding their changes is written."""
+
+    with self._condition:
+      self._fileobj.flush()
+      os.fsync(self._fileobj.fileno())
+      self._fileobj.close()
+      self._synced = self._written
+      self._condition.notify_all()
+
+      finishedsegment = self._segmentnumber
+      self._open_segment()
+
+    return finishedsegment
+
+
+
+  def remove_segments(self, lastsegment):
+    """Removes the finished segments up to and including lastsegment."""
+
+    for (segmentnumber, filename) in journal_segments(self.passwordfile):
+      if segmentnumber <= lastsegment and segmentnumber != self._segmentnumber:
+        os.remove(filename)
+
+
+
+  def close(self):
+    """Waits for pending writes to be on disk and closes the journal."""
+
+    with self._condition:
+      if self._closed:
+        return
+      self._closed = True
+      self._condition.notify_all()
+
+    self._flusher.join()
+
+    with self._condition:
+      self._fileobj.flush()
+      os.fsync(self._fileobj.fileno())
+      self._fileobj.close()
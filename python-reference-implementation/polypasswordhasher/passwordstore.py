@@ -0,0 +1,468 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  A compact, versioned binary format for PolyPasswordHasher password files.
+  This replaces pickling the whole PolyPasswordHasher object.   The file is
+  memory mapped when loaded and each account is only decoded when it is
+  looked up, so loading is quick and doesn't need memory for every account.
+
+  The layout is (all integers are big endian):
+
+    header:   magic 'PPHS', version, threshold, isolated check bytes,
+              salt size, hash size, next available share, flags, the
+              secret integrity check (32 bytes), the number of records and
+              accounts, and the offsets of the name table and the index.
+              From version 2, this is followed by the password hash
+              engine's name and up to three cost parameters (version 1
+              files use sha256).
+
+    records:  one fixed width record per entry: share number (signed, -1
+              for bootstrap accounts), salt, and passhash (including the
+              isolated check bytes).   An account's records are together.
+
+    names:    every username, back to back.
+
+    index:    one fixed width entry per account, sorted by the first 8
+              bytes of sha256(username): that hash, the first record, the
+              number of records, and where the username is in the name
+              table.   Lookups binary search this.
+
+<Usage>
+  import passwordstore
+
+  # write out the accounts of a PolyPasswordHasher object...
+  passwordstore.write_store('securepasswords', pph.threshold,
+      pph.isolated_check_bits, pph.nextavailableshare,
+      pph.secret_integrity_check, pph.accountdict)
+
+  # ...and map them back in
+  accountdict = passwordstore.MappedAccountDict('securepasswords')
+  print accountdict.threshold, len(accountdict), accountdict['alice']
+
+  # convert an old pickled password file
+  passwordstore.convert_pickle_store('oldpasswords', 'securepasswords', 10)
+
+  Or from the command line:
+
+  python passwordstore.py oldpasswords securepasswords [threshold]
+"""
+
+__license__ = 'MIT'
+__all__ = ['MappedAccountDict', 'write_store', 'is_store_file',
+    'convert_pickle_store', 'fsync_directory']
+
+
+from hashlib import sha256
+
+import accountstore
+import hashengine
+
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+
+MAGIC = 'PPHS'
+VERSION = 2
+
+# magic, version, threshold, isolated check bytes, salt size, hash size,
+# next available share, flags, integrity check, record count, account count,
+# name table offset, index offset
+_HEADER_FORMAT = '!4sHHHHHHH32sIIQQ'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+# then (from version 2) the hash engine name, how many parameters it has,
+# and the parameters
+_ENGINE_FORMAT = '!16sH3I'
+_ENGINE_SIZE = struct.calcsize(_ENGINE_FORMAT)
+
+# set in the flags if there is an integrity check (old pickled files may not
+# have one)
+_FLAG_INTEGRITY_CHECK = 1
+
+# username hash, first record, record count, name offset, name length
+_INDEX_FORMAT = '!QIHQH'
+_INDEX_SIZE = struct.calcsize(_INDEX_FORMAT)
+
+_SHARENUMBER_FORMAT = '!h'
+_SHARENUMBER_SIZE = struct.calcsize(_SHARENUMBER_FORMAT)
+
+
+
+
+def is_store_file(filename):
+  """Returns True if filename is in this format (rather than a pickle)."""
+
+  with open(filename, 'rb') as fileobj:
+    return fileobj.read(len(MAGIC)) == MAGIC
+
+
+
+
+class MappedAccountDict(object):
+  """ A read-mostly stand in for PolyPasswordHasher's accountdict that is
+      backed by a memory mapped password file.   Lookups decode the account's
+      records from the file.   New or changed accounts are kept in memory
+      (and so are only persisted by writing out a new file).   The header
+      fields are available as attributes."""
+
+  def __init__(self, filename):
+
+    self._fileobj = open(filename, 'rb')
+    try:
+      self._map = mmap.mmap(self._fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, mmap.error):
+      self._fileobj.close()
+      raise ValueError("Password file '"+filename+"' is empty or unreadable")
+
+    if len(self._map) < _HEADER_SIZE + _ENGINE_SIZE:
+      raise ValueError("Password file '"+filename+"' is truncated")
+
+    (magic, version, self.threshold, self.isolated_check_bytes,
+        self.saltsize, self.hashsize, self.nextavailableshare, flags,
+        integritycheck, self.recordcount, self.accountcount,
+        self._namesoffset, self._indexoffset) = struct.unpack_from(
+            _HEADER_FORMAT, self._map, 0)
+
+    if magic != MAGIC:
+      raise ValueError("Password file '"+filename+"' is not in the binary format")
+
+    if version == 1:
+      self._headersize = _HEADER_SIZE
+      self.hashengine = hashengine.SHA256Engine()
+    elif version == VERSION:
+      self._headersize = _HEADER_SIZE + _ENGINE_SIZE
+      (enginename, parametercount, parameter1, parameter2,
+          parameter3) = struct.unpack_from(_ENGINE_FORMAT, self._map,
+              _HEADER_SIZE)
+      self.hashengine = hashengine.get_engine(enginename.rstrip('\0'),
+          (parameter1, parameter2, parameter3)[:parametercount])
+    else:
+      raise ValueError("Unsupported password file version: "+str(version))
+
+    if flags & _FLAG_INTEGRITY_CHECK:
+      self.secret_integrity_check = integritycheck
+    else:
+      self.secret_integrity_check = None
+
+    self._recordsize = (_SHARENUMBER_SIZE + self.saltsize + self.hashsize +
+        self.isolated_check_bytes)
+
+    if self._indexoffset + self.accountcount * _INDEX_SIZE > len(self._map):
+      raise ValueError("Password file '"+filename+"' is truncated")
+
+    # accounts created or changed since loading, and deleted ones
+    self._changes = accountstore.AccountStore(self.saltsize,
+        self.hashsize + self.isolated_check_bytes)
+    self._deleted = set()
+
+
+
+  def _indexhash(self, position):
+    return struct.unpack_from('!Q', self._map,
+        self._indexoffset + position * _INDEX_SIZE)[0]
+
+
+
+  def _find(self, username):
+    """Returns the index entry for username in the file, or None."""
+
+    usernamehash = _hash_username(username)
+
+    # binary search for the first entry with this hash...
+    low = 0
+    high = self.accountcount
+    while low < high:
+      middle = (low + high) // 2
+      if self._indexhash(middle) < usernamehash:
+        low = middle + 1
+      else:
+        high = middle
+
+    # ...then check the names of any with the same hash
+    while low < self.accountcount and self._indexhash(low) == usernamehash:
+      indexentry = struct.unpack_from(_INDEX_FORMAT, self._map,
+          self._indexoffset + low * _INDEX_SIZE)
+      nameoffset = self._namesoffset + indexentry[3]
+      if self._map[nameoffset:nameoffset+indexentry[4]] == username:
+        return indexentry
+      low += 1
+
+    return None
+
+
+
+  def _decode(self, indexentry):
+    """Builds the list of entry dicts for an index entry."""
+
+    entries = []
+    position = self._headersize + indexentry[1] * self._recordsize
+    for recordnumber in range(indexentry[2]):
+      thisentry = {}
+      thisentry['sharenumber'] = struct.unpack_from(_SHARENUMBER_FORMAT,
+          self._map, position)[0]
+      position += _SHARENUMBER_SIZE
+      thisentry['salt'] = self._map[position:position+self.saltsize]
+      position += self.saltsize
+      passhashsize = self.hashsize + self.isolated_check_bytes
+      thisentry['passhash'] = self._map[position:position+passhashsize]
+      position += passhashsize
+      entries.append(thisentry)
+
+    return entries
+
+
+
+  def _filenames(self):
+    """Yields every username in the file (including deleted ones)."""
+
+    for position in range(self.accountcount):
+      indexentry = struct.unpack_from(_INDEX_FORMAT, self._map,
+          self._indexoffset + position * _INDEX_SIZE)
+      nameoffset = self._namesoffset + indexentry[3]
+      yield self._map[nameoffset:nameoffset+indexentry[4]]
+
+
+
+  def __contains__(self, username):
+    if username in self._changes:
+      return True
+    if username in self._deleted:
+      return False
+    return self._find(username) is not None
+
+
+
+  def __getitem__(self, username):
+    if username in self._changes:
+      return self._changes[username]
+    if username not in self._deleted:
+      indexentry = self._find(username)
+      if indexentry is not None:
+        return self._decode(indexentry)
+    raise KeyError(username)
+
+
+
+  def __setitem__(self, username, entries):
+    self._changes[username] = entries
+    self._deleted.discard(username)
+
+
+
+  def __delitem__(self, username):
+    if username not in self:
+      raise KeyError(username)
+    if username in self._changes:
+      del self._changes[username]
+    self._deleted.add(username)
+
+
+
+  def __iter__(self):
+    for username in self._filenames():
+      if username not in self._changes and username not in self._deleted:
+        yield username
+    for username in list(self._changes):
+      yield username
+
+
+
+  def __len__(self):
+    count = len(self._changes)
+    for username in self._filenames():
+      if username not in self._changes and username not in self._deleted:
+        count += 1
+    return count
+
+
+
+  def keys(self):
+    return list(self)
+
+
+
+  def copy(self):
+    """Returns a shallow copy that shares the mapped file (so only close
+       one of them) but has its own set of changes."""
+
+    newcopy = object.__new__(MappedAccountDict)
+    newcopy.__dict__.update(self.__dict__)
+    newcopy._changes = self._changes.copy()
+    newcopy._deleted = set(self._deleted)
+    return newcopy
+
+
+
+  def close(self):
+    """Unmaps the file.   The object can't be used after this."""
+    self._map.close()
+    self._fileobj.close()
+
+
+
+
+def write_store(filename, threshold, isolated_check_bytes, nextavailableshare,
+    secret_integrity_check, accounts, saltsize=16, hashsize=32,
+    passwordhashengine=None):
+  """Writes a password file.   accounts is a mapping (or an iterable of
+     (username, entries) pairs) where entries is a list of dicts with
+     'sharenumber', 'salt' and 'passhash' like PolyPasswordHasher uses.   The
+     records are streamed out as they are read.   The file is written under
+     a temporary name and renamed into place, so a mapped copy of the old
+     file stays valid.   passwordhashengine is the hashengine the passhashes
+     were made with (sha256 if not given)."""
+
+  if hasattr(accounts, 'keys'):
+    accountitems = ((username, accounts[username]) for username in accounts)
+  else:
+    accountitems = accounts
+
+  recordsize = _SHARENUMBER_SIZE + saltsize + hashsize + isolated_check_bytes
+
+  tempfilename = filename + '.tmp'
+  fileobj = open(tempfilename, 'wb')
+  try:
+    # leave room for the header, which I write last
+    fileobj.write('\0' * (_HEADER_SIZE + _ENGINE_SIZE))
+
+    indexentries = []
+    usernames = []
+    nameoffset = 0
+    recordcount = 0
+
+    for (username, entries) in accountitems:
+      if len(entries) > 65535:
+        raise ValueError("Too many entries for user '"+username+"'")
+
+      for entry in entries:
+        salt = str(entry['salt'])
+        passhash = str(entry['passhash'])
+        if len(salt) != saltsize or len(passhash) + _SHARENUMBER_SIZE + saltsize != recordsize:
+          raise ValueError("Entry for user '"+username+"' has the wrong size")
+        fileobj.write(struct.pack(_SHARENUMBER_FORMAT, entry['sharenumber']))
+        fileobj.write(salt)
+        fileobj.write(passhash)
+
+      indexentries.append((_hash_username(username), recordcount,
+          len(entries), nameoffset, len(username)))
+      usernames.append(username)
+      nameoffset += len(username)
+      recordcount += len(entries)
+
+    namesoffset = _HEADER_SIZE + _ENGINE_SIZE + recordcount * recordsize
+    for username in usernames:
+      fileobj.write(username)
+
+    indexoffset = namesoffset + nameoffset
+    indexentries.sort()
+    for indexentry in indexentries:
+      fileobj.write(struct.pack(_INDEX_FORMAT, *indexentry))
+
+    flags = 0
+    if secret_integrity_check is not None:
+      flags |= _FLAG_INTEGRITY_CHECK
+    else:
+      secret_integrity_check = '\0' * 32
+
+    fileobj.seek(0)
+    fileobj.write(struct.pack(_HEADER_FORMAT, MAGIC, VERSION, threshold,
+        isolated_check_bytes, saltsize, hashsize, nextavailableshare, flags,
+        secret_integrity_check, recordcount, len(indexentries), namesoffset,
+        indexoffset))
+
+    if passwordhashengine is None:
+      passwordhashengine = hashengine.SHA256Engine()
+    parameters = passwordhashengine.parameters()
+    fileobj.write(struct.pack(_ENGINE_FORMAT, passwordhashengine.name,
+        len(parameters), *(parameters + (0,) * (3 - len(parameters)))))
+
+    fileobj.flush()
+    os.fsync(fileobj.fileno())
+  finally:
+    fileobj.close()
+
+  # the rename isn't on disk until the directory is
+  os.rename(tempfilename, filename)
+  fsync_directory(filename)
+
+
+
+
+def fsync_directory(filename):
+  """Makes sure that creating, renaming or removing filename is on disk, by
+     fsyncing the directory it is in.   (Does nothing on Windows, which
+     can't open a directory.)"""
+
+  if os.name == 'nt':
+    return
+
+  directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+  try:
+    os.fsync(directory)
+  finally:
+    os.close(directory)
+
+
+
+
+def convert_pickle_store(picklefilename, storefilename, threshold=None):
+  """Converts an old pickled password file to this format.   The pickle can
+     either be a whole PolyPasswordHasher object or just its accountdict (as
+     in early versions).   For the latter, the threshold must be given since
+     it isn't in the file.   Only the writing is streamed:  a pickle is one
+     object, so the whole old file is loaded into memory first."""
+
+  with open(picklefilename, 'rb') as fileobj:
+    passwordfiledata = pickle.load(fileobj)
+
+  if isinstance(passwordfiledata, dict):
+    accountdict = passwordfiledata
+    secret_integrity_check = None
+  else:
+    accountdict = passwordfiledata.accountdict
+    secret_integrity_check = passwordfiledata.secret_integrity_check
+    if threshold is None:
+      threshold = passwordfiledata.threshold
+
+  if threshold is None:
+    raise ValueError("The threshold isn't in this password file and must be given")
+
+  # work out the sizes and the next share number from the entries
+  nextavailableshare = 1
+  passhashsize = None
+  for username in accountdict:
+    for entry in accountdict[username]:
+      nextavailableshare = max(nextavailableshare, entry['sharenumber'] + 1)
+      if passhashsize is None:
+        passhashsize = len(entry['passhash'])
+
+  hashsize = 32
+  if passhashsize is None:
+    passhashsize = hashsize
+
+  write_store(storefilename, threshold, passhashsize - hashsize,
+      nextavailableshare, secret_integrity_check, accountdict)
+
+
+
+
+def _hash_username(username):
+  return struct.unpack('!Q', sha256(username).digest()[:8])[0]
+
+
+
+
+if __name__ == '__main__':
+  if len(sys.argv) not in [3, 4]:
+    print "Usage: python passwordstore.py picklefile storefile [threshold]"
+    sys.exit(1)
+
+  if len(sys.argv) == 4:
+    convert_pickle_store(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+  else:
+    convert_pickle_store(sys.argv[1], sys.argv[2])
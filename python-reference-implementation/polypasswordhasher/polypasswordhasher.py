@@ -10,6 +10,18 @@
   https://polypasswordhasher.poly.edu/ for details).   This includes shielded
   password support via AES 256.
 
+  Threads:   any number of threads can check logins (is_valid_login and
+  is_valid_login_many) at the same time, and with the sha256 hash engine
+  the hashing and share check of a threshold login runs without the GIL, so
+  these really do run in parallel.   Logins never take a lock.   They look
+  accounts up in an immutable snapshot (accountstore.AccountIndex), and
+  creating accounts builds their entries off to the side and then publishes
+  a new snapshot with them in it.   Only handing out usernames and share
+  numbers, and swapping in the new snapshot, are done one thread at a time.
+  Unlocking waits for account creation in progress to finish.   Setting up
+  or closing a journal should not be done while other threads are using the
+  object.
+
 <Usage>
   import polypasswordhasher
 
@@ -79,13 +91,48 @@ from hashlib import sha256
 # For shielded password support...
 from Crypto.Cipher import AES
 
-import fastshamirsecret as shamirsecret
-#import shamirsecret
+# The fastest Shamir secret sharing module that can be imported here (the C
+# one, then NumPy, then pure Python)
+import shamirbackend
+shamirsecret = shamirbackend.get_backend()
 
 import os
 
+# for reading old (pickled) password files
 import pickle
 
+import accountstore
+import hashengine as passwordhashengine
+import passwordstore
+import passwordjournal
+
+import functools
+import threading
+
+# for creating accounts in bulk
+import collections
+import multiprocessing
+
+
+
+
+def _unlocker(method):
+  """Runs a PolyPasswordHasher unlock method once no accounts are being
+     created, and keeps new ones from starting until it is done (so the
+     bootstrap accounts and the mode new accounts are created in can't
+     change under it)."""
+
+  @functools.wraps(method)
+  def locked(self, *args, **kwargs):
+    with self._allocation:
+      while self._pendingusernames:
+        self._allocation.wait()
+      return method(self, *args, **kwargs)
+
+  return locked
+
+
+
 
 # This is a PolyHash object that has special routines for passwords...
 class PolyPasswordHasher(object):
@@ -103,6 +150,11 @@ class PolyPasswordHasher(object):
   # passwordfile
   knownsecret = False
 
+  # the (username, shares) from each add_unlock_login so far, and whether
+  # they have already failed to decode (so that surplus shares are needed)
+  _unlocklogins = ()
+  _unlockfailed = False
+
   # length of the salt in bytes
   saltsize = 16
 
@@ -121,19 +173,51 @@ class PolyPasswordHasher(object):
   # algorithm
   shieldedkey = None
 
+  # the AES object for shieldedkey (and the key it was made with), so the
+  # key schedule isn't redone for every shielded account.
+  _shieldedcipher = None
+  _shieldedcipherkey = None
+
   # number of used shares.   While I could duplicate shares for normal users,
   # I don't do so in this implementation.   This duplication would allow
   # co-analysis of password hashes
   nextavailableshare = None
 
-  def __init__(self, threshold, passwordfile = None, isolated_check_bits = 0):
+  # if journaling, the PasswordJournal that account changes are appended to,
+  # and the size a journal segment can grow to before it is compacted.
+  journal = None
+  journal_compact_size = None
+  _compactthread = None
+
+  # how salted password hashes are computed (see hashengine.py)
+  hashengine = None
+
+  def __init__(self, threshold, passwordfile = None, isolated_check_bits = 0,
+      hashengine = None):
     """Initialize a new (empty) object with the threshold.   I could store
        the threshold in the file, but don't do this currently.   I just assume
-       it's known to the program"""
+       it's known to the program.   hashengine is how passwords are hashed
+       (sha256(salt+password) if not given).   A password file records its
+       own, so it only needs to be given when loading to insist on it."""
 
     self.threshold = threshold
 
-    self.accountdict = {}
+    # Handing out usernames and share numbers to new accounts is done with
+    # this held (and unlocking holds it throughout).   The usernames that
+    # have been handed out but not yet published are kept here.
+    self._allocation = threading.Condition(threading.Lock())
+    self._pendingusernames = set()
+    # only one thread at a time publishes a new account snapshot
+    self._publishlock = threading.Lock()
+
+    if hashengine is None:
+      self.hashengine = passwordhashengine.SHA256Engine()
+    else:
+      self.hashengine = hashengine
+
+    # the accounts are kept in columns rather than as lots of small objects
+    self.accountdict = accountstore.AccountStore(self.saltsize,
+        passwordhashengine.HASH_SIZE + isolated_check_bits)
     self.bootstrap_accounts = []
 
     self.isolated_check_bits = isolated_check_bits
@@ -155,6 +239,7 @@ class PolyPasswordHasher(object):
       # create the integrity check
       self.secret_integrity_check = self.create_integrity_check(self.shieldedkey)
 
+      self._index_accounts()
       return
 
     # Okay, they have asked me to load in a password file!
@@ -162,14 +247,45 @@ class PolyPasswordHasher(object):
     self.knownsecret = False
     self.shieldedkey = None
 
+    # Password files are normally in the binary format, which I map in
+    # rather than read.   Accounts are decoded as they are looked up.
+    if passwordstore.is_store_file(passwordfile):
+      self.accountdict = passwordstore.MappedAccountDict(passwordfile)
+
+      if self.accountdict.threshold != threshold:
+        raise ValueError("Password file has threshold "+
+            str(self.accountdict.threshold)+", not "+str(threshold)+".")
+
+      if self.accountdict.isolated_check_bytes != isolated_check_bits:
+        raise ValueError("Password file has "+
+            str(self.accountdict.isolated_check_bytes)+
+            " isolated check bytes, not "+str(isolated_check_bits)+".")
+
+      if hashengine is not None and (hashengine.name,
+          hashengine.parameters()) != (self.accountdict.hashengine.name,
+          self.accountdict.hashengine.parameters()):
+        raise ValueError("Password file uses the "+
+            self.accountdict.hashengine.name+" hash engine with parameters "+
+            str(self.accountdict.hashengine.parameters())+".")
+
+      self.hashengine = self.accountdict.hashengine
+      self.secret_integrity_check = self.accountdict.secret_integrity_check
+      self.nextavailableshare = self.accountdict.nextavailableshare
+
+      self._replay_journal(passwordfile)
+      self._index_accounts()
+      return
+
+    # Otherwise, it's an old pickled one...
     # A real implementation would need much better error handling
     passwordfiledata = pickle.load(open(passwordfile))
 
     # just want to deserialize this data.  Should do better validation
-    self.accountdict = passwordfiledata.accountdict
-    self.secret_integrity_check = passwordfiledata.secret_integrity_check
+    assert(type(passwordfiledata.accountdict) is dict)
 
-    assert(type(self.accountdict) is dict)
+    for username in passwordfiledata.accountdict:
+      self.accountdict[username] = passwordfiledata.accountdict[username]
+    self.secret_integrity_check = passwordfiledata.secret_integrity_check
 
     # compute which share number is the largest used...
     for username in self.accountdict:
@@ -180,6 +296,20 @@ class PolyPasswordHasher(object):
     # ...then use the one after when I need a new one.
     self.nextavailableshare += self.nextavailableshare
 
+    self._replay_journal(passwordfile)
+    self._index_accounts()
+
+
+
+
+  def _index_accounts(self):
+    """Wraps the accounts just loaded in the snapshot that logins use.
+       They are never changed after this; new snapshots are published
+       instead."""
+
+    self.accountdict = accountstore.AccountIndex(self.accountdict,
+        self.saltsize, passwordhashengine.HASH_SIZE + self.isolated_check_bits)
+
 
 
 
@@ -191,40 +321,121 @@ class PolyPasswordHasher(object):
       system isn't initialized
     """
 
-    if username in self.accountdict:
-      raise ValueError("Username exists already!")
+    # The password hashing can be slow (see hashengine.py), so I check that
+    # the account can be created first, rather than hashing only to refuse
+    # it.   (Nothing is reserved yet, so it is checked again afterwards.)
+    with self._allocation:
+      error = self._check_new_account(username, shares)
+    if error is not None:
+      raise error
+
+    # The hashing is done before the account is given its share numbers.
+    salts = []
+    saltedpasswordhashes = []
+    for entrynumber in range(max(shares, 1)):
+      salts.append(os.urandom(self.saltsize))
+      saltedpasswordhashes.append(self.hashengine.hash(salts[-1], password))
+
+    self._store_accounts([(username, shares, salts, saltedpasswordhashes)])
+
+
+
+
+  def _store_accounts(self, hashedaccounts):
+    """Stores new accounts from a list of (username, shares, salts,
+       saltedpasswordhashes), as returned by _hash_accounts.   Their
+       usernames and share numbers are handed out in order, then their
+       entries are built with no lock held and they are all published in one
+       new snapshot.   Raises a ValueError for the first account that can't
+       be created, after storing the ones before it."""
+
+    (reservations, error) = self._reserve_accounts([(username, shares) for
+        (username, shares, salts, saltedpasswordhashes) in hashedaccounts])
+
+    newaccounts = []
+    try:
+      for (pos, (firstsharenumber, bootstrapping)) in enumerate(reservations):
+        (username, shares, salts, saltedpasswordhashes) = hashedaccounts[pos]
+        newaccounts.append((username, self._build_entries(shares,
+            firstsharenumber, bootstrapping, salts, saltedpasswordhashes)))
+    finally:
+      journalsequence = self._publish_accounts(
+          [hashedaccounts[pos][0] for pos in range(len(reservations))],
+          newaccounts)
+      # wait for them to be on disk (if journaling) without holding a lock
+      self._sync_journal(journalsequence)
+
+    if error is not None:
+      raise error
+
 
-    # Were I to add support for changing passwords, etc. this code would be
-    # moved to an internal helper.
+
+
+  def _reserve_accounts(self, accounts):
+    """Hands out the usernames and share numbers for a list of (username,
+       shares), in order, stopping at the first that can't be created.
+       Returns a list of (firstsharenumber, bootstrapping) for the ones
+       reserved and the ValueError for the one that wasn't (or None).   The
+       reserved usernames must be released with _publish_accounts."""
+
+    reservations = []
+    with self._allocation:
+      for (username, shares) in accounts:
+        error = self._check_new_account(username, shares)
+        if error is not None:
+          return (reservations, error)
+
+        reservations.append((self.nextavailableshare, not self.knownsecret))
+        self._pendingusernames.add(username)
+        # (shielded and bootstrap accounts don't use any)
+        self.nextavailableshare += shares
+
+    return (reservations, None)
+
+
+
+
+  def _check_new_account(self, username, shares):
+    """Returns the ValueError for why an account can't be created now (or
+       None).   The caller holds _allocation."""
 
     if shares>255 or shares<0:
-      raise ValueError("Invalid number of shares: "+str(shares)+".")
+      return ValueError("Invalid number of shares: "+str(shares)+".")
 
-    # Note this is just an implementation limitation.   I could do all sorts
-    # of things to get around this (like just use a bigger field).
+    if username in self.accountdict or username in self._pendingusernames:
+      return ValueError("Username exists already!")
+
+    # Note this is just an implementation limitation.   I could do all
+    # sorts of things to get around this (like just use a bigger field).
     if shares + self.nextavailableshare > 255:
-      raise ValueError("Would exceed maximum number of shares: "+str(shares)+".")
+      return ValueError("Would exceed maximum number of shares: "+
+          str(shares)+".")
 
-    # for each share, we will add the appropriate dictionary.
-    self.accountdict[username] = []
+    # We can only create shielded accounts while bootstrapping
+    if not self.knownsecret and shares != 0:
+      return ValueError("Cannot produce shares, still bootstrapping!")
 
-    # we are bootstrapping, we will create a bootstrap account
-    if not self.knownsecret:
+    return None
 
-      # We can only create shielded accounts while bootstrapping
-      if shares != 0:
-        del self.accountdict[username]
-        raise ValueError("Cannot produce shares, still bootstrapping!")
-      else:
-        thisentry = {}
-        thisentry['sharenumber'] = -1
-        thisentry['salt'] = os.urandom(self.saltsize)
-        saltedpasswordhash = sha256(thisentry['salt'] + password).digest()
-        thisentry['passhash'] = saltedpasswordhash
-        self.accountdict[username].append(thisentry)
 
-        # we will use this to update accounts one bootstrap accounts are finished
-        self.bootstrap_accounts.append(thisentry)
+
+
+  def _build_entries(self, shares, firstsharenumber, bootstrapping, salts,
+      saltedpasswordhashes):
+    """Builds the entries for a new account from its salts and salted
+       password hashes, with the share numbers from firstsharenumber on."""
+
+    # for each share, we will add the appropriate dictionary.
+    entries = []
+
+    # we are bootstrapping, we will create a bootstrap account
+    if bootstrapping:
+      thisentry = {}
+      thisentry['sharenumber'] = -1
+      thisentry['salt'] = salts[0]
+      saltedpasswordhash = saltedpasswordhashes[0]
+      thisentry['passhash'] = saltedpasswordhash
+      entries.append(thisentry)
 
 
     elif shares == 0:
@@ -232,40 +443,122 @@ class PolyPasswordHasher(object):
       thisentry = {}
       thisentry['sharenumber'] = 0
 
-      # get a random salt, salt the password and store the salted hash
-      thisentry['salt'] = os.urandom(self.saltsize)
-      saltedpasswordhash = sha256(thisentry['salt']+password).digest()
+      # the random salt and the salted hash
+      thisentry['salt'] = salts[0]
+      saltedpasswordhash = saltedpasswordhashes[0]
 
       # Encrypt the salted secure hash.   The salt should make all entries
       # unique when encrypted.
-      thisentry['passhash'] = AES.new(self.shieldedkey).encrypt(saltedpasswordhash)
+      thisentry['passhash'] = self._shielded_cipher().encrypt(saltedpasswordhash)
 
       # append the isolated validation data...
       thisentry['passhash'] += self.create_isolated_validation_bits(saltedpasswordhash)
 
-      self.accountdict[username].append(thisentry)
-      # and exit (don't increment the share count!)
+      entries.append(thisentry)
 
-      return
+    else:
+      # compute all of the shares for this account in one go...
+      newshares = self.shamirsecretobj.compute_shares(
+          range(firstsharenumber, firstsharenumber+shares))
 
-    for sharenumber in range(self.nextavailableshare, self.nextavailableshare+shares):
-      thisentry = {}
-      thisentry['sharenumber'] = sharenumber
-      # take the bytearray part of this
-      shamirsecretdata = self.shamirsecretobj.compute_share(sharenumber)[1]
-      thisentry['salt'] = os.urandom(self.saltsize)
-      saltedpasswordhash = sha256(thisentry['salt']+password).digest()
-      # XOR the two and keep this.   This effectively hides the hash unless
-      # protector hashes can be simultaneously decoded
-      thisentry['passhash'] = _do_bytearray_XOR(saltedpasswordhash, shamirsecretdata)
-      # append the isolated validation data...
-      thisentry['passhash'] += self.create_isolated_validation_bits(saltedpasswordhash)
+      for (pos, (sharenumber, shamirsecretdata)) in enumerate(newshares):
+        thisentry = {}
+        thisentry['sharenumber'] = sharenumber
+        thisentry['salt'] = salts[pos]
+        saltedpasswordhash = saltedpasswordhashes[pos]
+        # XOR the two and keep this.   This effectively hides the hash unless
+        # protector hashes can be simultaneously decoded
+        passhash = bytearray(len(saltedpasswordhash) + self.isolated_check_bits)
+        shamirsecret.xor_into(passhash, saltedpasswordhash, shamirsecretdata)
+        # append the isolated validation data...
+        passhash[len(saltedpasswordhash):] = self.create_isolated_validation_bits(saltedpasswordhash)
+        thisentry['passhash'] = passhash
 
+        entries.append(thisentry)
 
-      self.accountdict[username].append(thisentry)
+    return entries
 
-    # increment the share counter.
-    self.nextavailableshare += shares
+
+
+
+  def _publish_accounts(self, usernames, newaccounts):
+    """Publishes a new snapshot with the (username, entries) in newaccounts
+       and then releases the reserved usernames (which may include ones that
+       weren't built).   Returns the last journal sequence number (or
+       None)."""
+
+    journalsequence = None
+    try:
+      if newaccounts:
+        with self._publishlock:
+          self.accountdict = self.accountdict.with_accounts(newaccounts)
+          for (username, entries) in newaccounts:
+            # we will use this to update accounts once bootstrapping is done
+            if entries[0]['sharenumber'] == -1:
+              self.bootstrap_accounts.append(username)
+            journalsequence = self._journal_account(username, wait = False)
+    finally:
+      with self._allocation:
+        self._pendingusernames.difference_update(usernames)
+        self._allocation.notify_all()
+
+    return journalsequence
+
+
+
+
+  def create_accounts(self, records, processes = None, chunksize = 1000,
+      progress = None):
+    """
+      Create an account for each (username, password, shares) in records,
+      which can be any iterable (so a large import can be streamed from a
+      file).   The salting and hashing is spread over processes worker
+      processes (one per CPU if None).   The accounts are still stored in
+      order, so they get the same share numbers as calling create_account
+      for each in turn would give them.   If given, progress is called with
+      the number of accounts created so far after each chunk of them.
+      Raises a ValueError at the first bad record, with the accounts before
+      it created.   Returns the number of accounts created.
+    """
+
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+
+    chunks = _chunk_records(records, chunksize)
+
+    # not worth starting a pool for
+    if processes <= 1:
+      hashedchunks = (_hash_accounts(self.hashengine, self.saltsize, chunk)
+          for chunk in chunks)
+      return self._store_hashed_accounts(hashedchunks, progress)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+      # a few chunks per worker keeps them busy without reading the whole
+      # input into memory
+      hashedchunks = _map_in_order(pool, _hash_accounts,
+          (self.hashengine, self.saltsize), chunks, processes * 2)
+      return self._store_hashed_accounts(hashedchunks, progress)
+    finally:
+      pool.terminate()
+      pool.join()
+
+
+
+
+  def _store_hashed_accounts(self, hashedchunks, progress):
+    """Stores the accounts from chunks of _hash_accounts results, publishing
+       each chunk in one go."""
+
+    count = 0
+    for hashedaccounts in hashedchunks:
+      self._store_accounts(hashedaccounts)
+      count += len(hashedaccounts)
+
+      if progress is not None:
+        progress(count)
+
+    return count
 
 
 
@@ -276,8 +569,11 @@ class PolyPasswordHasher(object):
     if not self.knownsecret and self.isolated_check_bits == 0:
       raise ValueError("Still bootstrapping and isolated validation is disabled!")
 
+    # One snapshot of the accounts for the whole check.   (It is never
+    # changed, so no lock is needed.)
+    accounts = self.accountdict
 
-    if username not in self.accountdict:
+    if username not in accounts:
       raise ValueError("Unknown user '"+username+"'")
 
     # I'll check every share.   I probably could just check the first in almost
@@ -285,78 +581,383 @@ class PolyPasswordHasher(object):
     # multiple shares.   Since these accounts are the most valuable (for what
     # they can access in the overall system), let's be thorough.
 
-    for entry in self.accountdict[username]:
+    for entry in accounts[username]:
+
+      # The usual threshold login with the sha256 engine is hashed, XORed
+      # and checked in one call that lets other threads run.   (If it fails
+      # and there are isolated check bytes, I go the long way round to see
+      # if it's a break-in.)
+      if (entry['sharenumber'] > 0 and self.knownsecret and
+          self.hashengine.name == passwordhashengine.SHA256Engine.name):
+        passhash = entry['passhash']
+        if self.shamirsecretobj.is_valid_hashed_share(entry['sharenumber'],
+            entry['salt'] + password,
+            passhash[:len(passhash)-self.isolated_check_bits]):
+          return True
+        if self.isolated_check_bits == 0:
+          return False
 
-      saltedpasswordhash = sha256(entry['salt']+password).digest()
+      saltedpasswordhash = self.hashengine.hash(entry['salt'], password)
+      return self._check_login_hash(entry, saltedpasswordhash)
 
-      # if this is a bootstrap account...
-      if entry['sharenumber'] == -1:
-          return saltedpasswordhash == entry['passhash']
 
-      # If bootstrapping, isolated validation needs to be done here!
-      if not self.knownsecret:
-#        if saltedpasswordhash[len(saltedpasswordhash)-self.isolated_check_bits:] == entry['passhash'][len(entry['passhash'])-self.isolated_check_bits:]:
-        if self.isolated_validation(saltedpasswordhash, entry['passhash']):
-          return True
-        else:
-          return False
 
-      # XOR to remove the salted hash from the password
-      sharedata = _do_bytearray_XOR(saltedpasswordhash, entry['passhash'][:len(entry['passhash'])-self.isolated_check_bits])
 
-      if self.isolated_check_bits > 0:
-        isolated_check = self.isolated_validation(saltedpasswordhash, entry['passhash'])
-      else:
-        isolated_check = False
+  def get_login_parameters(self, username):
+    """ Returns what is needed to hash a password for username somewhere
+        else: (salt, hash engine name, hash engine parameters).   The hash is
+        passwordhashengine.get_engine(name, parameters).hash(salt, password),
+        which is then checked with is_valid_prehashed_login."""
 
-      # If a shielded account...
-      if entry['sharenumber'] == 0:
-        # return true if the password encrypts the same way...
-        if AES.new(self.shieldedkey).encrypt(saltedpasswordhash) == entry['passhash'][:len(entry['passhash'])-self.isolated_check_bits]:
-          return True
+    accounts = self.accountdict
+    if username not in accounts:
+      raise ValueError("Unknown user '"+username+"'")
 
-        # or false otherwise
-        if isolated_check:
-            print("Isolated check matches but full hash doesn't, this might be a break-in!")
-        return False
+    # only the first entry of an account is ever checked
+    entries = accounts[username]
+    if not entries:
+      raise ValueError("User '"+username+"' has no entries")
 
+    return (entries[0]['salt'], self.hashengine.name,
+        self.hashengine.parameters())
 
-      # now we should have a shamir share (if all is well.)
-      share = (entry['sharenumber'],sharedata)
 
-      # If a normal share, return T/F depending on if this share is valid.
-      if self.shamirsecretobj.is_valid_share(share):
-          return True
 
+
+  def is_valid_prehashed_login(self, username, saltedpasswordhash):
+    """ Check a login from its salted password hash (see
+        get_login_parameters) rather than its password.   This gives the same
+        result is_valid_login would, without doing the hashing here."""
+
+    if not self.knownsecret and self.isolated_check_bits == 0:
+      raise ValueError("Still bootstrapping and isolated validation is disabled!")
+
+    accounts = self.accountdict
+    if username not in accounts:
+      raise ValueError("Unknown user '"+username+"'")
+
+    if len(saltedpasswordhash) != passwordhashengine.HASH_SIZE:
+      raise ValueError("Salted password hash must be "+
+          str(passwordhashengine.HASH_SIZE)+" bytes")
+
+    # only the first entry is checked (as in get_login_parameters)
+    entries = accounts[username]
+    if not entries:
+      raise ValueError("User '"+username+"' has no entries")
+
+    return self._check_login_hash(entries[0], str(saltedpasswordhash))
+
+
+
+
+  def _check_login_hash(self, entry, saltedpasswordhash):
+    """Checks a salted password hash against an account's entry, the part
+       of is_valid_login after the hashing."""
+
+    # if this is a bootstrap account...
+    if entry['sharenumber'] == -1:
+        return saltedpasswordhash == entry['passhash']
+
+    # If bootstrapping, isolated validation needs to be done here!
+    if not self.knownsecret:
+#        if saltedpasswordhash[len(saltedpasswordhash)-self.isolated_check_bits:] == entry['passhash'][len(entry['passhash'])-self.isolated_check_bits:]:
+      if self.isolated_validation(saltedpasswordhash, entry['passhash']):
+        return True
+      else:
+        return False
+
+    if self.isolated_check_bits > 0:
+      isolated_check = self.isolated_validation(saltedpasswordhash, entry['passhash'])
+    else:
+      isolated_check = False
+
+    # If a shielded account...
+    if entry['sharenumber'] == 0:
+      # return true if the password encrypts the same way...
+      if self._shielded_cipher().encrypt(saltedpasswordhash) == entry['passhash'][:len(entry['passhash'])-self.isolated_check_bits]:
+        return True
+
+      # or false otherwise
       if isolated_check:
           print("Isolated check matches but full hash doesn't, this might be a break-in!")
-
       return False
 
 
+    # XOR to remove the salted hash from the password.
+    passhash = entry['passhash']
+    sharedata = bytearray(len(saltedpasswordhash))
+    shamirsecret.xor_into(sharedata, saltedpasswordhash,
+        passhash[:len(passhash)-self.isolated_check_bits])
+
+    # now we should have a shamir share (if all is well.)   If a normal
+    # share, return T/F depending on if this share is valid.
+    if self.shamirsecretobj.is_valid_sharedata(entry['sharenumber'], sharedata):
+        return True
+
+    if isolated_check:
+        print("Isolated check matches but full hash doesn't, this might be a break-in!")
+
+    return False
+
+
+
+
+  def is_valid_login_many(self, pairs):
+    """ Check a batch of (username, password) pairs at once.   Returns a list
+        of results in the same order as the pairs.   The result for each pair
+        is exactly what is_valid_login would return for it.   (If one would
+        raise a ValueError, so does the batch.   See check_logins.)"""
+
+    if not self.knownsecret and self.isolated_check_bits == 0:
+      raise ValueError("Still bootstrapping and isolated validation is disabled!")
+
+    # is_valid_login only ever looks at the first entry of an account (every
+    # path through its loop returns), so that is all I need here too.   Look
+    # them all up first so an unknown user fails the batch before any work.
+    accounts = self.accountdict
+    firstentries = []
+    for (username, password) in pairs:
+      if username not in accounts:
+        raise ValueError("Unknown user '"+username+"'")
+      entries = accounts[username]
+      if entries:
+        firstentries.append(entries[0])
+      else:
+        firstentries.append(None)
+
+    # The result for an account without entries is None, just like the
+    # single login case (which falls off the end of its loop).
+    results = [None] * len(pairs)
+
+    # bucket positions by the kind of check they need...
+    bootstrap = []
+    isolated = []
+    shielded = []
+    threshold = []
+
+    # hash them all at once...
+    saltedpasswordhashes = [None] * len(pairs)
+    hashed = [pos for pos in range(len(pairs)) if firstentries[pos] is not None]
+    for (pos, saltedpasswordhash) in zip(hashed, self.hashengine.hash_many(
+        [firstentries[pos]['salt'] for pos in hashed],
+        [pairs[pos][1] for pos in hashed])):
+      saltedpasswordhashes[pos] = saltedpasswordhash
+
+    # ...and sort them out
+    for pos in hashed:
+      entry = firstentries[pos]
+
+      if entry['sharenumber'] == -1:
+        bootstrap.append(pos)
+      elif not self.knownsecret:
+        isolated.append(pos)
+      elif entry['sharenumber'] == 0:
+        shielded.append(pos)
+      else:
+        threshold.append(pos)
+
+    for pos in bootstrap:
+      results[pos] = saltedpasswordhashes[pos] == firstentries[pos]['passhash']
+
+    for pos in isolated:
+      results[pos] = self.isolated_validation(saltedpasswordhashes[pos],
+          firstentries[pos]['passhash'])
+
+    encryptedhashes = self._encrypt_hashes([saltedpasswordhashes[pos] for
+        pos in shielded])
+
+    for index, pos in enumerate(shielded):
+      passhash = firstentries[pos]['passhash']
+      storedhash = passhash[:len(passhash)-self.isolated_check_bits]
+      results[pos] = encryptedhashes[index] == storedhash
+
+    # I reuse one buffer for the decoded shares.
+    sharedata = None
+    for pos in threshold:
+      if sharedata is None:
+        sharedata = bytearray(len(saltedpasswordhashes[pos]))
+      passhash = firstentries[pos]['passhash']
+      shamirsecret.xor_into(sharedata, saltedpasswordhashes[pos],
+          passhash[:len(passhash)-self.isolated_check_bits])
+      results[pos] = self.shamirsecretobj.is_valid_sharedata(
+          firstentries[pos]['sharenumber'], sharedata)
+
+    # Finally, flag possible break-ins in input order, just as a sequence of
+    # is_valid_login calls would.
+    if self.isolated_check_bits > 0 and self.knownsecret:
+      for pos in range(len(pairs)):
+        entry = firstentries[pos]
+        if results[pos] is not False or entry['sharenumber'] == -1:
+          continue
+        if self.isolated_validation(saltedpasswordhashes[pos], entry['passhash']):
+          print("Isolated check matches but full hash doesn't, this might be a break-in!")
+
+    return results
+
+
+
+  def check_logins(self, pairs):
+    """ Like is_valid_login_many, but returns a (result, error) pair for each
+        login, where error is the ValueError is_valid_login would raise (or
+        None).   So an unknown user only fails its own login."""
+
+    # I answer unknown users here and check the rest together.   (Accounts
+    # are never removed, so the others will still be there.)
+    accounts = self.accountdict
+    results = [None] * len(pairs)
+    knownpositions = []
+    for pos in range(len(pairs)):
+      username = pairs[pos][0]
+      if username in accounts:
+        knownpositions.append(pos)
+      else:
+        results[pos] = (None, ValueError("Unknown user '"+username+"'"))
+
+    try:
+      knownresults = self.is_valid_login_many([pairs[pos] for pos in
+          knownpositions])
+    except ValueError as error:
+      # anything else (like still bootstrapping) is the same for every login
+      return [(None, error)] * len(pairs)
+
+    for (pos, result) in zip(knownpositions, knownresults):
+      results[pos] = (result, None)
+    return results
+
+
 
   def write_password_data(self, passwordfile):
     """ Persist the password data to disk."""
     if self.threshold >= self.nextavailableshare:
       raise ValueError("Would write undecodable password file.   Must have more shares before writing.")
 
-    # Need more error checking in a real implementation
-    # we will backup important information, set it to None and write the rest
-    secret_backup = self.knownsecret
-    shieldedkey_backup = self.shieldedkey
-    shamirsecretobj_backup = self.shamirsecretobj
+    # Only the account data and the integrity check are written.   The
+    # secret (and anything derived from it) never goes to disk.
+    passwordstore.write_store(passwordfile, self.threshold,
+        self.isolated_check_bits, self.nextavailableshare,
+        self.secret_integrity_check, self.accountdict, self.saltsize,
+        passwordhashengine.HASH_SIZE, self.hashengine)
+
+
+  def use_journal(self, passwordfile, commitdelay = 0.01,
+      compactsize = 64*1024*1024):
+    """ From now on, persist account changes by appending them to a journal
+       next to passwordfile instead of rewriting it.   passwordfile must be
+       the file this object was loaded from (it is written if it doesn't
+       exist).   Each change is on disk when the call that made it returns,
+       but waits up to commitdelay seconds so it can share an fsync with
+       others.   Once the journal grows past compactsize bytes, a new
+       password file is written in the background."""
+
+    if self.journal is not None:
+      raise ValueError("Already journaling to '"+self.journal.passwordfile+"'")
+
+    if not os.path.exists(passwordfile):
+      self.write_password_data(passwordfile)
+
+    self.journal = passwordjournal.PasswordJournal(passwordfile, commitdelay)
+    self.journal_compact_size = compactsize
+
+
+
+  def compact_journal(self, wait = False):
+    """ Folds the journal into a new password file.   This starts a new
+       journal segment, writes the accounts as they are now in a background
+       thread, and then removes the old segments.   Returns without doing
+       anything if a compaction is already running."""
+
+    if self.journal is None:
+      raise ValueError("Not journaling!")
+
+    if self._compactthread is not None and self._compactthread.is_alive():
+      if wait:
+        self._compactthread.join()
+      return
+
+    # Changes after this point are in the new segment.   The snapshot taken
+    # with it never changes, so later changes don't leak into the new file
+    # while it is being written (not that that would break anything, since
+    # replaying the new segment sets them again).
+    # The header fields are read with it, so they match those accounts.
+    with self._publishlock:
+      lastsegment = self.journal.rotate()
+      accounts = self.accountdict
+      header = (self.threshold, self.isolated_check_bits,
+          self.nextavailableshare, self.secret_integrity_check)
+
+    journal = self.journal
+    def compact():
+      # (write_store has the new file's rename on disk before it returns, so
+      # the old segments are only removed once they aren't needed.)
+      (threshold, isolated_check_bits, nextavailableshare,
+          secret_integrity_check) = header
+      passwordstore.write_store(journal.passwordfile, threshold,
+          isolated_check_bits, nextavailableshare, secret_integrity_check,
+          accounts, self.saltsize, passwordhashengine.HASH_SIZE,
+          self.hashengine)
+      journal.remove_segments(lastsegment)
+
+    self._compactthread = threading.Thread(target=compact)
+    self._compactthread.start()
+
+    if wait:
+      self._compactthread.join()
+
+
+
+  def close_journal(self):
+    """ Waits for any compaction and for pending changes to be on disk,
+       and stops journaling."""
+
+    if self.journal is None:
+      return
+
+    if self._compactthread is not None:
+      self._compactthread.join()
+      self._compactthread = None
+
+    self.journal.close()
+    self.journal = None
+
+
+
+  def _journal_account(self, username, wait = True):
+    """Appends username's current entries to the journal (if journaling).
+       Unless wait is False, this returns once they are on disk.   Returns
+       the journal sequence number to pass to _sync_journal (or None)."""
+
+    if self.journal is None:
+      return None
+
+    return self.journal.append_account(username, self.accountdict[username],
+        self.nextavailableshare, wait)
+
+
+
+  def _sync_journal(self, sequence):
+    """Waits for a journal record to be on disk and compacts the journal if
+       it has grown too large.   The caller must not hold the publish
+       lock."""
+
+    if sequence is None or self.journal is None:
+      return
+
+    self.journal.wait_for(sequence)
+
+    if self.journal.segmentsize > self.journal_compact_size:
+      self.compact_journal()
+
 
-    self.secret = None
-    self.shieldedkey = None
-    self.shamirsecretobj = None
 
-    open(passwordfile,'w').write(pickle.dumps(self))
+  def _replay_journal(self, passwordfile):
+    """Applies any journaled changes to the accounts just loaded."""
 
-    self.knownsecret = secret_backup
-    self.shieldedkey = shieldedkey_backup
-    self.shamirsecretobj = shamirsecretobj_backup
+    self.nextavailableshare = max(self.nextavailableshare,
+        passwordjournal.replay(passwordfile, self.accountdict))
 
 
+
+  @_unlocker
   def unlock_password_data(self, logindata):
     """Pass this a list of username, password tuples like: [('admin',
        'correct horse'), ('root','battery staple'), ('bob','puppy')]) and
@@ -374,34 +975,252 @@ class PolyPasswordHasher(object):
     sharelist = []
 
     for (username, password) in logindata:
-      if username not in self.accountdict:
-        raise ValueError("Unknown user '"+username+"'")
+      sharelist.extend(self._get_login_shares(username, password))
 
-      for entry in self.accountdict[username]:
+    # This will raise a ValueError if a share is incorrect or there are other
+    # issues (like not enough shares).   It interpolates the secret from
+    # threshold shares and checks any extra shares against it before it
+    # builds the coefficients, so most wrong logins are rejected cheaply.
+    # (The integrity check covers the coefficients too, so it can only be
+    # checked after that.)
+    self.shamirsecretobj.recover_secretdata(sharelist)
+    if not self.verify_secret(self.shamirsecretobj.secretdata):
+        # start over with a fresh object so that the next attempt can try
+        self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+        raise ValueError("This is not a valid secret recombination, wrong account information provided")
 
-        # ignore shielded account entries...
-        if entry['sharenumber'] == 0:
-          continue
+    self._finish_unlock()
 
-        thissaltedpasswordhash = sha256(entry['salt']+password).digest()
-        thisshare = (entry['sharenumber'],
-            _do_bytearray_XOR(thissaltedpasswordhash,
-                entry['passhash'][:len(entry['passhash'])-self.isolated_check_bits]))
 
 
-        sharelist.append(thisshare)
-    # This will raise a ValueError if a share is incorrect or there are other
-    # issues (like not enough shares).
-    self.shamirsecretobj.recover_secretdata(sharelist)
+
+  @_unlocker
+  def unlock_password_data_robust(self, logindata):
+    """Like unlock_password_data, except that some of the logins may be wrong
+       as long as there are enough extra shares to outvote them.   The wrong
+       shares are found directly (by Reed-Solomon decoding), so this takes
+       about as long as a normal unlock.   Returns a sorted list of the
+       usernames whose logins were wrong.   Raises a ValueError if there are
+       too many wrong logins to unlock."""
+
+    if self.knownsecret:
+      raise ValueError("PPH is already in normal operation!")
+
+    sharelist = []
+    # so I can tell who gave me a bad share...
+    shareowners = {}
+
+    for (username, password) in logindata:
+      for share in self._get_login_shares(username, password):
+        sharelist.append(share)
+        shareowners.setdefault(share[0], set()).add(username)
+
+    badsharenumbers = self.shamirsecretobj.recover_secretdata_robust(sharelist)
+
     if not self.verify_secret(self.shamirsecretobj.secretdata):
+        # start over with a fresh object so that the next attempt can try
+        self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
         raise ValueError("This is not a valid secret recombination, wrong account information provided")
 
-    self.shieldedkey = self.shamirsecretobj.secretdata
+    self._finish_unlock()
+
+    badusernames = set()
+    for sharenumber in badsharenumbers:
+      badusernames.update(shareowners[sharenumber])
+
+    return sorted(badusernames)
+
+
+
+
+  @_unlocker
+  def add_unlock_login(self, username, password):
+    """Use a single (username, password) to work towards unlocking the
+       password file.   This is for when admins log in one at a time (say,
+       after a restart).   The shares from each login are kept and the
+       interpolation is updated incrementally, so nothing is rehashed or
+       reinterpolated as more logins arrive.   The password file is unlocked
+       as soon as threshold shares are known.   Returns True if it is now
+       unlocked and False if more shares are needed.
+
+       A login whose shares conflict with the ones gathered so far is
+       refused with a ValueError (a user logging in again replaces their
+       earlier login instead).   If threshold shares do not decode to a valid
+       secret, a ValueError is raised but the shares are kept, and later
+       logins are decoded along with them (as unlock_password_data_robust
+       does) until there are enough to outvote the wrong ones."""
+
+    if self.knownsecret:
+      raise ValueError("PPH is already in normal operation!")
+
+    newshares = self._get_login_shares(username, password)
+
+    # a user logging in again replaces their earlier login, since that may
+    # have been the wrong one.
+    keptlogins = [(name, shares) for (name, shares) in self._unlocklogins if
+        name != username]
+
+    gathered = {}
+    for (name, shares) in keptlogins:
+      gathered.update(shares)
+
+    for (sharenumber, sharedata) in newshares:
+      if sharenumber in gathered and gathered[sharenumber] != sharedata:
+        # at least one login is wrong, but I can't tell which yet.   I
+        # keep what I have and drop just this one.
+        raise ValueError("The login for '"+username+"' conflicts with the shares gathered so far")
+
+    if len(keptlogins) != len(self._unlocklogins):
+      # start the interpolation over without the replaced login
+      self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+      self._unlockfailed = False
+      sharestoadd = list(gathered.items()) + newshares
+    else:
+      sharestoadd = newshares
+
+    self._unlocklogins = keptlogins + [(username, newshares)]
+
+    if self._unlockfailed:
+      return self._unlock_gathered_shares()
+
+    for share in sharestoadd:
+      if not self.shamirsecretobj.add_share(share):
+        continue
+
+      # I have threshold shares now, so check them.
+      if self.verify_secret(self.shamirsecretobj.secretdata):
+        self._finish_unlock()
+        return True
+
+      # Some login is wrong.   I keep the shares so that the surplus ones
+      # can outvote it, but the incremental interpolation is no use now.
+      self._unlockfailed = True
+      self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+      if not self._unlock_gathered_shares():
+        raise ValueError("This is not a valid secret recombination, wrong account information provided")
+      return True
+
+    return False
+
+
 
-    # update bootstrap accounts to shielded accounts
-    for entry in self.bootstrap_accounts:
-        entry['passshash'] = AES.new(self.shieldedkey).encrypt(entry['passhash'])
-        entry['sharenumber'] = 0
+
+  def _unlock_gathered_shares(self):
+    """Tries to decode the shares from add_unlock_login even though some
+       are wrong.   Returns True if this unlocked the password file and False
+       if there aren't enough surplus shares yet."""
+
+    sharelist = []
+    for (name, shares) in self._unlocklogins:
+      sharelist.extend(shares)
+
+    # with only threshold shares there is nothing to outvote the wrong ones
+    if len(dict(sharelist)) <= self.threshold:
+      return False
+
+    # the integrity check is computed from shamirsecretobj, so the decoding
+    # goes there (and is thrown away if it is wrong).
+    self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+    try:
+      self.shamirsecretobj.recover_secretdata_robust(sharelist)
+    except ValueError:
+      self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+      return False
+
+    if not self.verify_secret(self.shamirsecretobj.secretdata):
+      self.shamirsecretobj = shamirsecret.ShamirSecret(self.threshold)
+      return False
+
+    self._finish_unlock()
+    return True
+
+
+
+
+  def unlock_share_count(self):
+    """Returns how many distinct share numbers have been gathered by
+       add_unlock_login so far (0 once the password file is unlocked)."""
+
+    if self.knownsecret:
+      return 0
+
+    sharenumbers = set()
+    for (name, shares) in self._unlocklogins:
+      sharenumbers.update(sharenumber for (sharenumber, sharedata) in shares)
+
+    return len(sharenumbers)
+
+
+
+
+  def _get_login_shares(self, username, password):
+    """Returns the shares (sharenumber, sharedata) that a login decodes to.
+       If the password is wrong, these will just be garbage."""
+
+    if username not in self.accountdict:
+      raise ValueError("Unknown user '"+username+"'")
+
+    sharelist = []
+
+    for entry in self.accountdict[username]:
+
+      # ignore shielded account entries...
+      if entry['sharenumber'] == 0:
+        continue
+
+      thissaltedpasswordhash = self.hashengine.hash(entry['salt'], password)
+      passhash = entry['passhash']
+      thisshare = (entry['sharenumber'],
+          _do_bytearray_XOR(thissaltedpasswordhash,
+              passhash[:len(passhash)-self.isolated_check_bits]))
+
+
+      sharelist.append(thisshare)
+
+    return sharelist
+
+
+
+
+  def _finish_unlock(self):
+    """Switches to normal operation once shamirsecretobj holds the verified
+       secret."""
+
+    self.shieldedkey = self.shamirsecretobj.secretdata
+    self._unlocklogins = ()
+
+    # fill the share cache for every share number handed out so far, so that
+    # threshold logins are just a hash, an XOR and a compare from here on.
+    # (A new store fills it as create_account hands out shares.)   This is
+    # one bulk computation and doesn't need to look at any accounts.
+    self.shamirsecretobj.precompute_shares(range(1,
+        min(self.nextavailableshare, 256)))
+
+    # update bootstrap accounts to shielded accounts.   Their hashes are all
+    # encrypted in one go, and they are published in one new snapshot (a
+    # bootstrap account has just one entry).
+    bootstrapentries = [self.accountdict[username][0] for username in
+        self.bootstrap_accounts]
+
+    saltedpasswordhashes = [entry['passhash'] for entry in bootstrapentries]
+    encryptedhashes = self._encrypt_hashes(saltedpasswordhashes)
+
+    shieldedaccounts = []
+    for pos in range(len(bootstrapentries)):
+      thisentry = {}
+      thisentry['sharenumber'] = 0
+      thisentry['salt'] = bootstrapentries[pos]['salt']
+      thisentry['passhash'] = encryptedhashes[pos] + \
+          self.create_isolated_validation_bits(saltedpasswordhashes[pos])
+      shieldedaccounts.append((self.bootstrap_accounts[pos], [thisentry]))
+
+    journalsequence = None
+    if shieldedaccounts:
+      with self._publishlock:
+        self.accountdict = self.accountdict.with_accounts(shieldedaccounts)
+        for username in self.bootstrap_accounts:
+          journalsequence = self._journal_account(username, wait = False)
+    self._sync_journal(journalsequence)
 
     # we shouldn't have any bootstrap accounts now
     self.bootstrap_accounts = []
@@ -410,6 +1229,35 @@ class PolyPasswordHasher(object):
     # it worked!
     self.knownsecret = True
 
+  def _shielded_cipher(self):
+    """Returns the AES object for shieldedkey.   It is made once and then
+       reused for as long as the key stays the same."""
+
+    if self._shieldedcipherkey != self.shieldedkey:
+      self._shieldedcipher = AES.new(self.shieldedkey)
+      self._shieldedcipherkey = self.shieldedkey
+
+    return self._shieldedcipher
+
+
+
+  def _encrypt_hashes(self, hashes):
+    """Encrypts a list of (equal length) hashes with the shielded key and
+       returns the results in order.   AES in ECB mode encrypts each block
+       on its own, so one call over all of them gives the same bytes as one
+       call per hash."""
+
+    if not hashes:
+      return []
+
+    hashlength = len(hashes[0])
+    encrypted = self._shielded_cipher().encrypt(''.join(hashes))
+
+    return [encrypted[pos*hashlength:(pos+1)*hashlength] for pos in
+        range(len(hashes))]
+
+
+
   def isolated_validation(self, passhash, stored_hash):
     """
     Compare local icb's with the provided icb to see if the provided
@@ -485,17 +1333,73 @@ class PolyPasswordHasher(object):
 
 #### Private helper...
 def _do_bytearray_XOR(a,b):
-  a = bytearray(a)
-  b = bytearray(b)
+  """Returns a new bytearray with a XOR b."""
 
   # should always be true in our case...
-  if len(a) != len(b):
-    print len(a), len(b), a, b
   assert(len(a) == len(b))
-  result = bytearray()
+  result = bytearray(len(a))
 
-  for pos in range(len(a)):
-    result.append(a[pos]^b[pos])
+  shamirsecret.xor_into(result, a, b)
 
   return result
 
+
+
+
+def _chunk_records(records, chunksize):
+  """Yields lists of up to chunksize records."""
+
+  chunk = []
+  for record in records:
+    chunk.append(record)
+    if len(chunk) >= chunksize:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+
+
+
+def _hash_accounts(hashengine, saltsize, records):
+  """Picks the salts and computes the salted password hashes for a list of
+     (username, password, shares) records, just as create_account does.
+     This runs in the worker processes of create_accounts."""
+
+  # pick all the salts, then hash the whole chunk in one go
+  allsalts = []
+  allpasswords = []
+  for (username, password, shares) in records:
+    # a bad share count is reported when the account is stored
+    if 0 <= shares <= 255:
+      for entrynumber in range(max(shares, 1)):
+        allsalts.append(os.urandom(saltsize))
+        allpasswords.append(password)
+
+  allhashes = hashengine.hash_many(allsalts, allpasswords)
+
+  hashedaccounts = []
+  pos = 0
+  for (username, password, shares) in records:
+    entrycount = 0
+    if 0 <= shares <= 255:
+      entrycount = max(shares, 1)
+    hashedaccounts.append((username, shares, allsalts[pos:pos+entrycount],
+        allhashes[pos:pos+entrycount]))
+    pos += entrycount
+  return hashedaccounts
+
+
+
+
+def _map_in_order(pool, function, args, chunks, window):
+  """Yields function(*args + (chunk,)) for each chunk, in order, with at
+     most window chunks handed to pool at a time."""
+
+  pending = collections.deque()
+  for chunk in chunks:
+    pending.append(pool.apply_async(function, args + (chunk,)))
+    if len(pending) >= window:
+      yield pending.popleft().get()
+  while pending:
+    yield pending.popleft().get()
@@ -0,0 +1,84 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  Picks the Shamir secret sharing module that PolyPasswordHasher uses.
+  There are three, each with the same ShamirSecret class (and xor_into),
+  which give the same results:
+
+    fastshamirsecret    uses the fastpolymath_c extension (needs a compiler)
+    numpyshamirsecret   uses NumPy
+    shamirsecret        pure Python
+
+  get_backend() returns the first of these that can be imported here.   It
+  doesn't time them; they are listed fastest first, which is assumed to
+  hold everywhere.   (experiments/timeshamirbackends.py compares them.
+  With thresholds from 2 to 253, recovering the secret was about 3 to 9
+  times faster with fastshamirsecret than with numpyshamirsecret, and
+  computing every share up to 7 times faster.   numpyshamirsecret beat
+  shamirsecret at both, at every threshold.   Checking a share took about
+  the same time with each.)
+  Setting PPH_SHAMIR_BACKEND in the environment to one of the names picks
+  that one instead (say, to test or time it).
+
+<Usage>
+  import shamirbackend
+
+  shamirsecret = shamirbackend.get_backend()
+  print shamirsecret.__name__, shamirbackend.available_backends()
+"""
+
+__license__ = 'MIT'
+__all__ = ['BACKENDS', 'available_backends', 'get_backend']
+
+
+import os
+
+
+# fastest first (assumed, not measured when importing)
+BACKENDS = ['fastshamirsecret', 'numpyshamirsecret', 'shamirsecret']
+
+
+
+
+def available_backends():
+  """The names of the backends that can be imported, fastest first."""
+  return [name for name in BACKENDS if _import(name) is not None]
+
+
+
+
+def get_backend(name = None):
+  """Returns the backend module called name, or if name is None, the one
+     named by PPH_SHAMIR_BACKEND or else the first one in BACKENDS that can
+     be imported."""
+
+  if name is None:
+    name = os.environ.get('PPH_SHAMIR_BACKEND')
+
+  if name is None:
+    for name in BACKENDS:
+      module = _import(name)
+      if module is not None:
+        return module
+    # the pure Python one is always there, so this can't happen
+    raise ImportError("No Shamir secret sharing module can be imported")
+
+  if name not in BACKENDS:
+    raise ValueError("Unknown Shamir backend '"+name+"'")
+
+  module = _import(name)
+  if module is None:
+    raise ValueError("The Shamir backend '"+name+"' can't be imported here")
+  return module
+
+
+
+
+def _import(name):
+  # fastshamirsecret needs the extension and numpyshamirsecret needs NumPy
+  try:
+    return __import__(name, globals())
+  except ImportError:
+    return None
@@ -13,7 +13,10 @@ Purpose:
 
   1) built expressly to have the APIs I need
 
-  2) definitely not performance tuned. (It's geared for readability.)
+  2) reasonably fast for pure Python, since it is what PolyPasswordHasher
+     falls back to without fastpolymath_c.   The GF256 math uses log / exp
+     lookup tables and works on whole buffers at once where it can, and
+     shares can be added one at a time without reinterpolating.
 
   This is just a proof-of-concept!!!
 
@@ -50,7 +53,11 @@ Notes:
    shares.  For my application, I want them to get an (undetected) incorrect
    decoding if a share is wrong.
 """
+import binascii
+import hashlib
+import operator
 import os
+import struct
 
 __author__ = 'Justin Cappos (jcappos@poly.edu)'
 __version__ = '0.1'
@@ -78,6 +85,18 @@ class ShamirSecret(object):
 
     self._coefficients = None
 
+    # The share for a given x never changes once the coefficients are known,
+    # so I keep the ones I've computed here (keyed by x).   This must be
+    # cleared whenever the coefficients change!
+    self._sharecache = {}
+
+    # Shares added one at a time with add_share are interpolated in Newton
+    # form.   These are their xs, the share data for each x (to spot
+    # duplicates), and the Newton coefficients (one bytearray per x).
+    self._newtonxs = []
+    self._newtonsharedata = {}
+    self._newtoncolumns = []
+
     # if we're given data, let's compute the random coefficients.   I do this
     # here so I can later iteratively compute the shares
     if secretdata is not None:
@@ -107,21 +126,49 @@ class ShamirSecret(object):
       raise ValueError("Share is of incorrect length: "+str(share))
 
 
+    return self.is_valid_sharedata(share[0], share[1])
+
+
+
+  def is_valid_sharedata(self, x, fx):
+    """ Like is_valid_share, but takes the share number and data separately.
+        fx can be any buffer (such as a memoryview), so the caller needn't
+        copy it or build a share tuple."""
+
     if self._coefficients is None:
       raise ValueError("Must initialize coefficients before checking is_valid_share")
 
-    if len(self._coefficients) != len(share[1]):
+    if len(self._coefficients) != len(fx):
       raise ValueError("Must initialize coefficients before checking is_valid_share")
 
-    x, fx = share
+    # let's just look up the right value (compute_share checks x for me and
+    # fills the cache)
+    if x not in self._sharecache:
+      self.compute_share(x)
 
-    # let's just compute the right value
-    correctshare = self.compute_share(x)
+    return self._sharecache[x] == fx
 
-    if correctshare == share:
-      return True
-    else:
-      return False
+
+
+
+  def is_valid_hashed_share(self, x, saltedpassword, storedhash):
+    """ Checks a threshold login: True if sha256(saltedpassword) XOR
+        storedhash is share x.   Both are buffers.   (In the C version, all
+        of this runs without the GIL, so many threads can do it at once.)"""
+
+    if self._coefficients is None:
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if len(self._coefficients) != len(storedhash):
+      raise ValueError("Must initialize coefficients before checking is_valid_share")
+
+    if x not in self._sharecache:
+      self.compute_share(x)
+
+    sharedata = bytearray(len(storedhash))
+    xor_into(sharedata, hashlib.sha256(saltedpassword).digest(), storedhash)
+
+    return self._sharecache[x] == sharedata
 
 
 
@@ -142,14 +189,73 @@ class ShamirSecret(object):
     if self._coefficients is None:
       raise ValueError("Must initialize coefficients before computing a share")
 
-    sharebytes = bytearray()
-    # go through the coefficients and compute f(x) for each value.
-    # Append that byte to the share
-    for thiscoefficient in self._coefficients:
-      thisshare = _f(x,thiscoefficient)
-      sharebytes.append(thisshare)
+    # hand back a copy so that the caller can't change my cached share
+    return (x, bytearray(self._get_sharedata(x)))
+
+
 
-    return (x,sharebytes)
+
+  def compute_shares(self, xs):
+    """ This computes the shares for a list of xs.   It returns a list of
+        (x, bytearray) tuples in the same order as xs, just like calling
+        compute_share on each."""
+
+    for x in xs:
+      if type(x) is not int:
+        raise TypeError("In compute_share, x is of incorrect type: "+str(type(x)))
+
+      if x<=0 or x>=256:
+        raise ValueError("In compute_share, x must be between 1 and 255, not: "+str(x))
+
+    # nothing to do (before the coefficients are known, too)
+    if not xs:
+      return []
+
+    if self._coefficients is None:
+      raise ValueError("Must initialize coefficients before computing a share")
+
+    self._fill_sharecache(xs)
+
+    # hand back copies so that the caller can't change my cached shares
+    return [(x, bytearray(self._sharecache[x])) for x in xs]
+
+
+
+
+  def precompute_shares(self, xs):
+    """ Fill the share cache for every x in xs, so that later share checks
+        for these xs are just a comparison."""
+
+    self.compute_shares(list(xs))
+
+
+
+
+  def _get_sharedata(self, x):
+    """ Returns the (cached) share bytes for x.   The caller must not
+        modify them!   Assumes x has already been checked."""
+
+    if x not in self._sharecache:
+      self._fill_sharecache([x])
+
+    return self._sharecache[x]
+
+
+
+
+  def _fill_sharecache(self, xs):
+    """ Computes every share in xs that isn't cached yet all together.
+        Assumes the xs have already been checked."""
+
+    missingxs = []
+    for x in xs:
+      if x not in self._sharecache and x not in missingxs:
+        missingxs.append(x)
+
+    allshares = _evaluate_shares(missingxs, self._coefficients)
+
+    for pos in range(len(missingxs)):
+      self._sharecache[missingxs[pos]] = allshares[pos]
 
 
 
@@ -160,65 +266,162 @@ class ShamirSecret(object):
         shares.   Note, if any provided share does not decode, an error is
         raised."""
 
-    # discard duplicate shares
-    newshares = []
-    for share in shares:
-      if share not in newshares:
-        newshares.append(share)
-    shares = newshares
-
-
-    if self.threshold > len(shares):
-      raise ValueError("Threshold:"+str(self.threshold)+" is smaller than the number of unique shares:"+str(len(shares))+".")
-
     if self.secretdata is not None:
       raise ValueError("Recovering secretdata when some is stored.   Use check_share instead.")
 
+    # This checks that any surplus shares agree before I do the (much more
+    # expensive) work of building the coefficients.
+    mysecretdata = self.recover_secret_at_zero(shares)
+
+    # The first threshold (unique) shares fully determine the polynomials and
+    # the others have been checked against them, so only use those.   This
+    # also means there are always threshold coefficients (as for a new
+    # secret) rather than zero higher order terms for the surplus shares.
+    # create_integrity_check only hashes the first threshold of them anyway.
+    shares = _unique_shares(shares)[:self.threshold]
+
     # the first byte of each share is the 'x'.
     xs = []
     for share in shares:
-      # the first byte should be unique...
-      if share[0] in xs:
-        raise ValueError("Different shares with the same first byte! '"+str(share[0])+"'")
-      # ...and all should be the same length
-      if len(share[1])!=len(shares[0][1]):
-        raise ValueError("Shares have different lengths!")
-
       xs.append(share[0])
 
 
-    mycoefficients = []
-    mysecretdata = ''
+    # now do lagrange interpolation for every byte of the secret to compute
+    # the coefficients...
+    mycoefficients = _full_lagrange_many(xs, [share[1] for share in shares])
 
-    # now walk through each byte of the secret and do lagrange interpolation
-    # to compute the coefficient...
-    for byte_to_use in range(0,len(shares[0][1])):
 
-      # we need to get the f(x)s from the appropriate bytes
-      fxs = []
-      for share in shares:
-        fxs.append(share[1][byte_to_use])
+    # this can't happen unless the math is broken...
+    assert(''.join([chr(poly[0]) for poly in mycoefficients]) == mysecretdata)
 
-      # build this polynomial
-      resulting_poly = _full_lagrange(xs,fxs)
+    # they check out!   Assign to the real ones!
+    self._coefficients = mycoefficients
+    self._sharecache = {}
 
+    self.secretdata = mysecretdata
 
-      # If I have more shares than the threshold, the higher order coefficients
-      # (those greater than threshold) must be zero (by Lagrange)...
-      if resulting_poly[:self.threshold] + [0]*(len(shares)-self.threshold) != resulting_poly:
-        raise ValueError("Shares do not match.   Cannot decode")
 
-      # track this byte...
-      mycoefficients.append(bytearray(resulting_poly))
 
-      mysecretdata += chr(resulting_poly[0])
 
+  def add_share(self, share):
+    """ This adds one share to an incremental interpolation of the secret
+        data.   Each share costs work proportional to the number of shares
+        so far, rather than a whole new interpolation.   Once threshold
+        unique shares have been added, the coefficients and secret data are
+        filled in (just as recover_secretdata would do).   Duplicate shares
+        are ignored.   Returns True once the secret data is known."""
 
+    if self.secretdata is not None:
+      raise ValueError("Adding shares when secretdata is stored.   Use is_valid_share instead.")
+
+    x, fx = share
+
+    if type(x) is not int:
+      raise TypeError("In add_share, x is of incorrect type: "+str(type(x)))
+
+    if x<=0 or x>=256:
+      raise ValueError("In add_share, x must be between 1 and 255, not: "+str(x))
+
+    if x in self._newtonsharedata:
+      # a share I already have...
+      if self._newtonsharedata[x] == str(fx):
+        return False
+      raise ValueError("Different shares with the same first byte! '"+str(x)+"'")
+
+    if self._newtoncolumns and len(fx) != len(self._newtoncolumns[0]):
+      raise ValueError("Shares have different lengths!")
+
+    self._newtoncolumns.append(_newton_add(self._newtonxs, self._newtoncolumns, x, fx))
+    self._newtonxs.append(x)
+    self._newtonsharedata[x] = str(fx)
+
+    if len(self._newtonxs) < self.threshold:
+      return False
+
+    # I have threshold shares, which determine the polynomials.
+    resulting_polys = _newton_coefficients(self._newtonxs, self._newtoncolumns)
+
+    mycoefficients = []
+    for resulting_poly in resulting_polys:
+      mycoefficients.append(bytearray(resulting_poly))
 
-    # they check out!   Assign to the real ones!
     self._coefficients = mycoefficients
+    self._sharecache = {}
 
-    self.secretdata = mysecretdata
+    self.secretdata = ''.join([chr(poly[0]) for poly in resulting_polys])
+
+    self._newtonxs = []
+    self._newtonsharedata = {}
+    self._newtoncolumns = []
+
+    return True
+
+
+
+
+  def incremental_share_count(self):
+    """ Returns the number of unique shares added with add_share that are
+        waiting for the threshold to be reached."""
+
+    return len(self._newtonxs)
+
+
+
+
+  def recover_secretdata_robust(self, shares):
+    """ This is like recover_secretdata, except that it tolerates wrong
+        shares as long as there are enough surplus ones.   With n unique
+        shares, up to (n-threshold)/2 wrong ones are found (by Reed-Solomon
+        decoding, not by trying subsets) and left out.   Returns the xs of
+        the wrong shares.   Raises a ValueError if there are too many."""
+
+    if self.secretdata is not None:
+      raise ValueError("Recovering secretdata when some is stored.   Use check_share instead.")
+
+    shares = _unique_shares(shares)
+
+    if self.threshold > len(shares):
+      raise ValueError("Threshold:"+str(self.threshold)+" is smaller than the number of unique shares:"+str(len(shares))+".")
+
+    badpositions = _locate_bad_shares(self, shares)
+
+    self.recover_secretdata([shares[pos] for pos in range(len(shares)) if pos
+        not in badpositions])
+
+    return [shares[pos][0] for pos in badpositions]
+
+
+
+
+  def recover_secret_at_zero(self, shares):
+    """ This recovers just the secret data (f(0) for each byte) given at least
+        threshold shares, without building the coefficients.   Only the first
+        threshold unique shares are interpolated.   Any others are checked by
+        evaluating at their x and a ValueError is raised if they don't match.
+        Nothing is stored in this object."""
+
+    shares = _unique_shares(shares)
+
+    if self.threshold > len(shares):
+      raise ValueError("Threshold:"+str(self.threshold)+" is smaller than the number of unique shares:"+str(len(shares))+".")
+
+    basisshares = shares[:self.threshold]
+    surplusshares = shares[self.threshold:]
+
+    xs = [share[0] for share in basisshares]
+    sharedatalist = [share[1] for share in basisshares]
+
+    # evaluate at 0 (the secret) and at each surplus x...
+    results = _lagrange_at(xs, sharedatalist,
+        [0] + [share[0] for share in surplusshares])
+
+    # If I have more shares than the threshold, the extra ones must be on the
+    # same polynomials (by Lagrange)...
+    for pos in range(len(surplusshares)):
+      if results[pos+1] != surplusshares[pos][1]:
+        raise ValueError("Shares do not match.   Cannot decode")
+
+    return str(results[0])
 
 
 
@@ -229,12 +432,81 @@ class ShamirSecret(object):
 
 
 
+# The structs that split a buffer of each length I've seen into 8 byte words
+# (and any leftover bytes).   In practice, there is only one: 32 bytes.
+_xor_structs = {}
+
+def xor_into(out, a, b):
+  """XORs the buffers a and b into out.   These can be anything with the
+     buffer interface (str, bytearray, memoryview slices, ...) and out just
+     needs to be writable and at least as long as a and b.   PolyPasswordHasher
+     uses this to combine hashes and shares."""
+
+  length = len(a)
+  if len(b) != length or len(out) < length:
+    raise ValueError("buffers must be the same length (and out at least as long)")
+
+  wordstruct = _xor_structs.get(length)
+  if wordstruct is None:
+    wordstruct = struct.Struct('<'+str(length // 8)+'Q'+str(length % 8)+'B')
+    _xor_structs[length] = wordstruct
+
+  wordstruct.pack_into(out, 0, *map(operator.xor, wordstruct.unpack_from(a),
+      wordstruct.unpack_from(b)))
+
+
+
+
 
 
 ### Private math helpers... Lagrange interpolation, polynomial math, etc.
 
 
 
+def _unique_shares(shares):
+  """ Discards duplicate shares (keeping the first of each, in order) and
+      checks that the rest have unique xs and the same length."""
+
+  newshares = []
+  seenshares = set()
+  # one flag per possible x
+  seenxs = bytearray(256)
+
+  for share in shares:
+    sharekey = (share[0], str(share[1]))
+    if sharekey in seenshares:
+      continue
+    seenshares.add(sharekey)
+
+    # the first byte should be unique...
+    if seenxs[share[0]]:
+      raise ValueError("Different shares with the same first byte! '"+str(share[0])+"'")
+    seenxs[share[0]] = 1
+
+    # ...and all should be the same length
+    if len(share[1])!=len(shares[0][1]):
+      raise ValueError("Shares have different lengths!")
+
+    newshares.append(share)
+
+  return newshares
+
+
+
+# The polynomial math below multiplies whole buffers by a constant at once with
+# bytearray.translate and a row of the multiplication table (see the GF256
+# helpers at the bottom), and XORs them together as Python longs.   Both run
+# in C, so this is much quicker than a byte at a time.
+def _to_long(buf):
+  return int(binascii.hexlify(buf) or '0', 16)
+
+def _from_long(value, length):
+  if length == 0:
+    return bytearray()
+  return bytearray(binascii.unhexlify('%0*x' % (2*length, value)))
+
+
+
 # This actually computes f(x).  It's private and not needed elsewhere...
 def _f(x, coefs_bytes):
   """ This computes f(x) = a + bx + cx^2 + ...
@@ -245,25 +517,60 @@ def _f(x, coefs_bytes):
     raise ValueError('invalid share index value, cannot be 0')
   accumulator = 0
 
-  # start with x_i = 1.   We'll multiply by x each time around to increase it.
-  x_i = 1
-  for c in coefs_bytes:
-    # we multiply this byte (a,b, or c) with x raised to the right power.
-    accumulator = _gf256_add(accumulator, _gf256_mul(c, x_i))
-    # raise x_i to the next power by multiplying by x.
-    x_i = _gf256_mul(x_i, x)
+  # x raised to each power comes from a table, so each byte (a, b, or c) is
+  # just one lookup to multiply.
+  mul = _GF256_MUL
+  powers = _gf256_powers(x)
+  for pos in range(len(coefs_bytes)):
+    accumulator ^= mul[coefs_bytes[pos] << 8 | powers[pos]]
 
   return accumulator
 
 
 
+# Computes the share (f(x) for each polynomial) for every x in xs.
+# coefficients has a bytearray per polynomial, as _f takes them.   Returns a
+# bytearray per x.
+def _evaluate_shares(xs, coefficients):
+  if not coefficients:
+    return [bytearray() for x in xs]
+
+  numcoefficients = len(coefficients[0])
+
+  if len(xs) <= len(coefficients):
+    # A share at a time:  every polynomial's c_k times x**k in one go.
+    columns = [bytearray(column) for column in zip(*coefficients)]
+    results = []
+    for x in xs:
+      powers = _gf256_powers(x)
+      accumulator = 0
+      for k in range(numcoefficients):
+        accumulator ^= _to_long(columns[k].translate(_GF256_MULROWS[powers[k]]))
+      results.append(_from_long(accumulator, len(coefficients)))
+    return results
+
+  # A polynomial at a time:  c_k times x**k for every x in one go.   This is
+  # fewer (but longer) steps when there are more xs than polynomials.
+  powercolumns = [bytearray(column) for column in
+      zip(*[_gf256_powers(x)[:numcoefficients] for x in xs])]
+  rows = []
+  for coefs_bytes in coefficients:
+    accumulator = 0
+    for k in range(numcoefficients):
+      accumulator ^= _to_long(powercolumns[k].translate(
+          _GF256_MULROWS[coefs_bytes[k]]))
+    rows.append(_from_long(accumulator, len(xs)))
+
+  return [bytearray(share) for share in zip(*rows)]
+
+
+
 
 
 # unfortunately, numpy doesn't seem to do polynomial arithematic over
 # finite fields...   :(
 #
-# This helper function takes two lists and 'multiplies' them.   I only tested
-# the second list is of size <=2, but I don't think this matters.
+# This helper function takes two lists and 'multiplies' them.
 #
 # for example: [1,3,4] * [4,5] will compute (1 + 3x + 4x^2) * (4 - 5x) ->
 # 4 + 17x + 31x^2 + 20x^3    or [4, 17, 31, 20]
@@ -272,24 +579,20 @@ def _f(x, coefs_bytes):
 # 4 + 9x + 31x^2 + 20x^3    or [4, 9, 31, 20]
 def _multiply_polynomials(a,b):
 
-  # I'll compute each term separately and add them together
-  resultterms = []
-
-  # this grows to account for the fact the terms increase as it goes
-  # for example, multiplying by x, shifts all 1 right
-  termpadding = []
-  for bterm in b:
-    thisvalue = termpadding[:]
-    # multiply each a by the b term.
-    for aterm in a:
-      thisvalue.append(_gf256_mul(aterm,bterm))
-#      thisvalue.append(aterm * bterm)
+  if not b:
+    return []
 
-    resultterms = _add_polynomials(resultterms,thisvalue)
-    # moved another x value over...
-    termpadding.append(0)
+  # each pair of terms adds into the result in place
+  mul = _GF256_MUL
+  result = [0]*(len(a)+len(b)-1)
+  for bpos in range(len(b)):
+    bterm = b[bpos]
+    if bterm == 0:
+      continue
+    for apos in range(len(a)):
+      result[apos+bpos] ^= mul[a[apos] << 8 | bterm]
 
-  return resultterms
+  return result
 
 
 
@@ -305,12 +608,53 @@ def _add_polynomials(a,b):
 
   assert(len(a)==len(b))
 
-  result = []
-  for pos in range(len(a)):
-#    result.append(a[pos] + b[pos])
-    result.append(_gf256_add(a[pos],b[pos]))
+  return map(operator.xor, a, b)
 
-  return result
+
+
+# the log of the product of (x_i - x_j) over every other j, for each x_i in xs.
+# These are the denominators of the Lagrange basis polynomials.
+def _denominator_logs(xs):
+  return [sum([_GF256_LOG[xi ^ xj] for xj in xs if xj != xi]) for xi in xs]
+
+
+
+# Computes the Lagrange basis polynomials for xs:
+# l_0 =  (x - x_1) / (x_0 - x_1)   *   (x - x_2) / (x_0 - x_2) * ...
+# l_1 =  (x - x_0) / (x_1 - x_0)   *   (x - x_2) / (x_1 - x_2) * ...
+# Returns a bytearray of coefficients for each.
+def _lagrange_basis(xs):
+  mul = _GF256_MUL
+  length = len(xs)
+
+  # Rather than multiply out every l_i term by term (which is cubic), I build
+  # the master polynomial  M(x) = (x - x_0) * (x - x_1) * ...  once (in
+  # place).   The numerator of l_i is then just M(x) / (x - x_i).
+  master = bytearray(length+1)
+  master[0] = 1
+  for j in range(length):
+    # don't need to negate because -x = x in GF256
+    xj = xs[j]
+    for k in range(j+1, 0, -1):
+      master[k] = master[k-1] ^ mul[master[k] << 8 | xj]
+    master[0] = mul[master[0] << 8 | xj]
+
+  basis = []
+  denominatorlogs = _denominator_logs(xs)
+  for i in range(length):
+    # synthetic division of M(x) by (x - x_i), from the top term down.   The
+    # remainder is 0 because x_i is a root of M(x).
+    xi = xs[i]
+    numerator = bytearray(length)
+    numerator[-1] = master[-1]
+    for k in range(length-1, 0, -1):
+      numerator[k-1] = master[k] ^ mul[numerator[k] << 8 | xi]
+
+    # ...divided by the denominator
+    basis.append(numerator.translate(
+        _GF256_MULROWS[_GF256_EXP[-denominatorlogs[i] % 255]]))
+
+  return basis
 
 
 
@@ -320,40 +664,237 @@ def _add_polynomials(a,b):
 def _full_lagrange(xs, fxs):
   assert(len(xs) == len(fxs))
 
-  returnedcoefficients = []
-  # we need to compute:
-  # l_0 =  (x - x_1) / (x_0 - x_1)   *   (x - x_2) / (x_0 - x_2) * ...
-  # l_1 =  (x - x_0) / (x_1 - x_0)   *   (x - x_2) / (x_1 - x_2) * ...
-  for i in range(len(fxs)):
+  return list(_full_lagrange_many(xs, [[fx] for fx in fxs])[0])
+
+
+
+# Does Lagrange interpolation for every byte of the shares at once.   The basis
+# polynomials only depend on the xs, so they are only built once.   Returns
+# a bytearray of coefficients for each byte.
+def _full_lagrange_many(xs, sharedatalist):
+  basis = _lagrange_basis(xs)
+
+  # each polynomial is the sum of l_i * f(x_i)
+  resulting_polys = []
+  for byte_to_use in range(len(sharedatalist[0])):
+    accumulator = 0
+    for i in range(len(xs)):
+      accumulator ^= _to_long(basis[i].translate(
+          _GF256_MULROWS[sharedatalist[i][byte_to_use]]))
+    resulting_polys.append(_from_long(accumulator, len(xs)))
+
+  return resulting_polys
+
+
+
+# For shares with the given xs and data, evaluate the polynomials through them
+# at each of the points (without building their coefficients).   At point 0
+# this is the secret.   Returns one bytearray per point.
+def _lagrange_at(xs, sharedatalist, points):
+
+  denominatorlogs = _denominator_logs(xs)
 
-    this_polynomial = [1]
-    # take the terms one at a time.
-    # I'm computing the denominator and using it to compute the polynomial.
-    for j in range(len(fxs)):
-      # skip the i = jth term because that's how Lagrange works...
-      if i == j:
-        continue
+  results = []
+  for point in points:
 
-      # I'm computing the denominator and using it to compute the polynomial.
-      denominator = _gf256_sub(xs[i],xs[j])
-#      denominator = xs[i]-xs[j]
+    if point in xs:
+      # every other basis polynomial is 0 here
+      results.append(bytearray(sharedatalist[xs.index(point)]))
+      continue
 
-      # don't need to negate because -x = x in GF256
-      this_term = [_gf256_div(xs[j],denominator), _gf256_div(1,denominator)]
-#      this_term = [-xs[j]/denominator, 1/denominator]
+    # l_i(point) = product of (point - x_j) for j != i, over the denominator.
+    # I take the product over every j and divide (point - x_i) back out.
+    differencelogs = [_GF256_LOG[point ^ xj] for xj in xs]
+    numeratorlog = sum(differencelogs)
 
-      # let's build the polynomial...
-      this_polynomial = _multiply_polynomials(this_polynomial,this_term)
+    # ...and the value at the point is the sum of f(x_i) * l_i(point)
+    accumulator = 0
+    for i in range(len(xs)):
+      weight = _GF256_EXP[(numeratorlog - differencelogs[i] -
+          denominatorlogs[i]) % 255]
+      accumulator ^= _to_long(bytearray(sharedatalist[i]).translate(
+          _GF256_MULROWS[weight]))
 
-    # okay, now I've gone and computed the polynomial.   I need to multiply it
-    # by the result of f(x)
+    results.append(_from_long(accumulator, len(sharedatalist[0])))
 
-    this_polynomial = _multiply_polynomials(this_polynomial, [fxs[i]])
+  return results
 
-    # we've solved this polynomial.   We should add to the others.
-    returnedcoefficients = _add_polynomials(returnedcoefficients, this_polynomial)
 
-  return returnedcoefficients
+
+
+
+
+# Adds the point x (with a value per byte in sharedata) to a Newton form
+# interpolation through xs.   columns holds the Newton coefficients so far, one
+# bytearray per x.   Returns the new column.
+def _newton_add(xs, columns, x, sharedata):
+
+  # Horner's rule on the Newton form, for every byte at once:
+  # c_0 + (x - x_0)(c_1 + (x - x_1)(c_2 + ...))
+  value = bytearray(len(sharedata))
+  for j in range(len(xs)-1, -1, -1):
+    value = value.translate(_GF256_MULROWS[x ^ xs[j]])
+    xor_into(value, value, columns[j])
+
+  # the new coefficient is (f(x) - N(x)) divided by the product of (x - x_j),
+  # where N is the interpolation so far.
+  productlog = sum([_GF256_LOG[x ^ xj] for xj in xs])
+  xor_into(value, value, sharedata)
+  return value.translate(_GF256_MULROWS[_GF256_EXP[-productlog % 255]])
+
+
+
+# Turns a Newton form interpolation (from _newton_add) into the usual
+# coefficients.   Returns one list of coefficients per byte.
+def _newton_coefficients(xs, columns):
+
+  # This multiplies out from the innermost term:  p = p * (x - x_j) + c_j
+  # for every byte at once, so the terms of p are kept as a bytearray (over
+  # the bytes) per power.
+  terms = [columns[-1]]
+  for j in range(len(xs)-2, -1, -1):
+    row = _GF256_MULROWS[xs[j]]
+    newterms = [terms[0].translate(row)]
+    for k in range(1, len(terms)):
+      newterm = terms[k].translate(row)
+      xor_into(newterm, newterm, terms[k-1])
+      newterms.append(newterm)
+    newterms.append(terms[-1])
+
+    xor_into(newterms[0], newterms[0], columns[j])
+    terms = newterms
+
+  return [list(poly) for poly in zip(*terms)]
+
+
+
+
+
+
+# Reed-Solomon decoding (Gao's algorithm) of the points (xs, ys) for a
+# polynomial with fewer than k coefficients.   This corrects up to
+# (len(xs)-k)/2 wrong ys.   Returns the coefficients and the positions (in xs)
+# of the wrong ys, or None if there are too many of them to decode.
+def _gao_decode(xs, ys, k):
+  n = len(xs)
+
+  # g0 is the polynomial with a root at every x...
+  g0 = [1]
+  for xj in xs:
+    g0 = _multiply_polynomials(g0, [xj, 1])
+
+  # ...and g1 goes through every point, right or wrong
+  g1 = _trim_polynomial(_full_lagrange(xs, ys))
+
+  # Run the extended Euclidean algorithm on them, tracking v in
+  # r = u*g0 + v*g1, until the remainder has degree below (n+k)/2.
+  r0, r1 = g0, g1
+  v0, v1 = [], [1]
+  while 2*(len(r1)-1) >= n+k:
+    quotient, remainder = _divide_polynomials(r0, r1)
+    r0, r1 = r1, remainder
+    v0, v1 = v1, _trim_polynomial(_add_polynomials(v0,
+        _multiply_polynomials(quotient, v1)))
+
+  # v is now the error locator (it is zero at each wrong point) and r is the
+  # real polynomial times v.
+  coefficients, remainder = _divide_polynomials(r1, v1)
+  if remainder or len(coefficients) > k:
+    return None
+
+  errorpositions = []
+  for pos in range(n):
+    if _evaluate_polynomial(v1, xs[pos]) == 0:
+      errorpositions.append(pos)
+
+  # the locator can't have more roots than there are errors it can fix
+  if 2*len(errorpositions) > n-k:
+    return None
+
+  return (coefficients + [0]*(k-len(coefficients)), errorpositions)
+
+
+
+# removes high order zero terms so the length is the degree + 1 (and the zero
+# polynomial is [])
+def _trim_polynomial(a):
+  a = a[:]
+  while a and a[-1] == 0:
+    a.pop()
+  return a
+
+
+
+# divides polynomial a by polynomial b, returning the quotient and remainder
+# (both trimmed).
+def _divide_polynomials(a, b):
+  b = _trim_polynomial(b)
+  if not b:
+    raise ZeroDivisionError
+
+  remainder = _trim_polynomial(a)
+  if len(remainder) < len(b):
+    return ([], remainder)
+
+  quotient = [0]*(len(remainder)-len(b)+1)
+  inverseleading = _gf256_div(1, b[-1])
+
+  for shift in range(len(quotient)-1, -1, -1):
+    # knock out the top term of what's left
+    term = _gf256_mul(remainder[shift+len(b)-1], inverseleading)
+    quotient[shift] = term
+    if term == 0:
+      continue
+    for pos in range(len(b)):
+      remainder[shift+pos] = _gf256_sub(remainder[shift+pos],
+          _gf256_mul(term, b[pos]))
+
+  return (_trim_polynomial(quotient), _trim_polynomial(remainder))
+
+
+
+# evaluates a polynomial at x (unlike _f, x may be 0)
+def _evaluate_polynomial(a, x):
+  accumulator = 0
+  for coefficient in reversed(a):
+    accumulator = _gf256_add(_gf256_mul(accumulator, x), coefficient)
+  return accumulator
+
+
+
+# Works out which shares are wrong, using Reed-Solomon decoding one byte at a
+# time.   A wrong share is almost always wrong in every byte, so usually one
+# byte is enough.   The rest of the shares are then checked against each other
+# (with recover_secret_at_zero from secretobj), and I only move on to the next
+# byte if a wrong share slipped through.   Returns the positions of the wrong
+# shares, or raises a ValueError if there are too many to correct.
+def _locate_bad_shares(secretobj, shares):
+  xs = [share[0] for share in shares]
+
+  badpositions = set()
+  for byte_to_use in range(len(shares[0][1])):
+    result = _gao_decode(xs, [share[1][byte_to_use] for share in shares],
+        secretobj.threshold)
+    if result is None:
+      raise ValueError("Too many shares do not match.   Cannot decode")
+
+    badpositions.update(result[1])
+
+    # Different bytes can blame different shares, but all together they
+    # still can't be more than can be corrected.
+    if 2*len(badpositions) > len(shares) - secretobj.threshold:
+      raise ValueError("Too many shares do not match.   Cannot decode")
+
+    goodshares = [shares[pos] for pos in range(len(shares)) if pos not in
+        badpositions]
+    try:
+      secretobj.recover_secret_at_zero(goodshares)
+    except ValueError:
+      continue
+
+    return sorted(badpositions)
+
+  raise ValueError("Too many shares do not match.   Cannot decode")
 
 
 
@@ -441,10 +982,37 @@ def _gf256_add(a, b):
 def _gf256_sub(a, b):
   return _gf256_add(a, b)
 
+# Multiplication is a lookup in this flat table:  a * b is
+# _GF256_MUL[a << 8 | b].   Row a of it is a times every byte, and
+# _GF256_MULROWS has each row as a string, for bytearray.translate.
+def _build_mul_table():
+  exp = _GF256_EXP[:255] * 2
+  table = bytearray(256)
+  for a in range(1, 256):
+    loga = _GF256_LOG[a]
+    table += bytearray([0] + [exp[loga + _GF256_LOG[b]] for b in range(1, 256)])
+  return table
+
+_GF256_MUL = _build_mul_table()
+_GF256_MULROWS = [str(_GF256_MUL[a << 8:(a+1) << 8]) for a in range(256)]
+
+# x**0, x**1, ..., x**255 for each x I've needed them for
+_GF256_POWERS = {}
+
+def _gf256_powers(x):
+  powers = _GF256_POWERS.get(x)
+  if powers is None:
+    powers = bytearray(256)
+    value = 1
+    for pos in range(256):
+      powers[pos] = value
+      value = _GF256_MUL[value << 8 | x]
+    _GF256_POWERS[x] = powers
+  return powers
+
+
 def _gf256_mul(a, b):
-  if a == 0 or b == 0:
-    return 0
-  return _GF256_EXP[(_GF256_LOG[a] + _GF256_LOG[b]) % 255]
+  return _GF256_MUL[a << 8 | b]
 
 def _gf256_div(a, b):
   if a == 0:
@@ -452,4 +1020,3 @@ def _gf256_div(a, b):
   if b == 0:
     raise ZeroDivisionError
   return _GF256_EXP[(_GF256_LOG[a] - _GF256_LOG[b]) % 255]
-
@@ -0,0 +1,758 @@
+"""
+<Start Date>
+  October 2026
+
+<Description>
+  A local daemon that owns one PolyPasswordHasher and serves logins,
+  account creation and unlocking to the other processes on the host (say,
+  prefork web workers) over a Unix domain socket.   The password file is
+  loaded and unlocked once, rather than once per worker.
+
+  The protocol is a stream of frames in both directions.   Each frame is a
+  header of (request id, body length, op or status), packed as '!IIB', and
+  then the body.   Strings in a body are a '!H' length and the bytes.
+
+    op 1  verify    '!H' count, then count (username, password) pairs
+    op 2  create    '!B' shares, username, password
+    op 3  unlock    like verify, for unlock_password_data
+
+  Responses carry the request's id and a status: 0 (ok), 1 (error, the body
+  is the message) or 2 (busy, the request was shed and not done).   An ok
+  verify body has a '!B' per login: 0 (False), 1 (True), 2 (None, for an
+  account with no entries) or 3 (an error, followed by its message).   A
+  client can send any number of requests without waiting, and responses
+  may come back in a different order.
+
+  Logins from every connection are checked together, up to maxbatch at a
+  time, with is_valid_login_many.   No more than maxpending logins and
+  calls are queued or being worked on at once.   Past that, or if a request
+  has waited longer than maxqueuetime seconds (its client has most likely
+  given up), the request is answered busy right away, so a login storm
+  gets quick refusals instead of ever longer waits.   Unlocking is never
+  shed.
+
+  A client that stops reading its responses is disconnected once a write
+  to it has been stuck for sendtimeout seconds, so it can't hold up the
+  workers that answer everyone else.
+
+  The socket is made so only its owner can use it (socketmode), since
+  anyone who can connect can check passwords.
+
+<Usage>
+  python verificationdaemon.py [options] threshold passwordfile socketpath
+
+  # in a web worker...
+  import verificationdaemon
+
+  client = verificationdaemon.VerificationClient('/run/pph.sock')
+  client.unlock_password_data([('admin','correct horse'), ('root','battery staple')])
+  if client.is_valid_login('alice', 'kitten'):
+    ...
+  client.create_account('bob', 'puppy', 0)
+"""
+
+__license__ = 'MIT'
+__all__ = ['VerificationServer', 'VerificationClient', 'ServerBusyError']
+
+
+import polypasswordhasher
+
+import collections
+import errno
+import optparse
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+
+
+# request id, body length, op (in a request) or status (in a response)
+_HEADER = struct.Struct('!IIB')
+_LENGTH = struct.Struct('!H')
+_BYTE = struct.Struct('!B')
+
+# no body is bigger than this.   A client that sends one is disconnected.
+MAX_BODY_SIZE = 1024 * 1024
+
+VERIFY = 1
+CREATE = 2
+UNLOCK = 3
+
+OK = 0
+ERROR = 1
+BUSY = 2
+
+# the per login results in an ok verify body
+_FALSE = 0
+_TRUE = 1
+_NONE = 2
+_FAILED = 3
+
+
+
+
+class ServerBusyError(Exception):
+  """ The daemon shed the request (it wasn't done), because it had too much
+      work already."""
+
+
+
+
+class VerificationServer(object):
+  """ Serves pph to the clients that connect to socketpath.   workers
+      threads do the work.   See the module description for maxpending,
+      maxqueuetime, maxbatch and sendtimeout."""
+
+  def __init__(self, pph, socketpath, workers = 4, maxpending = 4096,
+      maxqueuetime = 1.0, maxbatch = 64, socketmode = 0o600,
+      sendtimeout = 5.0):
+
+    if workers < 1 or maxpending < 1 or maxbatch < 1:
+      raise ValueError("workers, maxpending and maxbatch must be at least 1")
+
+    self.pph = pph
+    self.socketpath = socketpath
+    self.workers = workers
+    self.maxpending = maxpending
+    self.maxqueuetime = maxqueuetime
+    self.maxbatch = maxbatch
+    self.sendtimeout = sendtimeout
+
+    # how many requests have been shed so far
+    self.shedcount = 0
+
+    self._condition = threading.Condition(threading.Lock())
+    # (connection, requestid, pairs, arrivaltime) for logins that haven't
+    # started...
+    self._pendinglogins = collections.deque()
+    # ...and (connection, requestid, op, args, arrivaltime) for the rest
+    self._pendingcalls = collections.deque()
+    # the logins and calls queued or being worked on
+    self._load = 0
+    self._stopping = False
+
+    self._connections = set()
+    self._threads = []
+
+    self._listener = _listen(socketpath, socketmode)
+
+
+
+  def start(self):
+    """Starts the worker threads and accepting connections, and returns."""
+
+    for num in range(self.workers):
+      self._start_thread(self._work)
+    self._start_thread(self._accept)
+
+
+
+  def serve_forever(self):
+    """Serves until shutdown is called (from a signal handler, say)."""
+
+    self.start()
+    while not self._stopping:
+      # (waiting with a timeout lets signals in)
+      time.sleep(0.5)
+
+
+
+  def shutdown(self):
+    """Stops serving.   Requests that haven't started are dropped."""
+
+    with self._condition:
+      if self._stopping:
+        return
+      self._stopping = True
+      self._condition.notify_all()
+
+    self._listener.close()
+    if os.path.exists(self.socketpath):
+      os.remove(self.socketpath)
+
+    for connection in list(self._connections):
+      connection.close()
+
+    for thread in self._threads:
+      if thread is not threading.current_thread():
+        thread.join()
+
+
+
+  def _start_thread(self, target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    self._threads.append(thread)
+
+
+
+  def _accept(self):
+    while not self._stopping:
+      try:
+        if not select.select([self._listener], [], [], 0.5)[0]:
+          continue
+        (sock, address) = self._listener.accept()
+      except (socket.error, select.error, ValueError):
+        # the listener was closed by shutdown
+        if self._stopping:
+          return
+        raise
+
+      connection = _Connection(sock, self.sendtimeout)
+      self._connections.add(connection)
+      # (readers aren't joined on shutdown; closing their socket ends them)
+      thread = threading.Thread(target=self._read, args=(connection,))
+      thread.daemon = True
+      thread.start()
+
+
+
+  def _read(self, connection):
+    """Reads a connection's requests and queues them."""
+
+    try:
+      while True:
+        header = _recv_exactly(connection.sock, _HEADER.size, eofok = True)
+        if header is None:
+          return
+        (requestid, bodylength, op) = _HEADER.unpack(header)
+        if bodylength > MAX_BODY_SIZE:
+          return
+        body = _recv_exactly(connection.sock, bodylength)
+
+        try:
+          args = _decode_request(op, body)
+        except (ValueError, struct.error) as error:
+          connection.send(requestid, ERROR, "Bad request: "+str(error))
+          continue
+
+        self._admit(connection, requestid, op, args)
+
+    except (socket.error, IOError):
+      pass
+
+    finally:
+      self._connections.discard(connection)
+      connection.close()
+
+
+
+  def _admit(self, connection, requestid, op, args):
+    """Queues a request, or sheds it if there is too much work already."""
+
+    if op == VERIFY:
+      cost = len(args)
+    else:
+      cost = 1
+
+    with self._condition:
+      # A request on its own is always let in, however big, and unlocking is
+      # never shed since it is rare and is what makes logins work at all.
+      shed = (op != UNLOCK and self._load > 0 and
+          self._load + cost > self.maxpending)
+      if shed:
+        self.shedcount += 1
+      else:
+        self._load += cost
+        if op == VERIFY:
+          self._pendinglogins.append((connection, requestid, args, time.time()))
+        else:
+          self._pendingcalls.append((connection, requestid, op, args,
+              time.time()))
+        self._condition.notify()
+
+    if shed:
+      connection.send(requestid, BUSY, '')
+
+
+
+  def _work(self):
+    """A worker thread.   Calls go first, then logins in batches."""
+
+    while True:
+      stale = []
+      call = None
+      logins = []
+
+      with self._condition:
+        while not (self._stopping or self._pendingcalls or
+            self._pendinglogins):
+          self._condition.wait()
+        if self._stopping:
+          return
+
+        now = time.time()
+        if self._pendingcalls:
+          call = self._pendingcalls.popleft()
+          if call[2] != UNLOCK and now - call[4] > self.maxqueuetime:
+            stale.append((call[0], call[1], 1))
+            call = None
+        else:
+          count = 0
+          while self._pendinglogins and (not logins or count +
+              len(self._pendinglogins[0][2]) <= self.maxbatch):
+            request = self._pendinglogins.popleft()
+            if now - request[3] > self.maxqueuetime:
+              stale.append((request[0], request[1], len(request[2])))
+            else:
+              logins.append(request)
+              count += len(request[2])
+        self.shedcount += len(stale)
+
+      responses = [(connection, requestid, BUSY, '') for (connection,
+          requestid, cost) in stale]
+      done = sum([cost for (connection, requestid, cost) in stale])
+
+      if call is not None:
+        responses.append(self._do_call(call))
+        done += 1
+
+      if logins:
+        responses.extend(self._do_logins(logins))
+        done += sum([len(request[2]) for request in logins])
+
+      # the work is done, so it no longer counts by the time a client hears
+      # back and sends more
+      with self._condition:
+        self._load -= done
+
+      for (connection, requestid, status, body) in responses:
+        connection.send(requestid, status, body)
+
+
+
+  def _do_call(self, call):
+    """Does a create or unlock and returns its (connection, requestid,
+       status, body) response."""
+
+    (connection, requestid, op, args, arrivaltime) = call
+
+    try:
+      if op == CREATE:
+        (shares, username, password) = args
+        self.pph.create_account(username, password, shares)
+      else:
+        self.pph.unlock_password_data(args)
+    except ValueError as error:
+      return (connection, requestid, ERROR, str(error))
+    except Exception as error:
+      # keep serving the others, but say what went wrong
+      return (connection, requestid, ERROR,
+          type(error).__name__+": "+str(error))
+    return (connection, requestid, OK, '')
+
+
+
+  def _do_logins(self, logins):
+    """Checks the logins from several requests in one go and returns their
+       responses."""
+
+    pairs = []
+    for (connection, requestid, requestpairs, arrivaltime) in logins:
+      pairs.extend(requestpairs)
+
+    results = self.pph.check_logins(pairs)
+
+    responses = []
+    pos = 0
+    for (connection, requestid, requestpairs, arrivaltime) in logins:
+      responses.append((connection, requestid, OK, _encode_results(
+          results[pos:pos+len(requestpairs)])))
+      pos += len(requestpairs)
+    return responses
+
+
+
+
+class VerificationClient(object):
+  """ Talks to a VerificationServer.   Connections are kept (up to poolsize
+      idle ones) and reused, and any number of threads can share a client.
+      is_valid_login_many sends its logins in batches of batchsize, with up
+      to window of them on the way at once."""
+
+  def __init__(self, socketpath, poolsize = 4, timeout = 10.0, batchsize = 64,
+      window = 4):
+
+    if poolsize < 0 or batchsize < 1 or window < 1:
+      raise ValueError("poolsize must be at least 0, batchsize and window at least 1")
+
+    self.socketpath = socketpath
+    self.poolsize = poolsize
+    self.timeout = timeout
+    self.batchsize = batchsize
+    self.window = window
+
+    self._poollock = threading.Lock()
+    self._pool = []
+
+
+
+  def is_valid_login(self, username, password):
+    """ Like PolyPasswordHasher.is_valid_login.   Raises ServerBusyError if
+        the login was shed."""
+    return self.is_valid_login_many([(username, password)])[0]
+
+
+
+  def is_valid_login_many(self, pairs):
+    """ Like PolyPasswordHasher.is_valid_login_many.   Raises a ValueError
+        for the first login that had one, and ServerBusyError if any batch
+        was shed."""
+
+    requests = []
+    for pos in range(0, len(pairs), self.batchsize):
+      requests.append((VERIFY, _encode_pairs(pairs[pos:pos+self.batchsize])))
+
+    results = []
+    for (status, body) in self._exchange(requests):
+      _check_status(status, body)
+      results.extend(_decode_results(body))
+
+    for (result, error) in results:
+      if error is not None:
+        raise ValueError(error)
+    return [result for (result, error) in results]
+
+
+
+  def create_account(self, username, password, shares):
+    """ Like PolyPasswordHasher.create_account."""
+
+    if shares>255 or shares<0:
+      raise ValueError("Invalid number of shares: "+str(shares)+".")
+
+    body = _BYTE.pack(shares) + _encode_string(username) + \
+        _encode_string(password)
+    [(status, body)] = self._exchange([(CREATE, body)])
+    _check_status(status, body)
+
+
+
+  def unlock_password_data(self, logindata):
+    """ Like PolyPasswordHasher.unlock_password_data."""
+
+    [(status, body)] = self._exchange([(UNLOCK, _encode_pairs(logindata))])
+    _check_status(status, body)
+
+
+
+  def close(self):
+    """Closes the idle connections."""
+
+    with self._poollock:
+      pool = self._pool
+      self._pool = []
+    for sock in pool:
+      sock.close()
+
+
+
+  def _exchange(self, requests):
+    """Sends (op, body) requests down one connection, with up to window of
+       them unanswered at a time, and returns their (status, body)
+       responses in order."""
+
+    sock = None
+    with self._poollock:
+      if self._pool:
+        sock = self._pool.pop()
+    if sock is None:
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      sock.settimeout(self.timeout)
+      sock.connect(self.socketpath)
+
+    responses = [None] * len(requests)
+    try:
+      sent = 0
+      received = 0
+      while received < len(requests):
+        # keep the window full...
+        frames = []
+        while sent < len(requests) and sent - received < self.window:
+          (op, body) = requests[sent]
+          frames.append(_HEADER.pack(sent, len(body), op) + body)
+          sent += 1
+        if frames:
+          sock.sendall(''.join(frames))
+
+        # ...and then wait for an answer
+        (requestid, bodylength, status) = _HEADER.unpack(
+            _recv_exactly(sock, _HEADER.size))
+        body = _recv_exactly(sock, bodylength)
+        if requestid >= sent or responses[requestid] is not None:
+          raise IOError("Unexpected response from the verification server")
+        responses[requestid] = (status, body)
+        received += 1
+
+    except:
+      # I can't tell what is left on the connection, so it can't be reused
+      sock.close()
+      raise
+
+    with self._poollock:
+      if len(self._pool) < self.poolsize:
+        self._pool.append(sock)
+        sock = None
+    if sock is not None:
+      sock.close()
+
+    return responses
+
+
+
+
+class _Connection(object):
+  """ A client's socket.   Workers answer its requests in whatever order
+      they finish, so the writes are locked."""
+
+  def __init__(self, sock, sendtimeout):
+    self.sock = sock
+    self._writelock = threading.Lock()
+    self._closed = False
+
+    # Only the writes time out.   (A timeout on the socket itself would
+    # also end the reads, which wait as long as the client is quiet.)
+    seconds = int(sendtimeout)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack('ll',
+        seconds, int((sendtimeout - seconds) * 1000000)))
+
+
+
+  def send(self, requestid, status, body):
+    with self._writelock:
+      if self._closed:
+        return
+      try:
+        self.sock.sendall(_HEADER.pack(requestid, len(body), status) + body)
+      except socket.error:
+        # The client has gone, or has stopped reading and the write timed
+        # out.   Either way, I drop it (which ends its reader too).
+        self._closed = True
+        try:
+          self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+          pass
+
+
+
+  def close(self):
+    with self._writelock:
+      self._closed = True
+    try:
+      self.sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+      pass
+    self.sock.close()
+
+
+
+
+def _listen(socketpath, socketmode):
+  """Returns a socket listening at socketpath, replacing a socket file left
+     behind by a daemon that is no longer running."""
+
+  if os.path.exists(socketpath):
+    if not stat.S_ISSOCK(os.stat(socketpath).st_mode):
+      raise ValueError("'"+socketpath+"' exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      probe.connect(socketpath)
+    except socket.error:
+      os.remove(socketpath)
+    else:
+      raise ValueError("A server is already listening at '"+socketpath+"'")
+    finally:
+      probe.close()
+
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  # no one else may connect, even for a moment before the chmod
+  oldumask = os.umask(0o777 & ~socketmode)
+  try:
+    listener.bind(socketpath)
+  finally:
+    os.umask(oldumask)
+  os.chmod(socketpath, socketmode)
+  listener.listen(128)
+  return listener
+
+
+
+
+def _recv_exactly(sock, size, eofok = False):
+  """Reads size bytes from sock.   If the other end closes before the first
+     byte, returns None when eofok, and otherwise raises IOError."""
+
+  pieces = []
+  remaining = size
+  while remaining:
+    try:
+      piece = sock.recv(remaining)
+    except socket.error as error:
+      if error.args[0] == errno.EINTR:
+        continue
+      raise
+    if not piece:
+      if eofok and remaining == size:
+        return None
+      raise IOError("Connection closed by the other end")
+    pieces.append(piece)
+    remaining -= len(piece)
+  return ''.join(pieces)
+
+
+
+
+def _encode_string(string):
+  if len(string) > 0xffff:
+    raise ValueError("Usernames and passwords must be under 64KB")
+  return _LENGTH.pack(len(string)) + string
+
+
+
+def _decode_string(body, pos):
+  """Returns the string at pos in body and the position after it."""
+
+  (length,) = _LENGTH.unpack_from(body, pos)
+  pos += _LENGTH.size
+  if pos + length > len(body):
+    raise ValueError("String runs past the end of the request")
+  return (body[pos:pos+length], pos + length)
+
+
+
+def _encode_pairs(pairs):
+  if len(pairs) > 0xffff:
+    raise ValueError("Too many logins in one request")
+  pieces = [_LENGTH.pack(len(pairs))]
+  for (username, password) in pairs:
+    pieces.append(_encode_string(username))
+    pieces.append(_encode_string(password))
+  return ''.join(pieces)
+
+
+
+def _decode_pairs(body):
+  (count,) = _LENGTH.unpack_from(body, 0)
+  pos = _LENGTH.size
+  pairs = []
+  for num in range(count):
+    (username, pos) = _decode_string(body, pos)
+    (password, pos) = _decode_string(body, pos)
+    pairs.append((username, password))
+  return (pairs, pos)
+
+
+
+def _decode_request(op, body):
+  """Returns the arguments of a request: the pairs for a verify or unlock,
+     and (shares, username, password) for a create."""
+
+  if op == VERIFY or op == UNLOCK:
+    (args, pos) = _decode_pairs(body)
+  elif op == CREATE:
+    (shares,) = _BYTE.unpack_from(body, 0)
+    (username, pos) = _decode_string(body, _BYTE.size)
+    (password, pos) = _decode_string(body, pos)
+    args = (shares, username, password)
+  else:
+    raise ValueError("Unknown op "+str(op))
+
+  if pos != len(body):
+    raise ValueError("Extra bytes at the end of the request")
+  return args
+
+
+
+def _encode_results(results):
+  pieces = []
+  for (result, error) in results:
+    if error is not None:
+      pieces.append(_BYTE.pack(_FAILED) + _encode_string(str(error)[:0xffff]))
+    elif result is None:
+      pieces.append(_BYTE.pack(_NONE))
+    elif result:
+      pieces.append(_BYTE.pack(_TRUE))
+    else:
+      pieces.append(_BYTE.pack(_FALSE))
+  return ''.join(pieces)
+
+
+
+def _decode_results(body):
+  """Returns a (result, error message) for each login in a verify body."""
+
+  results = []
+  pos = 0
+  while pos < len(body):
+    (code,) = _BYTE.unpack_from(body, pos)
+    pos += _BYTE.size
+    if code == _FAILED:
+      (message, pos) = _decode_string(body, pos)
+      results.append((None, message))
+    else:
+      results.append(({_FALSE: False, _TRUE: True, _NONE: None}[code], None))
+  return results
+
+
+
+def _check_status(status, body):
+  if status == BUSY:
+    raise ServerBusyError("The verification server is too busy")
+  if status == ERROR:
+    raise ValueError(body)
+  if status != OK:
+    raise IOError("Unknown status "+str(status)+" from the verification server")
+
+
+
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(
+      usage = "python verificationdaemon.py [options] threshold passwordfile socketpath")
+  parser.add_option('-w', '--workers', type = 'int', default = 4,
+      help = "number of worker threads")
+  parser.add_option('-q', '--max-pending', type = 'int', default = 4096,
+      help = "most logins and calls queued or being worked on before "
+      "requests are shed")
+  parser.add_option('-t', '--max-queue-time', type = 'float', default = 1.0,
+      help = "seconds a request may wait before it is shed")
+  parser.add_option('-b', '--max-batch', type = 'int', default = 64,
+      help = "most logins checked in one go")
+  parser.add_option('-s', '--send-timeout', type = 'float', default = 5.0,
+      help = "seconds a response may be stuck before its client is dropped")
+  parser.add_option('-i', '--isolated-check-bits', type = 'int', default = 0,
+      help = "isolated check bytes per account")
+  parser.add_option('-n', '--no-journal', action = 'store_true',
+      default = False, help = "don't journal new accounts to the password file")
+  (options, args) = parser.parse_args()
+
+  if len(args) != 3:
+    parser.print_usage()
+    sys.exit(1)
+
+  pph = polypasswordhasher.PolyPasswordHasher(threshold = int(args[0]),
+      passwordfile = args[1], isolated_check_bits = options.isolated_check_bits)
+  if not options.no_journal:
+    # so accounts created through the daemon outlive it
+    pph.use_journal(args[1])
+
+  server = VerificationServer(pph, args[2], options.workers,
+      options.max_pending, options.max_queue_time, options.max_batch,
+      sendtimeout = options.send_timeout)
+
+  def stop(signalnumber, frame):
+    server.shutdown()
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+
+  try:
+    server.serve_forever()
+  finally:
+    server.shutdown()
+    pph.close_journal()
@@ -24,5 +24,10 @@ setup(	name="PolyPasswordHasher",
     author="Justin Cappos",
     author_email="jcappos@poly.edu",
     packages=["polypasswordhasher"],
+    install_requires=["pycrypto"],
+    # the scrypt and blake2b hash engines, and asyncpph, on Python 2
+    extras_require={"scrypt": ["scrypt"], "blake2": ["pyblake2"],
+        "async": ["trollius"]},
+    tests_require=["trollius"],
     test_suite="test.runtests"
 )
@@ -7,8 +7,18 @@
 
 <Description>
   A wrapper for fast C operations for polynomial math for PolyPasswordHasher.
-  Specifically, I have two external interfaces: computing f(x) and
-  doing full Lagrange interpolation.   I do this for polynomials in GF256
+  Specifically, I have external interfaces for computing f(x),
+  computing many shares at once, doing full Lagrange interpolation for
+  one byte or for every byte of a set of shares, evaluating the
+  polynomials through a set of shares at given points, and building an
+  interpolation incrementally (in Newton form) one share at a time.   There
+  is also a word at a time XOR of two buffers into a third, which is how
+  password hashes and shares are combined, and a login check (SHA-256, XOR
+  and compare) that runs without the GIL so logins can be checked on many
+  threads at once, and SHA-256 of a batch of salted passwords (eight at a
+  time with AVX2, if the CPU has it).   The heavy lifting is done with
+  vector multiply-adds (SSSE3, AVX2 or NEON, whichever the CPU has, or a
+  table lookup loop).   I do this for polynomials in GF256
   using x^8 + x^4 + x^3 + x + 1 as multiplication and XOR for addition.   
   This was chosen because it's used in tss and AES.
 
@@ -17,6 +27,21 @@
 #include "Python.h"
 #include "fastpolymath.h"
 
+#include <stdint.h>
+#include <string.h>
+
+// The SIMD code is compiled for any x86 (and used if the CPU turns out to
+// have the instructions) or for ARM64, which always has NEON.
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#define _HAVE_X86_SIMD 1
+#include <immintrin.h>
+#endif
+
+#if defined(__aarch64__) && defined(__ARM_NEON)
+#define _HAVE_NEON 1
+#include <arm_neon.h>
+#endif
+
 
 
 
@@ -147,11 +172,15 @@ static inline gf256 _gf256_sub(gf256 a, gf256 b) {
 }
 
 
+// _GF256_EXP twice over (filled in by initfastpolymath_c), so that the sum
+// of two logs can be looked up without taking it mod 255.
+static gf256 _GF256_EXP2[512];
+
 static inline gf256 _gf256_mul(gf256 a, gf256 b) {
   if ((a==0)||(b==0)) {
     return 0;
   }
-  return _GF256_EXP[(_GF256_LOG[a] + _GF256_LOG[b]) % 255];
+  return _GF256_EXP2[_GF256_LOG[a] + _GF256_LOG[b]];
 }
 
 
@@ -163,8 +192,173 @@ static inline gf256 _gf256_div(gf256 a, gf256 b) {
     printf("Error!   Cannot divide by zero!\n");
     exit(1);
   }
-  // mod in C will return a negative!
-  return _GF256_EXP[(255+_GF256_LOG[a] - _GF256_LOG[b]) % 255];
+  // (this is never negative)
+  return _GF256_EXP2[255+_GF256_LOG[a] - _GF256_LOG[b]];
+}
+
+
+
+
+// ***********************  GF256 vector kernels  ************************
+
+// Most of the work is multiplying a whole vector of bytes by one constant
+// (and adding it to another).   I do that with the split nibble method:
+// c * s = c * (s & 0x0f) ^ c * (s & 0xf0), and each half is a lookup in a 16
+// entry table, which SSSE3 / AVX2 / NEON can do for a whole vector of bytes
+// at once with one shuffle.   _GF256_NIBBLE[c] is the two tables for c (the
+// low nibbles then the high ones), filled in by initfastpolymath_c.
+static gf256 _GF256_NIBBLE[256][32];
+
+// dest[i] = src[i] * c, or dest[i] ^= src[i] * c if accumulate.   dest and
+// src can be the same.
+typedef void (*_gf256_region_function)(gf256 *dest, const gf256 *src,
+        gf256 c, Py_ssize_t length, int accumulate);
+
+
+static void _gf256_region_scalar(gf256 *dest, const gf256 *src, gf256 c,
+        Py_ssize_t length, int accumulate) {
+  const gf256 *low = _GF256_NIBBLE[c];
+  const gf256 *high = _GF256_NIBBLE[c] + 16;
+  Py_ssize_t i;
+
+  if (accumulate) {
+    for (i=0; i<length; i++) {
+      dest[i] ^= low[src[i] & 0x0f] ^ high[src[i] >> 4];
+    }
+  }
+  else {
+    for (i=0; i<length; i++) {
+      dest[i] = low[src[i] & 0x0f] ^ high[src[i] >> 4];
+    }
+  }
+}
+
+
+#ifdef _HAVE_X86_SIMD
+
+__attribute__((target("ssse3")))
+static void _gf256_region_ssse3(gf256 *dest, const gf256 *src, gf256 c,
+        Py_ssize_t length, int accumulate) {
+  __m128i low = _mm_loadu_si128((const __m128i *)_GF256_NIBBLE[c]);
+  __m128i high = _mm_loadu_si128((const __m128i *)(_GF256_NIBBLE[c] + 16));
+  __m128i mask = _mm_set1_epi8(0x0f);
+  __m128i bytes, product;
+  Py_ssize_t i;
+
+  for (i=0; i+16<=length; i+=16) {
+    bytes = _mm_loadu_si128((const __m128i *)(src + i));
+    product = _mm_xor_si128(_mm_shuffle_epi8(low, _mm_and_si128(bytes, mask)),
+        _mm_shuffle_epi8(high, _mm_and_si128(_mm_srli_epi64(bytes, 4), mask)));
+    if (accumulate) {
+      product = _mm_xor_si128(product, _mm_loadu_si128((const __m128i *)(dest + i)));
+    }
+    _mm_storeu_si128((__m128i *)(dest + i), product);
+  }
+
+  _gf256_region_scalar(dest + i, src + i, c, length - i, accumulate);
+}
+
+
+__attribute__((target("avx2")))
+static void _gf256_region_avx2(gf256 *dest, const gf256 *src, gf256 c,
+        Py_ssize_t length, int accumulate) {
+  // the shuffle works within each 16 byte half, so both get the tables
+  __m256i low = _mm256_broadcastsi128_si256(
+      _mm_loadu_si128((const __m128i *)_GF256_NIBBLE[c]));
+  __m256i high = _mm256_broadcastsi128_si256(
+      _mm_loadu_si128((const __m128i *)(_GF256_NIBBLE[c] + 16)));
+  __m256i mask = _mm256_set1_epi8(0x0f);
+  __m256i bytes, product;
+  Py_ssize_t i;
+
+  for (i=0; i+32<=length; i+=32) {
+    bytes = _mm256_loadu_si256((const __m256i *)(src + i));
+    product = _mm256_xor_si256(
+        _mm256_shuffle_epi8(low, _mm256_and_si256(bytes, mask)),
+        _mm256_shuffle_epi8(high,
+        _mm256_and_si256(_mm256_srli_epi64(bytes, 4), mask)));
+    if (accumulate) {
+      product = _mm256_xor_si256(product,
+          _mm256_loadu_si256((const __m256i *)(dest + i)));
+    }
+    _mm256_storeu_si256((__m256i *)(dest + i), product);
+  }
+
+  _gf256_region_scalar(dest + i, src + i, c, length - i, accumulate);
+}
+
+#endif
+
+
+#ifdef _HAVE_NEON
+
+static void _gf256_region_neon(gf256 *dest, const gf256 *src, gf256 c,
+        Py_ssize_t length, int accumulate) {
+  uint8x16_t low = vld1q_u8(_GF256_NIBBLE[c]);
+  uint8x16_t high = vld1q_u8(_GF256_NIBBLE[c] + 16);
+  uint8x16_t mask = vdupq_n_u8(0x0f);
+  uint8x16_t bytes, product;
+  Py_ssize_t i;
+
+  for (i=0; i+16<=length; i+=16) {
+    bytes = vld1q_u8(src + i);
+    product = veorq_u8(vqtbl1q_u8(low, vandq_u8(bytes, mask)),
+        vqtbl1q_u8(high, vshrq_n_u8(bytes, 4)));
+    if (accumulate) {
+      product = veorq_u8(product, vld1q_u8(dest + i));
+    }
+    vst1q_u8(dest + i, product);
+  }
+
+  _gf256_region_scalar(dest + i, src + i, c, length - i, accumulate);
+}
+
+#endif
+
+
+// the best of the above for this CPU (set in initfastpolymath_c)
+static _gf256_region_function _gf256_region = _gf256_region_scalar;
+static const char *_gf256_kernel_name = "scalar";
+
+// dest[i] ^= src[i] * c
+#define _gf256_muladd_region(dest, src, c, length) \
+    _gf256_region((dest), (src), (c), (length), 1)
+
+// dest[i] = src[i] * c
+#define _gf256_mul_region(dest, src, c, length) \
+    _gf256_region((dest), (src), (c), (length), 0)
+
+
+static void _init_gf256_tables(void) {
+  int c, i;
+
+  for (i=0; i<512; i++) {
+    _GF256_EXP2[i] = _GF256_EXP[i % 255];
+  }
+
+  for (c=0; c<256; c++) {
+    for (i=0; i<16; i++) {
+      _GF256_NIBBLE[c][i] = _gf256_mul(c, i);
+      _GF256_NIBBLE[c][16+i] = _gf256_mul(c, i << 4);
+    }
+  }
+
+#ifdef _HAVE_X86_SIMD
+  __builtin_cpu_init();
+  if (__builtin_cpu_supports("avx2")) {
+    _gf256_region = _gf256_region_avx2;
+    _gf256_kernel_name = "avx2";
+  }
+  else if (__builtin_cpu_supports("ssse3")) {
+    _gf256_region = _gf256_region_ssse3;
+    _gf256_kernel_name = "ssse3";
+  }
+#endif
+
+#ifdef _HAVE_NEON
+  _gf256_region = _gf256_region_neon;
+  _gf256_kernel_name = "neon";
+#endif
 }
 
 
@@ -182,37 +376,89 @@ static inline gf256 _gf256_div(gf256 a, gf256 b) {
 
 
 
-// Python wrapper...
+// Every input below can be any buffer (a string, bytearray, memoryview,
+// array, ...) so the caller needn't copy anything into a string first.
+// Functions that build a result also take an optional writable buffer,
+// out, to put it in (and then return None), so a caller can reuse one
+// rather than get a new string every call.
+
+// Points result at a new string of length bytes, or at None if the
+// caller passed out (which must be long enough), and returns where to
+// write.   Returns NULL with an exception set on failure.
+static gf256 *_result_buffer(PyObject **result, Py_buffer *out, int hasout,
+        Py_ssize_t length) {
+  if (hasout) {
+    if (out->len < length) {
+      PyErr_SetString(PyExc_ValueError, "out is too short for the result");
+      return NULL;
+    }
+    Py_INCREF(Py_None);
+    *result = Py_None;
+    return (gf256 *)out->buf;
+  }
+
+  *result = PyString_FromStringAndSize(NULL, length);
+  if (*result == NULL) {
+    return NULL;
+  }
+  return (gf256 *)PyString_AS_STRING(*result);
+}
+
+
+// Checks that the xs are unique, so I never divide by zero.   seen gets a
+// flag for each x.
+static int _check_unique_xs(gf256 *xs, Py_ssize_t length, char *seen) {
+  Py_ssize_t i;
+
+  memset(seen, 0, 256);
+  for (i=0; i<length; i++) {
+    if (seen[xs[i]]) {
+      PyErr_SetString(PyExc_ValueError, "xs must be unique");
+      return 0;
+    }
+    seen[xs[i]] = 1;
+  }
+  return 1;
+}
+
+
+
+
+// Python wrapper...   x is an int and coefficients a buffer.
 static PyObject *f(PyObject *module, PyObject *args) {
-  gf256 x;
+  int x;
+  Py_buffer coefs;
   gf256 *coefs_bytes;
-  int coefs_length;
+  gf256 accumulator;
+  gf256 x_i;
+  Py_ssize_t i;
 
-  if (!PyArg_ParseTuple(args, "cs#", &x,&coefs_bytes,&coefs_length)) {
+  if (!PyArg_ParseTuple(args, "is*", &x, &coefs)) {
     // Incorrect args...
     return NULL;
   }
 
   // The share should not be 0.
-  if (x == 0) {
-    PyErr_SetString(PyExc_ValueError, "invalid share index value, cannot be 0");
+  if (x <= 0 || x > 255) {
+    PyBuffer_Release(&coefs);
+    PyErr_SetString(PyExc_ValueError, "invalid share index value, must be 1 to 255");
     return NULL;
   }
 
-  gf256 accumulator;
-  gf256 x_i;
-  int i;
+  coefs_bytes = (gf256 *)coefs.buf;
 
   accumulator = 0;
   // start with x_i = 1.   We'll multiply by x each time around to increase it.
   x_i = 1;
-  for (i=0; i<coefs_length; i++) {
+  for (i=0; i<coefs.len; i++) {
     // we multiply this byte (a,b, or c) with x raised to the right power.
     accumulator = _gf256_add(accumulator, _gf256_mul(coefs_bytes[i], x_i));
     // raise x_i to the next power by multiplying by x.
     x_i = _gf256_mul(x_i, x);
   }
 
+  PyBuffer_Release(&coefs);
+
   return Py_BuildValue("i",accumulator);
 
 }
@@ -220,120 +466,570 @@ static PyObject *f(PyObject *module, PyObject *args) {
 
 
 
+// Python wrapper...   This evaluates every byte's polynomial at every x in one
+// call so that a share (or many shares) doesn't cost a round trip per byte.
+static PyObject *compute_shares(PyObject *module, PyObject *args) {
+  // The args are xs (an array of gf256s), the coefficients for all of the
+  // bytes (one row of row_length gf256s per secret byte, back to back),
+  // row_length and (optionally) out.
+  Py_buffer xsbuffer, coefficientsbuffer, out;
+  gf256 *xs, *coefficients, *shares, *columns, *thisshare;
+  int row_length;
+  Py_ssize_t rows, i, j, k;
+  gf256 x_powers[256];
+  int hasout = PyTuple_GET_SIZE(args) > 3;
+  PyObject *result = NULL;
+
+  if (!PyArg_ParseTuple(args, "s*s*i|w*", &xsbuffer, &coefficientsbuffer,
+        &row_length, &out)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  xs = (gf256 *)xsbuffer.buf;
+  coefficients = (gf256 *)coefficientsbuffer.buf;
+
+  // 256 because this is the max coefficients possible in GF256
+  if ((row_length <= 0) || (row_length > 256) ||
+      (coefficientsbuffer.len % row_length != 0)) {
+    PyErr_SetString(PyExc_ValueError, "coefficients must be whole rows of row_length bytes");
+    goto done;
+  }
+
+  rows = coefficientsbuffer.len / row_length;
+
+  for (i=0; i<xsbuffer.len; i++) {
+    // A share should not be 0.
+    if (xs[i] == 0) {
+      PyErr_SetString(PyExc_ValueError, "invalid share index value, cannot be 0");
+      goto done;
+    }
+  }
+
+  // The shares come back one after another, each with one byte per row.
+  shares = _result_buffer(&result, &out, hasout, xsbuffer.len * rows);
+  if (shares == NULL) {
+    goto done;
+  }
+
+  // A share is the sum of each power of x times a column of the
+  // coefficients (the kth one of every row).   I lay the columns out one
+  // after another so each term is one vector multiply-add.
+  columns = PyMem_Malloc(row_length * rows + 1);
+  if (columns == NULL) {
+    Py_CLEAR(result);
+    PyErr_NoMemory();
+    goto done;
+  }
+  for (j=0; j<rows; j++) {
+    for (k=0; k<row_length; k++) {
+      columns[k*rows + j] = coefficients[j*row_length + k];
+    }
+  }
+
+  // This only touches the buffers (which can't be resized while I hold
+  // them), so other threads can run meanwhile.
+  Py_BEGIN_ALLOW_THREADS
+
+  for (i=0; i<xsbuffer.len; i++) {
+    // The powers of x are the same for every row, so compute them once.
+    x_powers[0] = 1;
+    for (k=1; k<row_length; k++) {
+      x_powers[k] = _gf256_mul(x_powers[k-1], xs[i]);
+    }
+
+    // x^0 is 1, so the first column goes in as it is
+    thisshare = shares + i*rows;
+    memmove(thisshare, columns, rows);
+    for (k=1; k<row_length; k++) {
+      _gf256_muladd_region(thisshare, columns + k*rows, x_powers[k], rows);
+    }
+  }
+
+  Py_END_ALLOW_THREADS
+
+  PyMem_Free(columns);
+
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&coefficientsbuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
+
+}
+
+
+
+
 static PyObject *full_lagrange(PyObject *module, PyObject *args) {
-  // The args are xs (an array of gf256s) and fxs (also an array of gf256s).  
- 
-  gf256 *xs;  
-  gf256 *fxs;  
-  int length;
-  int i, j;
+  // The args are xs (an array of gf256s), fxs (also an array of gf256s) and
+  // (optionally) out.
 
-  // 256 because this is the max shares possible in GF256
-  // This is copied out, so it's okay this is a local variable.
-  gf256 returnedcoefficients[256];
-  gf256 temppolynomial[256];
+  Py_buffer xsbuffer, fxsbuffer, out;
+  gf256 *xs, *fxs, *basis, *returnedcoefficients;
+  Py_ssize_t length, i;
+  char seen[256];
+  int hasout = PyTuple_GET_SIZE(args) > 2;
+  PyObject *result = NULL;
 
-  if (!PyArg_ParseTuple(args, "ss#", &xs,&fxs, &length)) {
+  if (!PyArg_ParseTuple(args, "s*s*|w*", &xsbuffer, &fxsbuffer, &out)) {
     // Incorrect args...
     return NULL;
   }
 
+  xs = (gf256 *)xsbuffer.buf;
+  fxs = (gf256 *)fxsbuffer.buf;
+  length = fxsbuffer.len;
 
-  // clear out the returned area
-  for (i=0; i<length; i++){
-    returnedcoefficients[i] = 0;
+  // 256 because this is the max shares possible in GF256
+  if ((length <= 0) || (length > 256) || (xsbuffer.len < length)) {
+    PyErr_SetString(PyExc_ValueError, "must have between 1 and 256 f(x)s (and an x for each)");
+    goto done;
   }
 
-  gf256 denominator;
+  if (!_check_unique_xs(xs, length, seen)) {
+    goto done;
+  }
+
+  // basis[i*length + k] is the kth coefficient of the ith basis polynomial.
+  basis = PyMem_Malloc(length * length);
+  if (basis == NULL) {
+    PyErr_NoMemory();
+    goto done;
+  }
 
-  // This will hold one term...
-  gf256 this_term[2];
+  returnedcoefficients = _result_buffer(&result, &out, hasout, length);
+  if (returnedcoefficients == NULL) {
+    PyMem_Free(basis);
+    goto done;
+  }
 
-  // we need to compute:
-  // l_0 =  (x - x_1) / (x_0 - x_1)   *   (x - x_2) / (x_0 - x_2) * ...
-  // l_1 =  (x - x_0) / (x_1 - x_0)   *   (x - x_2) / (x_1 - x_2) * ...
-  // ...
+  _lagrange_basis(xs, length, basis);
+
+  // clear out the returned area
+  memset(returnedcoefficients, 0, length);
 
   for (i=0; i<length;i++) {
-    // Zero this out (except the first position).   I'm multiplying and
-    // accumulating the value so want to start with 1, not 0.
-    temppolynomial[0] = 1;
-    for (j=1; j<length;j++) {
-      temppolynomial[j] = 0;
+    // take the ith basis polynomial, multiply it by the result of f(x) and
+    // add it in
+    _gf256_muladd_region(returnedcoefficients, basis + i*length, fxs[i],
+        length);
+  }
+
+  PyMem_Free(basis);
+
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&fxsbuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
+
+}
+
+
+
+
+// Python wrapper...   This does full Lagrange for every byte of a set of
+// shares at once.   The basis polynomials only depend on the xs, so they are
+// built once and then applied to every byte's f(x)s.
+static PyObject *full_lagrange_many(PyObject *module, PyObject *args) {
+  // The args are xs (an array of gf256s), the share data (one row of
+  // share_length gf256s per x, back to back) and (optionally) out.
+
+  Py_buffer xsbuffer, sharedatabuffer, out;
+  gf256 *xs, *sharedata, *basis, *coefficients;
+  Py_ssize_t length, share_length, i, j;
+  char seen[256];
+  int hasout = PyTuple_GET_SIZE(args) > 2;
+  PyObject *result = NULL;
+
+  if (!PyArg_ParseTuple(args, "s*s*|w*", &xsbuffer, &sharedatabuffer, &out)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  xs = (gf256 *)xsbuffer.buf;
+  length = xsbuffer.len;
+  sharedata = (gf256 *)sharedatabuffer.buf;
+
+  // 256 because this is the max shares possible in GF256
+  if ((length <= 0) || (length > 256) || (sharedatabuffer.len % length != 0)) {
+    PyErr_SetString(PyExc_ValueError, "share data must be one whole row per x");
+    goto done;
+  }
+
+  // Equal xs would make me divide by zero below...
+  if (!_check_unique_xs(xs, length, seen)) {
+    goto done;
+  }
+
+  share_length = sharedatabuffer.len / length;
+
+  // basis[i*length + k] is the kth coefficient of the ith basis polynomial.
+  basis = PyMem_Malloc(length * length);
+  if (basis == NULL) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  // The coefficients come back one row per byte of the shares.
+  coefficients = _result_buffer(&result, &out, hasout, share_length * length);
+  if (coefficients == NULL) {
+    PyMem_Free(basis);
+    goto done;
+  }
+
+  _lagrange_basis(xs, length, basis);
+
+  // coefficients = (f(x)s as a share_length x length matrix) * basis.   A
+  // byte's row of coefficients is the sum of the basis polynomials, each
+  // times that byte's f(x), so it is built a whole row at a time.
+  memset(coefficients, 0, share_length * length);
+  for (j=0; j<share_length; j++) {
+    for (i=0; i<length; i++) {
+      _gf256_muladd_region(coefficients + j*length, basis + i*length,
+          sharedata[i*share_length + j], length);
     }
+  }
 
-    // take the terms one at a time.
-    // I'll calculate the denominator and use it to compute the polynomial.
-    for (j=0; j<length; j++) {
+  PyMem_Free(basis);
+
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&sharedatabuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
+
+}
+
+
+
+// Python wrapper...   This evaluates the polynomials that go through a set of
+// shares at some other points without ever building their coefficients.   At
+// point 0 this gives the secret.   At the x of some other share it gives what
+// that share must be if it is consistent with these ones.
+static PyObject *lagrange_at(PyObject *module, PyObject *args) {
+  // The args are xs (an array of gf256s), the share data (one row of
+  // share_length gf256s per x, back to back), the points (an array of
+  // gf256s) to evaluate at and (optionally) out.
+
+  Py_buffer xsbuffer, sharedatabuffer, pointsbuffer, out;
+  gf256 *xs, *sharedata, *points, *results;
+  Py_ssize_t length, share_length, i, j, p;
+  char seen[256];
+  int hasout = PyTuple_GET_SIZE(args) > 3;
+  PyObject *result = NULL;
+
+  // 256 because this is the max shares possible in GF256
+  gf256 inversedenominators[256];
+  gf256 weights[256];
+  gf256 denominator;
+  gf256 product;
+
+  if (!PyArg_ParseTuple(args, "s*s*s*|w*", &xsbuffer, &sharedatabuffer,
+        &pointsbuffer, &out)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  xs = (gf256 *)xsbuffer.buf;
+  length = xsbuffer.len;
+  sharedata = (gf256 *)sharedatabuffer.buf;
+  points = (gf256 *)pointsbuffer.buf;
+
+  if ((length <= 0) || (length > 256) || (sharedatabuffer.len % length != 0)) {
+    PyErr_SetString(PyExc_ValueError, "share data must be one whole row per x");
+    goto done;
+  }
 
-      // Skip i=j because that's how Lagrange works...
+  // Equal xs would make me divide by zero below...
+  if (!_check_unique_xs(xs, length, seen)) {
+    goto done;
+  }
+
+  share_length = sharedatabuffer.len / length;
+
+  results = _result_buffer(&result, &out, hasout,
+      pointsbuffer.len * share_length);
+  if (results == NULL) {
+    goto done;
+  }
+
+  // The denominators of the basis polynomials only depend on the xs:
+  // 1 / ((x_i - x_0) * (x_i - x_1) * ...)
+  for (i=0; i<length; i++) {
+    denominator = 1;
+    for (j=0; j<length; j++) {
       if (i==j) {
         continue;
       }
+      denominator = _gf256_mul(denominator, _gf256_sub(xs[i],xs[j]));
+    }
+    inversedenominators[i] = _GF256_INV[denominator];
+  }
+
+  for (p=0; p<pointsbuffer.len; p++) {
+
+    // l_i(point) = product of (point - x_j) for j != i, over the denominator.
+    // If the point is one of the xs, that basis polynomial is 1 and the
+    // others are 0.
+    if (seen[points[p]]) {
+      for (i=0; i<length; i++) {
+        weights[i] = (xs[i] == points[p]) ? 1 : 0;
+      }
+    }
+    else {
+      // Otherwise none of the (point - x_j) are 0, so I take the product of
+      // all of them once and divide out the one for i.
+      product = 1;
+      for (j=0; j<length; j++) {
+        product = _gf256_mul(product, _gf256_sub(points[p],xs[j]));
+      }
+      for (i=0; i<length; i++) {
+        weights[i] = _gf256_mul(_gf256_div(product,
+            _gf256_sub(points[p],xs[i])), inversedenominators[i]);
+      }
+    }
+
+    // ...and the value at the point is the sum of f(x_i) * l_i(point)
+    memset(results + p*share_length, 0, share_length);
+    for (i=0; i<length; i++) {
+      _gf256_muladd_region(results + p*share_length,
+          sharedata + i*share_length, weights[i], share_length);
+    }
+  }
+
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&sharedatabuffer);
+  PyBuffer_Release(&pointsbuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
+
+}
+
 
-      denominator = _gf256_sub(xs[i],xs[j]);
 
-      this_term[0] = _gf256_div(xs[j],denominator);
-      // Precomputed the table of inverses
-//      this_term[1] = _gf256_div(1,denominator);
-      this_term[1] = _GF256_INV[denominator];
+// Python wrapper...   This adds one point to a Newton form interpolation of
+// every byte of a set of shares.   It returns the new Newton coefficient for
+// each byte, so adding the kth share costs O(k) per byte rather than a whole
+// new interpolation.
+static PyObject *newton_add(PyObject *module, PyObject *args) {
+  // The args are the xs so far (an array of gf256s), their Newton
+  // coefficients (one column of share_length gf256s per x, back to back),
+  // the new x, the new share data (share_length gf256s) and (optionally)
+  // out.   out may be right after the columns in the same buffer.
+
+  Py_buffer xsbuffer, columnsbuffer, newdatabuffer, out;
+  gf256 *xs, *columns, *newdata, *newcolumn;
+  int newx;
+  Py_ssize_t length, share_length, j;
+  int hasout = PyTuple_GET_SIZE(args) > 4;
+  PyObject *result = NULL;
+  gf256 product = 1;
+  gf256 inverseproduct;
+
+  if (!PyArg_ParseTuple(args, "s*s*is*|w*", &xsbuffer, &columnsbuffer,
+        &newx, &newdatabuffer, &out)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  xs = (gf256 *)xsbuffer.buf;
+  length = xsbuffer.len;
+  columns = (gf256 *)columnsbuffer.buf;
+  newdata = (gf256 *)newdatabuffer.buf;
+  share_length = newdatabuffer.len;
 
-      // Now, build the polynomial...
-      _multiply_polynomial_by_2terms_inplace(temppolynomial,length,this_term);
+  if ((length > 255) || (columnsbuffer.len != length * share_length)) {
+    PyErr_SetString(PyExc_ValueError, "must have one whole column per x");
+    goto done;
+  }
+
+  if ((newx <= 0) || (newx > 255)) {
+    PyErr_SetString(PyExc_ValueError, "invalid share index value");
+    goto done;
+  }
+
+  // The product of (x - x_j) for the existing xs.   The new coefficient is
+  // (f(x) - N(x)) divided by this, where N is the current interpolation.
+  for (j=0; j<length; j++) {
+    if (xs[j] == newx) {
+      PyErr_SetString(PyExc_ValueError, "xs must be unique");
+      goto done;
     }
-    // okay, now I've gone and computed the polynomial.   I need to multiply it
-    // by the result of f(x)
+    product = _gf256_mul(product, _gf256_sub(newx, xs[j]));
+  }
+  inverseproduct = _GF256_INV[product];
 
-    _multiply_polynomial_by_1term_inplace(temppolynomial,length,fxs[i]);
+  newcolumn = _result_buffer(&result, &out, hasout, share_length);
+  if (newcolumn == NULL) {
+    goto done;
+  }
 
-    _add_polynomials_inplace(returnedcoefficients,length,temppolynomial);
-    
+  // Evaluate N(x) for every byte at once with Horner's rule on the Newton
+  // form:  c_0 + (x - x_0)(c_1 + (x - x_1)(c_2 + ...))
+  memset(newcolumn, 0, share_length);
+  for (j=length-1; j>=0; j--) {
+    _gf256_mul_region(newcolumn, newcolumn, _gf256_sub(newx, xs[j]),
+        share_length);
+    _add_polynomials_inplace(newcolumn, share_length,
+        columns + j*share_length);
   }
 
-  // This is copied out, so it's okay this is a local variable.
-  PyObject *return_str_obj = Py_BuildValue("s#",returnedcoefficients,length);
+  // ...then (f(x) - N(x)) / product
+  _add_polynomials_inplace(newcolumn, share_length, newdata);
+  _gf256_mul_region(newcolumn, newcolumn, inverseproduct, share_length);
 
-  return return_str_obj;
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&columnsbuffer);
+  PyBuffer_Release(&newdatabuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
 
 }
 
 
 
-static void _multiply_polynomial_by_2terms_inplace(gf256 *dest,int length,
-        gf256 terms[2]) {
+// Python wrapper...   This turns a Newton form interpolation of every byte
+// (as built by newton_add) into the usual coefficients, one row per byte.
+static PyObject *newton_coefficients(PyObject *module, PyObject *args) {
+  // The args are the xs (an array of gf256s), the Newton coefficients
+  // (one column of share_length gf256s per x, back to back) and
+  // (optionally) out.
 
-  int i;
-  // I need a buffer to keep the temp data and don't want to malloc / free.
-  gf256 tempbuffer[256];
-  // should not be possible because it would overflow...
-  if (dest[length-1] != 0) {
-    printf("The destination contains %d!\n",dest[length-1]);
-    printf("others %d, %d!\n",dest[0],dest[1]);
-    exit(1);
+  Py_buffer xsbuffer, columnsbuffer, out;
+  gf256 *xs, *columns, *coefficients, *thispolynomial;
+  Py_ssize_t length, share_length, i, j, k;
+  int hasout = PyTuple_GET_SIZE(args) > 2;
+  PyObject *result = NULL;
+
+  if (!PyArg_ParseTuple(args, "s*s*|w*", &xsbuffer, &columnsbuffer, &out)) {
+    // Incorrect args...
+    return NULL;
   }
 
-  // put the upper term * dest in the temp buffer 
-  for (i=0; i<length; i++) {
-    tempbuffer[i] = _gf256_mul(dest[i],terms[1]);
+  xs = (gf256 *)xsbuffer.buf;
+  length = xsbuffer.len;
+  columns = (gf256 *)columnsbuffer.buf;
+
+  if ((length <= 0) || (length > 255) || (columnsbuffer.len % length != 0)) {
+    PyErr_SetString(PyExc_ValueError, "must have one whole column per x");
+    goto done;
+  }
+
+  share_length = columnsbuffer.len / length;
+
+  coefficients = _result_buffer(&result, &out, hasout, share_length * length);
+  if (coefficients == NULL) {
+    goto done;
+  }
+
+  for (i=0; i<share_length; i++) {
+    thispolynomial = coefficients + i*length;
+
+    // Multiply out from the innermost term:  p = p * (x - x_j) + c_j
+    for (k=0; k<length; k++) {
+      thispolynomial[k] = 0;
+    }
+    thispolynomial[0] = columns[(length-1)*share_length + i];
+
+    for (j=length-2; j>=0; j--) {
+      // p has degree length-2-j here, so shift it up one as I multiply by x
+      for (k=length-1-j; k>0; k--) {
+        thispolynomial[k] = _gf256_add(thispolynomial[k-1],
+            _gf256_mul(thispolynomial[k], xs[j]));
+      }
+      thispolynomial[0] = _gf256_add(_gf256_mul(thispolynomial[0], xs[j]),
+          columns[j*share_length + i]);
+    }
   }
 
-  // compute the lower term times the dest...
-  _multiply_polynomial_by_1term_inplace(dest,length,terms[0]);
+done:
+  PyBuffer_Release(&xsbuffer);
+  PyBuffer_Release(&columnsbuffer);
+  if (hasout) {
+    PyBuffer_Release(&out);
+  }
+  return result;
+
+}
+
 
-  // Now add them, but offset the temp buffer by 1 because it was multiplied
-  // by the upper term...
-  for (i=0; i<length-1; i++) {
-    dest[i+1] = _gf256_add(tempbuffer[i],dest[i+1]);
+
+// Fill in basis (length x length) with the Lagrange basis polynomials for
+// xs.   Row i is l_i, the polynomial that is 1 at xs[i] and 0 at the others.
+//
+// Rather than multiply out every l_i term by term (which is cubic), I build
+// the master polynomial  M(x) = (x - x_0) * (x - x_1) * ...  once.   Then
+// l_i is just  M(x) / (x - x_i)  (one synthetic division) divided by that
+// quotient's value at x_i.   This is quadratic overall.
+static void _lagrange_basis(gf256 *xs, int length, gf256 *basis) {
+
+  int i, j, k;
+  gf256 denominator;
+  gf256 inverse;
+  gf256 *thispolynomial;
+
+  // M(x) has degree length, so it needs one more slot than the basis rows
+  gf256 master[257];
+
+  // M(x) starts as 1 and I multiply in (x - x_j) for each j.   Don't need to
+  // negate because -x = x in GF256.
+  master[0] = 1;
+  for (k=1; k<=length; k++) {
+    master[k] = 0;
   }
+  for (j=0; j<length; j++) {
+    for (k=j+1; k>0; k--) {
+      master[k] = _gf256_add(master[k-1], _gf256_mul(master[k], xs[j]));
+    }
+    master[0] = _gf256_mul(master[0], xs[j]);
+  }
+
+  for (i=0; i<length; i++) {
+    thispolynomial = basis + i*length;
+
+    // Synthetic division of M(x) by (x - x_i), from the top term down.   The
+    // remainder is 0 because x_i is a root of M(x).
+    thispolynomial[length-1] = master[length];
+    for (k=length-1; k>0; k--) {
+      thispolynomial[k-1] = _gf256_add(master[k],
+          _gf256_mul(thispolynomial[k], xs[i]));
+    }
+
+    // The denominator is the quotient at x_i, which is the product of
+    // (x_i - x_j) for every other j.
+    denominator = 1;
+    for (j=0; j<length; j++) {
+      if (i==j) {
+        continue;
+      }
+      denominator = _gf256_mul(denominator, _gf256_sub(xs[i],xs[j]));
+    }
 
+    // Precomputed the table of inverses
+    inverse = _GF256_INV[denominator];
+    _multiply_polynomial_by_1term_inplace(thispolynomial,length,inverse);
+  }
 }
 
+
+
 static void _multiply_polynomial_by_1term_inplace(gf256 *dest,int length,
         gf256 term) {
-  int i;
-  for (i=0;i<length;i++) {
-    dest[i] = _gf256_mul(dest[i],term);
-  }
+  _gf256_mul_region(dest, dest, term, length);
 }
 
 static void _add_polynomials_inplace(gf256 *dest,int length,gf256 *terms) {
@@ -346,19 +1042,514 @@ static void _add_polynomials_inplace(gf256 *dest,int length,gf256 *terms) {
 
 
 
+// XOR two buffers (anything with the buffer interface) into a writable one.
+// This is on every login, so it doesn't allocate and goes 8 bytes at a time.
+static PyObject *xor_into(PyObject *module, PyObject *args) {
+  Py_buffer out, a, b;
+  Py_ssize_t i;
+  uint64_t aword, bword;
+  unsigned char *outbytes, *abytes, *bbytes;
+
+  if (!PyArg_ParseTuple(args, "w*s*s*", &out, &a, &b)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  if (a.len != b.len || out.len < a.len) {
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&a);
+    PyBuffer_Release(&b);
+    PyErr_SetString(PyExc_ValueError, "buffers must be the same length (and out at least as long)");
+    return NULL;
+  }
+
+  outbytes = (unsigned char *)out.buf;
+  abytes = (unsigned char *)a.buf;
+  bbytes = (unsigned char *)b.buf;
+
+  // memcpy since the buffers (say, memoryview slices) needn't be aligned.
+  for (i=0; i+8<=a.len; i+=8) {
+    memcpy(&aword, abytes+i, 8);
+    memcpy(&bword, bbytes+i, 8);
+    aword ^= bword;
+    memcpy(outbytes+i, &aword, 8);
+  }
+  for (; i<a.len; i++) {
+    outbytes[i] = abytes[i] ^ bbytes[i];
+  }
+
+  PyBuffer_Release(&out);
+  PyBuffer_Release(&a);
+  PyBuffer_Release(&b);
+
+  Py_RETURN_NONE;
+}
+
+
+
+
+// ***********************  SHA-256  ************************
+
+// This is plain FIPS 180-4 SHA-256.   I have my own so that it can run
+// without the GIL (hashlib only lets go of it for long inputs).
+
+static const uint32_t _SHA256_K[64] = {
+  0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1,
+  0x923f82a4, 0xab1c5ed5, 0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3,
+  0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174, 0xe49b69c1, 0xefbe4786,
+  0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+  0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147,
+  0x06ca6351, 0x14292967, 0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13,
+  0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85, 0xa2bfe8a1, 0xa81a664b,
+  0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+  0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a,
+  0x5b9cca4f, 0x682e6ff3, 0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208,
+  0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2};
+
+#define _ROTR(x, n) (((x) >> (n)) | ((x) << (32 - (n))))
+
+
+static void _sha256_compress(uint32_t *state, const unsigned char *block) {
+  uint32_t w[64];
+  uint32_t a, b, c, d, e, f, g, h, s0, s1, t1, t2;
+  int i;
+
+  for (i=0; i<16; i++) {
+    w[i] = ((uint32_t)block[i*4] << 24) | ((uint32_t)block[i*4+1] << 16) |
+        ((uint32_t)block[i*4+2] << 8) | (uint32_t)block[i*4+3];
+  }
+  for (i=16; i<64; i++) {
+    s0 = _ROTR(w[i-15], 7) ^ _ROTR(w[i-15], 18) ^ (w[i-15] >> 3);
+    s1 = _ROTR(w[i-2], 17) ^ _ROTR(w[i-2], 19) ^ (w[i-2] >> 10);
+    w[i] = w[i-16] + s0 + w[i-7] + s1;
+  }
+
+  a = state[0]; b = state[1]; c = state[2]; d = state[3];
+  e = state[4]; f = state[5]; g = state[6]; h = state[7];
+
+  for (i=0; i<64; i++) {
+    s1 = _ROTR(e, 6) ^ _ROTR(e, 11) ^ _ROTR(e, 25);
+    t1 = h + s1 + ((e & f) ^ (~e & g)) + _SHA256_K[i] + w[i];
+    s0 = _ROTR(a, 2) ^ _ROTR(a, 13) ^ _ROTR(a, 22);
+    t2 = s0 + ((a & b) ^ (a & c) ^ (b & c));
+    h = g; g = f; f = e; e = d + t1;
+    d = c; c = b; b = a; a = t1 + t2;
+  }
+
+  state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+  state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+}
+
+
+static void _sha256(const unsigned char *data, Py_ssize_t length,
+        unsigned char *digest) {
+  uint32_t state[8] = {0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+      0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19};
+  unsigned char lastblocks[128];
+  Py_ssize_t remaining;
+  int lastlength, i;
+  uint64_t bitlength = (uint64_t)length * 8;
+
+  // the whole blocks...
+  for (remaining = length; remaining >= 64; remaining -= 64) {
+    _sha256_compress(state, data);
+    data += 64;
+  }
+
+  // ...then what's left, the padding and the length (one or two blocks)
+  memset(lastblocks, 0, sizeof(lastblocks));
+  memcpy(lastblocks, data, remaining);
+  lastblocks[remaining] = 0x80;
+  lastlength = (remaining < 56) ? 64 : 128;
+  for (i=0; i<8; i++) {
+    lastblocks[lastlength-1-i] = (unsigned char)(bitlength >> (i*8));
+  }
+
+  _sha256_compress(state, lastblocks);
+  if (lastlength == 128) {
+    _sha256_compress(state, lastblocks + 64);
+  }
+
+  for (i=0; i<8; i++) {
+    digest[i*4] = (unsigned char)(state[i] >> 24);
+    digest[i*4+1] = (unsigned char)(state[i] >> 16);
+    digest[i*4+2] = (unsigned char)(state[i] >> 8);
+    digest[i*4+3] = (unsigned char)state[i];
+  }
+}
+
+
+
+
+// Checks a threshold login.   The args are salt+password, the stored passhash
+// (without any isolated check bytes) and the share it should decode to.
+// SHA-256, the XOR and the compare all happen without the GIL.
+static PyObject *sha256_xor_equals(PyObject *module, PyObject *args) {
+  Py_buffer data, stored, expected;
+  unsigned char digest[32];
+  unsigned char *storedbytes, *expectedbytes;
+  unsigned char difference = 0;
+  int i;
+
+  if (!PyArg_ParseTuple(args, "s*s*s*", &data, &stored, &expected)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  if (stored.len != 32 || expected.len != 32) {
+    PyBuffer_Release(&data);
+    PyBuffer_Release(&stored);
+    PyBuffer_Release(&expected);
+    PyErr_SetString(PyExc_ValueError, "the stored hash and share must be 32 bytes");
+    return NULL;
+  }
+
+  storedbytes = (unsigned char *)stored.buf;
+  expectedbytes = (unsigned char *)expected.buf;
+
+  Py_BEGIN_ALLOW_THREADS
+
+  _sha256((unsigned char *)data.buf, data.len, digest);
+
+  // look at every byte so the time doesn't depend on where they differ
+  for (i=0; i<32; i++) {
+    difference |= digest[i] ^ storedbytes[i] ^ expectedbytes[i];
+  }
+
+  Py_END_ALLOW_THREADS
+
+  PyBuffer_Release(&data);
+  PyBuffer_Release(&stored);
+  PyBuffer_Release(&expected);
+
+  return PyBool_FromLong(difference == 0);
+}
+
+
+
+
+// ***********************  Batched SHA-256  ************************
+
+// SHA-256(salt + password) for a whole batch at once.   Where the CPU has
+// AVX2, I hash eight single block messages (salt and password of 55 bytes
+// or less, which is nearly all of them) side by side, one per 32 bit lane.
+// Anything else goes through _sha256 one at a time.
+
+#ifdef _HAVE_X86_SIMD
+#define _HAVE_MULTIBUFFER 1
+#endif
+
+#define _SHA256_LANES 8
+
+// set in initfastpolymath_c from what the CPU supports
+static int _use_multibuffer = 0;
+
+
+#ifdef _HAVE_MULTIBUFFER
+
+#define _VROTR(x, n) _mm256_or_si256(_mm256_srli_epi32((x), (n)), \
+    _mm256_slli_epi32((x), 32 - (n)))
+
+static inline uint32_t _load_be32(const unsigned char *p) {
+  return ((uint32_t)p[0] << 24) | ((uint32_t)p[1] << 16) |
+      ((uint32_t)p[2] << 8) | (uint32_t)p[3];
+}
+
+
+// Hashes eight padded, single block messages (64 bytes each, back to back)
+// into eight digests.
+__attribute__((target("avx2")))
+static void _sha256_8blocks(const unsigned char *blocks, unsigned char *digests[]) {
+  static const uint32_t initialstate[8] = {0x6a09e667, 0xbb67ae85, 0x3c6ef372,
+      0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19};
+  __m256i w[64];
+  __m256i a, b, c, d, e, f, g, h, s0, s1, t1, t2;
+  uint32_t state[8][_SHA256_LANES];
+  int i, lane;
+
+  for (i=0; i<16; i++) {
+    w[i] = _mm256_setr_epi32(_load_be32(blocks+i*4),
+        _load_be32(blocks+64+i*4), _load_be32(blocks+128+i*4),
+        _load_be32(blocks+192+i*4), _load_be32(blocks+256+i*4),
+        _load_be32(blocks+320+i*4), _load_be32(blocks+384+i*4),
+        _load_be32(blocks+448+i*4));
+  }
+  for (i=16; i<64; i++) {
+    s0 = _mm256_xor_si256(_mm256_xor_si256(_VROTR(w[i-15], 7),
+        _VROTR(w[i-15], 18)), _mm256_srli_epi32(w[i-15], 3));
+    s1 = _mm256_xor_si256(_mm256_xor_si256(_VROTR(w[i-2], 17),
+        _VROTR(w[i-2], 19)), _mm256_srli_epi32(w[i-2], 10));
+    w[i] = _mm256_add_epi32(_mm256_add_epi32(w[i-16], s0),
+        _mm256_add_epi32(w[i-7], s1));
+  }
+
+  a = _mm256_set1_epi32(initialstate[0]);
+  b = _mm256_set1_epi32(initialstate[1]);
+  c = _mm256_set1_epi32(initialstate[2]);
+  d = _mm256_set1_epi32(initialstate[3]);
+  e = _mm256_set1_epi32(initialstate[4]);
+  f = _mm256_set1_epi32(initialstate[5]);
+  g = _mm256_set1_epi32(initialstate[6]);
+  h = _mm256_set1_epi32(initialstate[7]);
+
+  for (i=0; i<64; i++) {
+    s1 = _mm256_xor_si256(_mm256_xor_si256(_VROTR(e, 6), _VROTR(e, 11)),
+        _VROTR(e, 25));
+    t1 = _mm256_add_epi32(_mm256_add_epi32(h, s1),
+        _mm256_add_epi32(_mm256_xor_si256(_mm256_and_si256(e, f),
+        _mm256_andnot_si256(e, g)), _mm256_add_epi32(
+        _mm256_set1_epi32(_SHA256_K[i]), w[i])));
+    s0 = _mm256_xor_si256(_mm256_xor_si256(_VROTR(a, 2), _VROTR(a, 13)),
+        _VROTR(a, 22));
+    t2 = _mm256_add_epi32(s0, _mm256_xor_si256(_mm256_xor_si256(
+        _mm256_and_si256(a, b), _mm256_and_si256(a, c)),
+        _mm256_and_si256(b, c)));
+    h = g; g = f; f = e; e = _mm256_add_epi32(d, t1);
+    d = c; c = b; b = a; a = _mm256_add_epi32(t1, t2);
+  }
+
+  _mm256_storeu_si256((__m256i *)state[0], a);
+  _mm256_storeu_si256((__m256i *)state[1], b);
+  _mm256_storeu_si256((__m256i *)state[2], c);
+  _mm256_storeu_si256((__m256i *)state[3], d);
+  _mm256_storeu_si256((__m256i *)state[4], e);
+  _mm256_storeu_si256((__m256i *)state[5], f);
+  _mm256_storeu_si256((__m256i *)state[6], g);
+  _mm256_storeu_si256((__m256i *)state[7], h);
+
+  for (lane=0; lane<_SHA256_LANES; lane++) {
+    for (i=0; i<8; i++) {
+      uint32_t word = state[i][lane] + initialstate[i];
+      digests[lane][i*4] = (unsigned char)(word >> 24);
+      digests[lane][i*4+1] = (unsigned char)(word >> 16);
+      digests[lane][i*4+2] = (unsigned char)(word >> 8);
+      digests[lane][i*4+3] = (unsigned char)word;
+    }
+  }
+}
+
+#endif
+
+
+// Hashes salts[i] + passwords[i] into digests + 32*i for every i.   scratch
+// must hold the longest salt and password together.   No Python in here,
+// so it runs without the GIL.
+static void _sha256_many(const unsigned char **salts, Py_ssize_t *saltlengths,
+        const unsigned char **passwords, Py_ssize_t *passwordlengths,
+        Py_ssize_t count, unsigned char *digests, unsigned char *scratch) {
+  Py_ssize_t i, length;
+#ifdef _HAVE_MULTIBUFFER
+  unsigned char blocks[64 * _SHA256_LANES];
+  unsigned char *lanedigests[_SHA256_LANES];
+  Py_ssize_t lanelengths[_SHA256_LANES];
+  unsigned char *block;
+  int lanes = 0, j;
+#endif
+
+  for (i=0; i<count; i++) {
+    length = saltlengths[i] + passwordlengths[i];
+
+#ifdef _HAVE_MULTIBUFFER
+    if (_use_multibuffer && length <= 55) {
+      // pad it into the next lane...
+      block = blocks + 64 * lanes;
+      memset(block, 0, 64);
+      memcpy(block, salts[i], saltlengths[i]);
+      memcpy(block + saltlengths[i], passwords[i], passwordlengths[i]);
+      block[length] = 0x80;
+      for (j=0; j<8; j++) {
+        block[63-j] = (unsigned char)(((uint64_t)length * 8) >> (j*8));
+      }
+      lanedigests[lanes] = digests + 32 * i;
+      lanelengths[lanes] = length;
+      lanes++;
+
+      // ...and hash them once they are all full
+      if (lanes == _SHA256_LANES) {
+        _sha256_8blocks(blocks, lanedigests);
+        lanes = 0;
+      }
+      continue;
+    }
+#endif
+
+    memcpy(scratch, salts[i], saltlengths[i]);
+    memcpy(scratch + saltlengths[i], passwords[i], passwordlengths[i]);
+    _sha256(scratch, length, digests + 32 * i);
+  }
+
+#ifdef _HAVE_MULTIBUFFER
+  // the lanes that didn't fill up are cheaper to do one at a time
+  for (j=0; j<lanes; j++) {
+    _sha256(blocks + 64 * j, lanelengths[j], lanedigests[j]);
+  }
+#endif
+}
+
+
+
+
+// Returns a new tuple with the items of sequence (or sequence itself, with
+// a new reference, if it is a tuple), or sets a TypeError with message.
+static PyObject *_sequence_tuple(PyObject *sequence, const char *message) {
+  PyObject *tuple;
+
+  if (!PySequence_Check(sequence)) {
+    PyErr_SetString(PyExc_TypeError, message);
+    return NULL;
+  }
+  tuple = PySequence_Tuple(sequence);
+  if (tuple == NULL && PyErr_ExceptionMatches(PyExc_TypeError)) {
+    PyErr_SetString(PyExc_TypeError, message);
+  }
+  return tuple;
+}
+
+
+
+
+// Takes two equal length sequences of strings, salts and passwords, and
+// returns SHA-256(salts[i] + passwords[i]) for each i, concatenated.
+static PyObject *sha256_many(PyObject *module, PyObject *args) {
+  PyObject *saltlist, *passwordlist, *salts, *passwords, *result;
+  const unsigned char **saltbytes;
+  const unsigned char **passwordbytes;
+  Py_ssize_t *saltlengths, *passwordlengths;
+  Py_ssize_t count, i, longest = 0;
+  unsigned char *scratch;
+  char *buf;
+
+  if (!PyArg_ParseTuple(args, "OO", &saltlist, &passwordlist)) {
+    // Incorrect args...
+    return NULL;
+  }
+
+  // I hash from pointers into the strings after letting go of the GIL, so
+  // I need my own references to them.   (PySequence_Fast hands back a list
+  // itself, which another thread could empty meanwhile, freeing them.)   A
+  // tuple holds a reference to each item and can't be changed.
+  salts = _sequence_tuple(saltlist, "salts must be a sequence");
+  if (salts == NULL) {
+    return NULL;
+  }
+  passwords = _sequence_tuple(passwordlist, "passwords must be a sequence");
+  if (passwords == NULL) {
+    Py_DECREF(salts);
+    return NULL;
+  }
+
+  count = PyTuple_GET_SIZE(salts);
+  if (PyTuple_GET_SIZE(passwords) != count) {
+    Py_DECREF(salts);
+    Py_DECREF(passwords);
+    PyErr_SetString(PyExc_ValueError, "need as many salts as passwords");
+    return NULL;
+  }
+
+  saltbytes = PyMem_Malloc(sizeof(*saltbytes) * (count + 1));
+  passwordbytes = PyMem_Malloc(sizeof(*passwordbytes) * (count + 1));
+  saltlengths = PyMem_Malloc(sizeof(*saltlengths) * (count + 1));
+  passwordlengths = PyMem_Malloc(sizeof(*passwordlengths) * (count + 1));
+  result = NULL;
+  scratch = NULL;
+  if (saltbytes == NULL || passwordbytes == NULL || saltlengths == NULL ||
+      passwordlengths == NULL) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  // Only strings, since they can't change once I let go of the GIL.   The
+  // tuples keep them alive.
+  for (i=0; i<count; i++) {
+    if (PyString_AsStringAndSize(PyTuple_GET_ITEM(salts, i),
+            &buf, &saltlengths[i]) < 0) {
+      goto done;
+    }
+    saltbytes[i] = (const unsigned char *)buf;
+    if (PyString_AsStringAndSize(PyTuple_GET_ITEM(passwords, i),
+            &buf, &passwordlengths[i]) < 0) {
+      goto done;
+    }
+    passwordbytes[i] = (const unsigned char *)buf;
+    if (saltlengths[i] + passwordlengths[i] > longest) {
+      longest = saltlengths[i] + passwordlengths[i];
+    }
+  }
+
+  scratch = PyMem_Malloc(longest + 1);
+  result = PyString_FromStringAndSize(NULL, 32 * count);
+  if (scratch == NULL || result == NULL) {
+    Py_XDECREF(result);
+    result = NULL;
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+
+  _sha256_many(saltbytes, saltlengths, passwordbytes, passwordlengths, count,
+      (unsigned char *)PyString_AS_STRING(result), scratch);
+
+  Py_END_ALLOW_THREADS
+
+done:
+  PyMem_Free(saltbytes);
+  PyMem_Free(passwordbytes);
+  PyMem_Free(saltlengths);
+  PyMem_Free(passwordlengths);
+  PyMem_Free(scratch);
+  Py_DECREF(salts);
+  Py_DECREF(passwords);
+  return result;
+}
+
+
+
+
 // ******************* Code to make us a Python module *******************
 
 
 static PyMethodDef MyFastPolyMathMethods [] = {
   {"f", f, METH_VARARGS, "Compute f(x)."},
+  {"compute_shares", compute_shares, METH_VARARGS,
+      "Compute f(x) for every row of coefficients at each of the xs."},
   {"full_lagrange", full_lagrange, METH_VARARGS, 
       "Return the full lagrange for a set of shares."},
+  {"full_lagrange_many", full_lagrange_many, METH_VARARGS,
+      "Return the full lagrange for every byte of a set of shares."},
+  {"lagrange_at", lagrange_at, METH_VARARGS,
+      "Evaluate the polynomials through a set of shares at other points."},
+  {"newton_add", newton_add, METH_VARARGS,
+      "Add a share to a Newton form interpolation of every byte."},
+  {"newton_coefficients", newton_coefficients, METH_VARARGS,
+      "Turn a Newton form interpolation into coefficients, one row per byte."},
+  {"xor_into", xor_into, METH_VARARGS,
+      "XOR two buffers into a third."},
+  {"sha256_xor_equals", sha256_xor_equals, METH_VARARGS,
+      "Check that SHA-256(data) XOR stored equals expected, without the GIL."},
+  {"sha256_many", sha256_many, METH_VARARGS,
+      "Return SHA-256(salt + password) for each salt and password, concatenated."},
   {NULL, NULL, 0, NULL}
 };
 
 
 PyMODINIT_FUNC initfastpolymath_c(void) {
-  Py_InitModule("fastpolymath_c", MyFastPolyMathMethods);
+  PyObject *module;
+
+  module = Py_InitModule("fastpolymath_c", MyFastPolyMathMethods);
+  if (module == NULL) {
+    return;
+  }
+
+  _init_gf256_tables();
+  // which of the GF256 vector kernels is in use
+  PyModule_AddStringConstant(module, "GF256_KERNEL", _gf256_kernel_name);
+
+#ifdef _HAVE_MULTIBUFFER
+  _use_multibuffer = __builtin_cpu_supports("avx2") != 0;
+#endif
+  // so callers can tell which sha256_many they are getting
+  PyModule_AddIntConstant(module, "SHA256_MULTIBUFFER", _use_multibuffer);
 }
 
 
@@ -5,16 +5,38 @@
 
 #include "Python.h"
 
+#include <stdint.h>
+
 typedef unsigned char gf256;
 
 // Define all of the functions...
 
 static PyObject *f(PyObject *module, PyObject *args);
+static PyObject *compute_shares(PyObject *module, PyObject *args);
 static PyObject *full_lagrange(PyObject *module, PyObject *args);
+static PyObject *full_lagrange_many(PyObject *module, PyObject *args);
+static PyObject *lagrange_at(PyObject *module, PyObject *args);
+static PyObject *newton_add(PyObject *module, PyObject *args);
+static PyObject *newton_coefficients(PyObject *module, PyObject *args);
+static PyObject *xor_into(PyObject *module, PyObject *args);
+static PyObject *sha256_xor_equals(PyObject *module, PyObject *args);
+static PyObject *sha256_many(PyObject *module, PyObject *args);
+
+static void _sha256_compress(uint32_t *state, const unsigned char *block);
+static void _sha256(const unsigned char *data, Py_ssize_t length,
+        unsigned char *digest);
+static void _sha256_many(const unsigned char **salts, Py_ssize_t *saltlengths,
+        const unsigned char **passwords, Py_ssize_t *passwordlengths,
+        Py_ssize_t count, unsigned char *digests, unsigned char *scratch);
+
+static void _init_gf256_tables(void);
+
+static gf256 *_result_buffer(PyObject **result, Py_buffer *out, int hasout,
+        Py_ssize_t length);
+static int _check_unique_xs(gf256 *xs, Py_ssize_t length, char *seen);
 
+static void _lagrange_basis(gf256 *xs, int length, gf256 *basis);
 
-static void _multiply_polynomial_by_2terms_inplace(gf256 *dest,int length,
-        gf256 terms[2]);
 
 static void _multiply_polynomial_by_1term_inplace(gf256 *dest,int length,
         gf256 term);
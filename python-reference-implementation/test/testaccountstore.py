@@ -0,0 +1,82 @@
+import accountstore
+
+from unittest import TestCase
+
+class TestAccountStore(TestCase):
+
+  def test_accountstore(self):
+
+    store = accountstore.AccountStore(saltsize = 4, passhashsize = 6)
+
+    admin = [{'sharenumber':1, 'salt':'abcd', 'passhash':'123456'},
+        {'sharenumber':2, 'salt':'efgh', 'passhash':'abcdef'}]
+    store['admin'] = admin
+    store['alice'] = [{'sharenumber':-1, 'salt':'ijkl', 'passhash':'1234'}]
+
+    self.assertTrue('admin' in store)
+    self.assertTrue('bob' not in store)
+    self.assertTrue(len(store) == 2)
+    self.assertTrue(store['admin'] == admin)
+    self.assertTrue(store['alice'][0]['passhash'] == '1234')
+    self.assertTrue(store['alice'][0]['sharenumber'] == -1)
+
+    # changing an entry updates the columns
+    store['alice'][0]['passhash'] = '654321'
+    store['alice'][0]['sharenumber'] = 0
+    self.assertTrue(store['alice'][0]['passhash'] == '654321')
+    self.assertTrue(store['alice'][0]['sharenumber'] == 0)
+
+    # copies are independent
+    storecopy = store.copy()
+    store['admin'] = store['admin'][:1]
+    del store['alice']
+    self.assertTrue(len(store['admin']) == 1)
+    self.assertTrue('alice' not in store)
+    self.assertTrue(storecopy['admin'] == admin)
+    self.assertTrue(storecopy['alice'][0]['passhash'] == '654321')
+
+    self.assertRaises(ValueError, store.__setitem__, 'bob',
+        [{'sharenumber':0, 'salt':'abc', 'passhash':'123456'}])
+    self.assertRaises(ValueError, store.__setitem__, 'bob',
+        [{'sharenumber':0, 'salt':'abcd', 'passhash':'1234567'}])
+    self.assertTrue('bob' not in store)
+
+
+
+  def test_accountindex(self):
+
+    store = accountstore.AccountStore(saltsize = 4, passhashsize = 6)
+    store['admin'] = [{'sharenumber':1, 'salt':'abcd', 'passhash':'123456'}]
+
+    index = accountstore.AccountIndex(store, 4, 6)
+    self.assertTrue('admin' in index)
+    self.assertTrue(len(index) == 1)
+
+    # adding accounts leaves the old snapshot as it was
+    snapshots = [index]
+    for num in range(100):
+      snapshots.append(snapshots[-1].with_accounts([('user'+str(num),
+          [{'sharenumber':0, 'salt':'salt', 'passhash':str(num)}])]))
+    index = snapshots[-1]
+
+    for num in range(101):
+      self.assertTrue(len(snapshots[num]) == num + 1)
+    self.assertTrue('user50' not in snapshots[50])
+    self.assertTrue('user50' in snapshots[51])
+    self.assertTrue(index['user50'][0]['passhash'] == '50')
+    self.assertTrue(sorted(index.keys()) == sorted(['admin'] +
+        ['user'+str(num) for num in range(100)]))
+
+    # merging keeps the number of stores down
+    self.assertTrue(len(index._levels) < 5)
+
+    # newer accounts replace older ones
+    newer = index.with_accounts([('admin', [{'sharenumber':0, 'salt':'efgh',
+        'passhash':'abc'}])])
+    self.assertTrue(newer['admin'][0]['passhash'] == 'abc')
+    self.assertTrue(index['admin'][0]['passhash'] == '123456')
+    self.assertTrue(len(newer) == 101)
+    self.assertTrue(newer.copy() is newer)
+
+    self.assertRaises(ValueError, index.with_accounts, [('bob',
+        [{'sharenumber':0, 'salt':'abc', 'passhash':'123456'}])])
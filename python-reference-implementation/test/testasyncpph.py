@@ -0,0 +1,65 @@
+import polypasswordhasher
+
+from unittest import TestCase, skipIf
+
+try:
+  import asyncpph
+  asyncio = asyncpph.asyncio
+except ImportError:
+  asyncpph = None
+
+class TestAsyncPolyPasswordHasher(TestCase):
+
+  @skipIf(asyncpph is None, "needs asyncio or trollius (pip install trollius)")
+  def test_asyncpph(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',4)
+
+    # count the batches
+    batches = []
+    is_valid_login_many = pph.is_valid_login_many
+    def count_batches(pairs):
+      batches.append(len(pairs))
+      return is_valid_login_many(pairs)
+    pph.is_valid_login_many = count_batches
+
+    # gather and wait use the current loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+      apph = asyncpph.AsyncPolyPasswordHasher(pph, loop = loop,
+          maxconcurrency = 2, maxbatch = 8)
+
+      creates = [apph.create_account('user'+str(num),'password'+str(num),num % 2)
+          for num in range(10)]
+      loop.run_until_complete(asyncio.gather(*creates))
+      self.assertTrue(pph.nextavailableshare == 5 + 10/2)
+
+      logins = [apph.is_valid_login('user'+str(num),'password'+str(num))
+          for num in range(10)]
+      logins += [apph.is_valid_login('user'+str(num),'wrong')
+          for num in range(10)]
+      unknown = apph.is_valid_login('mallory','password')
+      cancelled = apph.is_valid_login('user1','password1')
+      cancelled.cancel()
+      self.assertTrue(apph.pending_count() == 22)
+
+      loop.run_until_complete(asyncio.wait(logins + [unknown]))
+
+      self.assertTrue([login.result() for login in logins] ==
+          [True] * 10 + [False] * 10)
+      # the unknown user only fails its own login
+      self.assertTrue(isinstance(unknown.exception(), ValueError))
+      self.assertTrue(cancelled.cancelled())
+      self.assertTrue(apph.pending_count() == 0)
+      # 21 logins (not the cancelled one) in batches of at most 8, and the
+      # unknown user is left out rather than spoiling its batch
+      self.assertTrue(batches == [8, 8, 4])
+
+    finally:
+      asyncio.set_event_loop(None)
+      loop.close()
+
+    self.assertRaises(ValueError, asyncpph.AsyncPolyPasswordHasher, pph,
+        loop = loop, maxconcurrency = 0)
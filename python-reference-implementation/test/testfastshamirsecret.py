@@ -96,3 +96,236 @@ class TestFastShamir(TestCase):
     # but not now...
     self.assertTrue(newsecret.is_valid_share(d) is False)
 
+
+
+  def test_share_cache(self):
+
+    s = shamirsecret.ShamirSecret(3,'hello')
+    s.precompute_shares([1,2,3,4])
+
+    a = s.compute_share(1)
+    # changing a returned share must not change what is cached...
+    a[1][0] = a[1][0] ^ 1
+    self.assertTrue(s.is_valid_share(a) is False)
+    self.assertTrue(s.is_valid_share(s.compute_share(1)))
+
+    # recovering replaces the coefficients, so the cache must be emptied
+    t = shamirsecret.ShamirSecret(3)
+    t._sharecache[5] = bytearray('xxxxx')
+    t.recover_secretdata([s.compute_share(2), s.compute_share(3),
+        s.compute_share(4)])
+    self.assertTrue(t.is_valid_share(s.compute_share(5)))
+    self.assertTrue(t.secretdata == 'hello')
+
+
+  def test_compute_shares(self):
+
+    s = shamirsecret.ShamirSecret(5,'my shared secret')
+
+    xs = [7, 1, 255, 42, 7]
+    shares = s.compute_shares(xs)
+
+    # the bulk kernel must agree with evaluating one byte at a time
+    for (x, sharedata) in shares:
+      expected = bytearray()
+      for thiscoefficient in s._coefficients:
+        expected.append(shamirsecret.f(x, thiscoefficient))
+      self.assertTrue(sharedata == expected)
+
+    self.assertTrue([x for (x, sharedata) in shares] == xs)
+    self.assertTrue(shares[1] == s.compute_share(1))
+
+    self.assertRaises(ValueError, s.compute_shares, [1, 0])
+    self.assertRaises(TypeError, s.compute_shares, [1, '2'])
+
+
+  def test_full_lagrange_many(self):
+
+    # every row must match doing full_lagrange one byte at a time
+    xs = [2, 4, 5, 9]
+    sharedatalist = [bytearray('\x0e\x01\xff'), bytearray('\x1e\x02\x00'),
+        bytearray('\x20\x03\x10'), bytearray('\x7f\x04\x80')]
+
+    rows = shamirsecret.full_lagrange_many(xs, sharedatalist)
+    self.assertTrue(len(rows) == 3)
+
+    for byte_to_use in range(3):
+      fxs = [sharedata[byte_to_use] for sharedata in sharedatalist]
+      self.assertTrue(rows[byte_to_use] == shamirsecret.full_lagrange(xs, fxs))
+
+    self.assertTrue(shamirsecret.full_lagrange_many([2,4,5],
+        [bytearray([14]), bytearray([30]), bytearray([32])]) ==
+        [chr(43)+chr(168)+chr(150)])
+
+
+  def test_vector_kernels(self):
+
+    import fastpolymath_c
+    import shamirsecret as pureshamirsecret
+    self.assertTrue(fastpolymath_c.GF256_KERNEL in ['scalar', 'ssse3', 'avx2', 'neon'])
+
+    # a high threshold and a secret that isn't a whole number of vectors
+    s = shamirsecret.ShamirSecret(100, 'x' * 37)
+    shares = s.compute_shares(range(1, 151))
+    for (x, sharedata) in shares[::7]:
+      expected = bytearray()
+      for thiscoefficient in s._coefficients:
+        expected.append(shamirsecret.f(x, thiscoefficient))
+      self.assertTrue(sharedata == expected)
+
+    xs = [x for (x, sharedata) in shares[:100]]
+    sharedatalist = [sharedata for (x, sharedata) in shares[:100]]
+    self.assertTrue(shamirsecret.full_lagrange_many(xs, sharedatalist) ==
+        [str(coefficients) for coefficients in s._coefficients])
+    points = [0, 5, 120, 150]
+    self.assertTrue(shamirsecret.lagrange_at(xs, sharedatalist, points) ==
+        pureshamirsecret._lagrange_at(xs, sharedatalist, points))
+
+    t = shamirsecret.ShamirSecret(100)
+    for share in shares[:100]:
+      t.add_share(share)
+    self.assertTrue(t.secretdata == 'x' * 37)
+
+
+  def test_buffers(self):
+
+    import fastpolymath_c
+    from array import array
+
+    # any buffer will do as an input...
+    expected = chr(43)+chr(168)+chr(150)
+    self.assertTrue(fastpolymath_c.full_lagrange(bytearray([2,4,5]),
+        array('B', [14,30,32])) == expected)
+    self.assertTrue(fastpolymath_c.full_lagrange(memoryview(bytearray([9,2,4,5]))[1:],
+        '\x0e\x1e\x20') == expected)
+    self.assertTrue(shamirsecret.full_lagrange(array('B', [2,4,5]), [14,30,32]) == expected)
+    self.assertTrue(shamirsecret.f(3, array('B', [1,2])) == shamirsecret.f(3, '\x01\x02'))
+
+    # ...and the result can go into one I give it
+    out = bytearray(4)
+    self.assertTrue(fastpolymath_c.full_lagrange('\x02\x04\x05', '\x0e\x1e\x20', out) is None)
+    self.assertTrue(out == bytearray(expected + '\x00'))
+    self.assertTrue(shamirsecret.full_lagrange([2,4,5], [14,30,32], memoryview(out)[1:]) is not None)
+    self.assertTrue(out[1:] == bytearray(expected))
+    self.assertRaises(ValueError, fastpolymath_c.full_lagrange, '\x02\x04\x05',
+        '\x0e\x1e\x20', bytearray(2))
+    self.assertRaises(TypeError, fastpolymath_c.full_lagrange, '\x02\x04\x05',
+        '\x0e\x1e\x20', 'not writable')
+
+    s = shamirsecret.ShamirSecret(3, 'secret')
+    coefficientmatrix = ''.join([str(coefficients) for coefficients in s._coefficients])
+    shares = array('B', [0] * 12)
+    shamirsecret.compute_shares([1, 2], coefficientmatrix, 3, shares)
+    self.assertTrue(shares.tostring() == str(s.compute_share(1)[1] + s.compute_share(2)[1]))
+
+
+  def test_recover_secret_at_zero(self):
+
+    s = shamirsecret.ShamirSecret(3,'my shared secret')
+    shares = s.compute_shares([3, 9, 27, 81, 243])
+
+    t = shamirsecret.ShamirSecret(3)
+    self.assertTrue(t.recover_secret_at_zero(shares) == 'my shared secret')
+    # this doesn't store anything...
+    self.assertTrue(t.secretdata is None)
+
+    # duplicates are fine, but the same x with different data is not
+    self.assertTrue(t.recover_secret_at_zero(shares+shares[:2]) == 'my shared secret')
+    badshare = (shares[0][0], bytearray(shares[0][1]))
+    badshare[1][0] ^= 1
+    self.assertRaises(ValueError, t.recover_secret_at_zero, shares+[badshare])
+
+    # a bad surplus share is caught...
+    badshare = (shares[4][0], bytearray(shares[4][1]))
+    badshare[1][5] ^= 1
+    self.assertRaises(ValueError, t.recover_secret_at_zero, shares[:4]+[badshare])
+    self.assertRaises(ValueError, t.recover_secretdata, shares[:4]+[badshare])
+    self.assertTrue(t.secretdata is None)
+
+    # ...and without it everything decodes
+    t.recover_secretdata(shares[:4])
+    self.assertTrue(t.secretdata == 'my shared secret')
+    self.assertTrue(t.is_valid_share(shares[4]))
+
+
+  def test_add_share(self):
+
+    s = shamirsecret.ShamirSecret(4,'my shared secret')
+    shares = s.compute_shares([200, 3, 17, 99, 4])
+
+    t = shamirsecret.ShamirSecret(4)
+    self.assertTrue(t.add_share(shares[0]) is False)
+    self.assertTrue(t.add_share(shares[1]) is False)
+    # duplicates are ignored...
+    self.assertTrue(t.add_share(shares[1]) is False)
+    self.assertTrue(t.incremental_share_count() == 2)
+    # ...but the same x with different data is not
+    badshare = (shares[1][0], bytearray(shares[1][1]))
+    badshare[1][0] ^= 1
+    self.assertRaises(ValueError, t.add_share, badshare)
+
+    self.assertTrue(t.add_share(shares[2]) is False)
+    self.assertTrue(t.add_share(shares[3]) is True)
+    self.assertTrue(t.incremental_share_count() == 0)
+
+    self.assertTrue(t.secretdata == 'my shared secret')
+    self.assertTrue(t._coefficients == s._coefficients)
+    self.assertTrue(t.is_valid_share(shares[4]))
+    self.assertRaises(ValueError, t.add_share, shares[4])
+
+
+  def test_recover_secretdata_robust(self):
+
+    s = shamirsecret.ShamirSecret(3,'my shared secret')
+    shares = s.compute_shares(range(1, 10))
+
+    # 9 shares with threshold 3 can correct 3 wrong ones
+    for pos in [0, 4, 7]:
+      shares[pos] = (shares[pos][0], bytearray('not the right one'[:16]))
+
+    t = shamirsecret.ShamirSecret(3)
+    self.assertTrue(t.recover_secretdata_robust(shares) == [1, 5, 8])
+    self.assertTrue(t.secretdata == 'my shared secret')
+
+    # but not 4
+    shares[2] = (shares[2][0], bytearray('not the right one'[:16]))
+    t = shamirsecret.ShamirSecret(3)
+    self.assertRaises(ValueError, t.recover_secretdata_robust, shares)
+    self.assertTrue(t.secretdata is None)
+
+
+  def test_xor_into(self):
+
+    a = 'correct horse battery staple!!!!'
+    b = bytearray(range(34))
+    out = bytearray(32)
+    shamirsecret.xor_into(out, a, memoryview(b)[:32])
+    self.assertTrue(out == bytearray([ord(a[pos]) ^ pos for pos in range(32)]))
+
+    # lengths that aren't whole words work too
+    out = bytearray(5)
+    shamirsecret.xor_into(out, 'hello', 'hello')
+    self.assertTrue(out == bytearray(5))
+
+    self.assertRaises(ValueError, shamirsecret.xor_into, bytearray(32), a, 'short')
+
+    # shares can be checked from any buffer
+    s = shamirsecret.ShamirSecret(2, 'hello')
+    share = s.compute_share(3)
+    self.assertTrue(s.is_valid_sharedata(3, memoryview(share[1])))
+    self.assertTrue(s.is_valid_sharedata(4, memoryview(share[1])) is False)
+
+
+  def test_is_valid_hashed_share(self):
+
+    from hashlib import sha256
+
+    s = shamirsecret.ShamirSecret(2, 'a'*32)
+    share = s.compute_share(3)
+    saltedhash = sha256('saltkitten').digest()
+    stored = bytearray(32)
+    shamirsecret.xor_into(stored, saltedhash, share[1])
+
+    self.assertTrue(s.is_valid_hashed_share(3, 'saltkitten', stored) == True)
+    self.assertTrue(s.is_valid_hashed_share(3, 'saltpuppy', stored) == False)
+    self.assertTrue(s.is_valid_hashed_share(4, 'saltkitten', memoryview(stored)) == False)
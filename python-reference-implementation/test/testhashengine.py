@@ -0,0 +1,128 @@
+import hashengine
+import polypasswordhasher
+
+from unittest import TestCase
+
+from hashlib import sha256
+import os
+import shutil
+import tempfile
+import threading
+
+class TestHashEngine(TestCase):
+
+  def setUp(self):
+    # the password files the tests write go here
+    self.tempdir = tempfile.mkdtemp()
+    self.passwordfile = os.path.join(self.tempdir, 'enginepasswords')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
+  def test_engines(self):
+
+    engine = hashengine.get_engine('sha256')
+    self.assertTrue(engine.hash('salt', 'kitten') == sha256('saltkitten').digest())
+
+    engine = hashengine.get_engine('pbkdf2-sha256', (1000,))
+    self.assertTrue(engine.parameters() == (1000,))
+    self.assertTrue(len(engine.hash('s'*16, 'kitten')) == hashengine.HASH_SIZE)
+    self.assertTrue(engine.hash('s'*16, 'kitten') != engine.with_cost(1001).hash('s'*16, 'kitten'))
+
+    # the others need optional packages
+    for (name, parameters) in [('scrypt', (10, 8, 1)), ('blake2b', (3,))]:
+      try:
+        engine = hashengine.get_engine(name, parameters)
+      except ImportError as error:
+        # says what to install
+        self.assertTrue('pip install' in str(error))
+        continue
+      self.assertTrue(engine.parameters() == parameters)
+      self.assertTrue(len(engine.hash('s'*16, 'kitten')) == hashengine.HASH_SIZE)
+
+    self.assertRaises(ValueError, hashengine.get_engine, 'md5')
+
+
+
+  def test_hash_many(self):
+
+    # a mix of lengths so some messages are a single block and some aren't,
+    # and the batch doesn't fill a whole number of lanes
+    salts = [os.urandom(16) for num in range(21)]
+    passwords = ['p' * (num * 5) for num in range(21)]
+
+    for engine in [hashengine.SHA256Engine(), hashengine.PBKDF2Engine(1000)]:
+      self.assertTrue(engine.hash_many(salts, passwords) ==
+          [engine.hash(salt, password) for (salt, password) in zip(salts, passwords)])
+      self.assertTrue(engine.hash_many([], []) == [])
+
+
+
+  def test_hash_many_while_changing(self):
+
+    # the C extension hashes without the GIL, so another thread can swap the
+    # strings out of the lists (freeing them) while it works.   The copies
+    # are equal, so the hashes should be too.
+    salts = [os.urandom(16) for num in range(2000)]
+    passwords = [os.urandom(200) for num in range(2000)]
+    expected = [sha256(salt + password).digest() for (salt, password) in
+        zip(salts, passwords)]
+    saltlist = list(salts)
+    passwordlist = list(passwords)
+
+    stopping = threading.Event()
+    def change_lists():
+      while not stopping.is_set():
+        saltlist[:] = [str(bytearray(salt)) for salt in salts]
+        passwordlist[:] = [str(bytearray(password)) for password in
+            passwords]
+    thread = threading.Thread(target=change_lists)
+    thread.start()
+    try:
+      engine = hashengine.SHA256Engine()
+      for num in range(50):
+        self.assertTrue(engine.hash_many(saltlist, passwordlist) == expected)
+    finally:
+      stopping.set()
+      thread.join()
+
+
+
+  def test_calibrate(self):
+
+    engine = hashengine.calibrate('pbkdf2-sha256', 0.005)
+    self.assertTrue(engine.name == 'pbkdf2-sha256')
+    self.assertTrue(engine.iterations >= 1000)
+
+    engine = hashengine.calibrate('pbkdf2-sha256', 10, maximumcost = 2000)
+    self.assertTrue(engine.iterations == 2000)
+
+    self.assertTrue(hashengine.calibrate('sha256', 0.005).name == 'sha256')
+
+
+
+  def test_stored_engine(self):
+
+    engine = hashengine.PBKDF2Engine(1000)
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 2,
+        passwordfile = None, hashengine = engine)
+    pph.create_account('admin','correct horse',2)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('dennis','menace',0)
+    pph.write_password_data(self.passwordfile)
+
+    # the engine comes back from the file...
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 2,
+        passwordfile = self.passwordfile)
+    self.assertTrue(pph.hashengine.name == 'pbkdf2-sha256')
+    self.assertTrue(pph.hashengine.parameters() == (1000,))
+    pph.unlock_password_data([('admin','correct horse')])
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+    self.assertTrue(pph.is_valid_login('dennis','menace') == True)
+    self.assertTrue(pph.is_valid_login('dennis','kitten') == False)
+
+    # ...and asking for a different one is an error
+    self.assertRaises(ValueError, polypasswordhasher.PolyPasswordHasher, 2,
+        self.passwordfile, 0, hashengine.PBKDF2Engine(2000))
+
@@ -0,0 +1,84 @@
+import passwordstore
+import polypasswordhasher
+
+from unittest import TestCase
+
+import os
+import pickle
+import shutil
+import tempfile
+THRESHOLD = 10
+
+class TestPasswordStore(TestCase):
+
+  def setUp(self):
+    # the password files the tests write go here
+    self.tempdir = tempfile.mkdtemp()
+    self.storefile = os.path.join(self.tempdir, 'teststore')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
+  def test_mapped_account_dict(self):
+
+    accounts = {}
+    for number in range(50):
+      accounts['user'+str(number)] = [{'sharenumber':number % 5 - 1,
+          'salt':chr(number)*16, 'passhash':chr(number+1)*34}]
+    accounts['admin'] = [{'sharenumber':1, 'salt':'a'*16, 'passhash':'b'*34},
+        {'sharenumber':2, 'salt':'c'*16, 'passhash':'d'*34}]
+
+    passwordstore.write_store(self.storefile, THRESHOLD, 2, 3, 'i'*32, accounts)
+    self.assertTrue(passwordstore.is_store_file(self.storefile))
+
+    accountdict = passwordstore.MappedAccountDict(self.storefile)
+    self.assertTrue(accountdict.threshold == THRESHOLD)
+    self.assertTrue(accountdict.isolated_check_bytes == 2)
+    self.assertTrue(accountdict.nextavailableshare == 3)
+    self.assertTrue(accountdict.secret_integrity_check == 'i'*32)
+    self.assertTrue(len(accountdict) == 51)
+    self.assertTrue(sorted(accountdict.keys()) == sorted(accounts.keys()))
+
+    for username in accounts:
+      self.assertTrue(accountdict[username] == accounts[username])
+
+    self.assertTrue('mallory' not in accountdict)
+    self.assertRaises(KeyError, accountdict.__getitem__, 'mallory')
+
+    # changes stay in memory...
+    accountdict['mallory'] = accounts['user3']
+    del accountdict['user4']
+    self.assertTrue('mallory' in accountdict)
+    self.assertTrue('user4' not in accountdict)
+    self.assertTrue(len(accountdict) == 51)
+
+    accountdict.close()
+
+
+
+  def test_convert_pickle_store(self):
+
+    # the password file in the top directory is an old pickled accountdict
+    picklefile = os.path.join(os.path.dirname(__file__), '..', 'securepasswords')
+    oldaccountdict = pickle.load(open(picklefile))
+
+    passwordstore.convert_pickle_store(picklefile, self.storefile, THRESHOLD)
+
+    accountdict = passwordstore.MappedAccountDict(self.storefile)
+    self.assertTrue(accountdict.isolated_check_bytes == 2)
+    self.assertTrue(accountdict.secret_integrity_check is None)
+    self.assertTrue(sorted(accountdict.keys()) == sorted(oldaccountdict.keys()))
+    for username in oldaccountdict:
+      self.assertTrue(accountdict[username] == oldaccountdict[username])
+    accountdict.close()
+
+    # and PolyPasswordHasher loads it...
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD,
+        passwordfile = self.storefile, isolated_check_bits = 2)
+    self.assertTrue(len(pph.accountdict) == len(oldaccountdict))
+
+    # ...but not with the wrong parameters
+    self.assertRaises(ValueError, polypasswordhasher.PolyPasswordHasher,
+        THRESHOLD + 1, self.storefile, 2)
+
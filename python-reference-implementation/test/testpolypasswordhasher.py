@@ -1,12 +1,28 @@
 import polypasswordhasher
+import passwordjournal
+import hashengine
 
 from unittest import TestCase
 
+import os
+import shutil
 import sys
+import tempfile
+import threading
 THRESHOLD = 10
 
 class TestPolyPasswordHasher(TestCase):
 
+  def setUp(self):
+    # the password files the tests write go here
+    self.tempdir = tempfile.mkdtemp()
+    self.journalfile = os.path.join(self.tempdir, 'journaledpasswords')
+    self.passwordfile = os.path.join(self.tempdir, 'securepasswords')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
   def test_polypasswordhasher(self):
 
     # require knowledge of 10 shares to decode others.   Create a blank, new
@@ -142,7 +158,389 @@ class TestPolyPasswordHasher(TestCase):
     # now, I can do the usual operations with it...
     self.assertTrue(pph.is_valid_login('alice','kitten') == True)
 
+    # the bootstrap account is now shielded
+    self.assertTrue(pph.accountdict['bootstrapper'][0]['sharenumber'] == 0)
+    self.assertTrue(pph.is_valid_login('bootstrapper','password') == True)
+    self.assertTrue(pph.is_valid_login('bootstrapper','nopassword') == False)
+
     # including create accounts...
     pph.create_account('moe','tadpole',1)
     pph.create_account('larry','fish',0)
        
+
+
+  def test_is_valid_login_many(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD,
+            passwordfile = None, isolated_check_bits = 2)
+
+    pph.create_account('admin','correct horse',THRESHOLD/2)
+    pph.create_account('root','battery staple',THRESHOLD/2)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('bob','puppy',1)
+    pph.create_account('dennis','menace',0)
+    pph.create_account('eve','iamevil',0)
+
+    pairs = [('alice','kitten'), ('dennis','password'), ('admin','correct horse'),
+        ('alice','nyancat!'), ('eve','iamevil'), ('bob','puppy'),
+        ('dennis','menace'), ('bob','kitten')]
+
+    expected = [pph.is_valid_login(username, password) for (username, password) in pairs]
+    self.assertTrue(expected == [True, False, True, False, True, True, True, False])
+    self.assertTrue(pph.is_valid_login_many(pairs) == expected)
+
+    # passwords that aren't strs work just as they do for a single login
+    pairs = [('alice',bytearray('kitten')), ('dennis',bytearray('menace')),
+        ('bob',bytearray('kitten'))]
+    expected = [pph.is_valid_login(username, password) for (username, password) in pairs]
+    self.assertTrue(expected == [True, True, False])
+    self.assertTrue(pph.is_valid_login_many(pairs) == expected)
+
+    # an unknown user fails the whole batch, like a single login would
+    self.assertRaises(ValueError, pph.is_valid_login_many,
+        [('alice','kitten'), ('mallory','kitten')])
+
+    # ...but only its own login with check_logins, and the others are still
+    # checked together
+    batches = []
+    is_valid_login_many = pph.is_valid_login_many
+    def count_batches(pairs):
+      batches.append(len(pairs))
+      return is_valid_login_many(pairs)
+    pph.is_valid_login_many = count_batches
+    results = pph.check_logins([('alice','kitten'), ('mallory','kitten'),
+        ('alice','puppy'), ('admin','correct horse')])
+    self.assertTrue(results[0] == (True, None))
+    self.assertTrue(results[1][0] is None and
+        isinstance(results[1][1], ValueError))
+    self.assertTrue(results[2:] == [(False, None), (True, None)])
+    self.assertTrue(batches == [3])
+    del pph.is_valid_login_many
+
+    pph.write_password_data(self.passwordfile)
+
+    # while bootstrapping, isolated validation and bootstrap accounts are used
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD,
+            passwordfile = self.passwordfile, isolated_check_bits = 2)
+    pph.create_account('bootstrapper','password',0)
+
+    pairs = [('bootstrapper','password'), ('alice','kitten'),
+        ('bootstrapper','nopassword'), ('admin','correct horse')]
+    expected = [pph.is_valid_login(username, password) for (username, password) in pairs]
+    self.assertTrue(pph.is_valid_login_many(pairs) == expected)
+
+
+  def test_unlock_wrong_password(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD, passwordfile = None)
+    pph.create_account('admin','correct horse',THRESHOLD/2)
+    pph.create_account('root','battery staple',THRESHOLD/2)
+    pph.create_account('superuser','purple monkey dishwasher',THRESHOLD/2)
+    pph.create_account('alice','kitten',1)
+    pph.write_password_data(self.passwordfile)
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD, passwordfile = self.passwordfile)
+
+    # with surplus shares, a wrong password is caught before the coefficients
+    # are built...
+    self.assertRaises(ValueError, pph.unlock_password_data,
+        [('admin','correct horse'), ('root','battery staple'), ('alice','puppy')])
+
+    # ...and with exactly threshold shares, by the integrity check
+    self.assertRaises(ValueError, pph.unlock_password_data,
+        [('admin','correct horse'), ('root','battery stable')])
+    self.assertTrue(pph.knownsecret is False)
+
+    # a later correct attempt still works
+    pph.unlock_password_data([('admin','correct horse'), ('root','battery staple')])
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+
+
+  def test_add_unlock_login(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD, passwordfile = None)
+    pph.create_account('admin','correct horse',THRESHOLD/2)
+    pph.create_account('root','battery staple',THRESHOLD/2)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('bob','puppy',1)
+    pph.create_account('dennis','menace',0)
+    pph.write_password_data(self.passwordfile)
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD, passwordfile = self.passwordfile)
+
+    self.assertTrue(pph.add_unlock_login('admin','correct horse') is False)
+    self.assertTrue(pph.unlock_share_count() == THRESHOLD/2)
+    # logging in again (or as a shielded user) adds nothing
+    self.assertTrue(pph.add_unlock_login('admin','correct horse') is False)
+    self.assertTrue(pph.add_unlock_login('dennis','menace') is False)
+    self.assertTrue(pph.unlock_share_count() == THRESHOLD/2)
+
+    # a wrong password that completes the threshold fails, but the shares
+    # are kept...
+    self.assertTrue(pph.add_unlock_login('alice','kitten') is False)
+    self.assertRaises(ValueError, pph.add_unlock_login, 'root', 'battery stable')
+    self.assertTrue(pph.unlock_share_count() == THRESHOLD + 1)
+    self.assertTrue(pph.knownsecret is False)
+
+    # ...and root logging in again replaces the wrong login
+    self.assertTrue(pph.add_unlock_login('bob','puppy') is False)
+    self.assertTrue(pph.add_unlock_login('root','battery staple') is True)
+    self.assertTrue(pph.unlock_share_count() == 0)
+
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+    self.assertTrue(pph.is_valid_login('dennis','menace') == True)
+    self.assertRaises(ValueError, pph.add_unlock_login, 'admin', 'correct horse')
+
+
+  def test_add_unlock_login_surplus(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',3)
+    pph.create_account('root','battery staple',3)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('bob','puppy',1)
+    pph.write_password_data(self.passwordfile)
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.passwordfile)
+
+    self.assertTrue(pph.add_unlock_login('admin','correct horse') is False)
+    self.assertRaises(ValueError, pph.add_unlock_login, 'alice', 'nyancat!')
+    # one surplus share can't outvote alice's...
+    self.assertTrue(pph.add_unlock_login('bob','puppy') is False)
+    self.assertTrue(pph.unlock_share_count() == 5)
+    # ...but four can
+    self.assertTrue(pph.add_unlock_login('root','battery staple') is True)
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+
+
+  def test_unlock_password_data_robust(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',3)
+    pph.create_account('root','battery staple',3)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('bob','puppy',1)
+    pph.create_account('dennis','menace',0)
+    pph.write_password_data(self.passwordfile)
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.passwordfile)
+
+    logindata = [('admin','correct horse'), ('root','battery staple'),
+        ('alice','nyancat!'), ('bob','puppy'), ('dennis','password')]
+
+    # the normal unlock can only tell that something is wrong...
+    self.assertRaises(ValueError, pph.unlock_password_data, logindata)
+
+    # ...but this one finds alice (dennis is shielded, so has no share)
+    self.assertTrue(pph.unlock_password_data_robust(logindata) == ['alice'])
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+
+    # with too many wrong logins, it can't unlock
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.passwordfile)
+    self.assertRaises(ValueError, pph.unlock_password_data_robust,
+        [('admin','correct horse'), ('root','battery stable')])
+    self.assertTrue(pph.knownsecret is False)
+
+
+  def test_journal(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',3)
+    pph.create_account('root','battery staple',3)
+    pph.use_journal(self.journalfile, commitdelay = 0.001)
+
+    # these are only in the journal...
+    pph.create_account('alice','kitten',1)
+    pph.create_account('dennis','menace',0)
+    pph.close_journal()
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.journalfile)
+    self.assertTrue(pph.nextavailableshare == 8)
+    pph.unlock_password_data([('admin','correct horse'), ('root','battery staple')])
+    self.assertTrue(pph.is_valid_login('alice','kitten') == True)
+    self.assertTrue(pph.is_valid_login('dennis','menace') == True)
+
+    # a torn write at the end of the journal is ignored
+    pph.use_journal(self.journalfile, commitdelay = 0)
+    pph.create_account('bob','puppy',1)
+    segmentfilename = pph.journal.segmentfilename
+    pph.close_journal()
+    open(segmentfilename, 'ab').write('A\0\0\0')
+
+    # compaction folds the journal into the password file
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.journalfile)
+    pph.unlock_password_data([('admin','correct horse'), ('root','battery staple')])
+    self.assertTrue(pph.is_valid_login('bob','puppy') == True)
+    pph.use_journal(self.journalfile, compactsize = 0)
+    pph.create_account('eve','iamevil',0)
+    pph.close_journal()
+    self.assertTrue(len(passwordjournal.journal_segments(self.journalfile)) == 1)
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = self.journalfile)
+    pph.unlock_password_data([('admin','correct horse'), ('root','battery staple')])
+    self.assertTrue(pph.is_valid_login('eve','iamevil') == True)
+    self.assertTrue(sorted(pph.accountdict.keys()) ==
+        ['admin', 'alice', 'bob', 'dennis', 'eve', 'root'])
+
+
+
+  def test_shielded_cipher(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',4)
+    for num in range(20):
+      pph.create_account('user'+str(num),'password'+str(num),0)
+
+    # the key schedule is only done once...
+    cipher = pph._shielded_cipher()
+    self.assertTrue(pph.is_valid_login('user3','password3') == True)
+    self.assertTrue(pph.is_valid_login('user3','password4') == False)
+    self.assertTrue(pph._shielded_cipher() is cipher)
+
+    # ...and a batch encrypts the same as one at a time
+    hashes = ['a'*32, 'b'*32, 'c'*32]
+    self.assertTrue(pph._encrypt_hashes(hashes) ==
+        [cipher.encrypt(thishash) for thishash in hashes])
+    self.assertTrue(pph._encrypt_hashes([]) == [])
+
+
+  def test_threads(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    pph.create_account('admin','correct horse',4)
+    for num in range(20):
+      pph.create_account('user'+str(num),'password'+str(num),num % 2)
+
+    failures = []
+    snapshot = pph.accountdict
+
+    def check_logins():
+      for repeat in range(20):
+        for num in range(20):
+          if pph.is_valid_login('user'+str(num),'password'+str(num)) is not True:
+            failures.append(num)
+          if pph.is_valid_login('user'+str(num),'wrong') is not False:
+            failures.append(num)
+
+    def create_accounts(first):
+      for num in range(first, first+20):
+        pph.create_account('new'+str(num),'password'+str(num),num % 2)
+
+    threads = [threading.Thread(target=check_logins) for num in range(4)]
+    threads += [threading.Thread(target=create_accounts, args=(num*20,)) for
+        num in range(3)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertTrue(failures == [])
+    self.assertTrue(pph.nextavailableshare == 5 + 20/2 + 60/2)
+    # the accounts a login looked up in never change under it
+    self.assertTrue(len(snapshot) == 21 and 'new0' not in snapshot)
+    for num in range(60):
+      self.assertTrue(pph.is_valid_login('new'+str(num),'password'+str(num)) == True)
+
+
+
+  def test_create_account_refused(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD, passwordfile = None)
+    pph.create_account('admin','correct horse',THRESHOLD)
+
+    # count the hashes
+    hashes = []
+    hash = pph.hashengine.hash
+    def count_hashes(salt, password):
+      hashes.append(password)
+      return hash(salt, password)
+    pph.hashengine.hash = count_hashes
+
+    # an account that can't be created is refused before any hashing
+    self.assertRaises(ValueError, pph.create_account, 'admin', 'kitten', 3)
+    self.assertRaises(ValueError, pph.create_account, 'alice', 'kitten', 256)
+    self.assertRaises(ValueError, pph.create_account, 'alice', 'kitten', 250)
+    self.assertTrue(hashes == [])
+
+    pph.create_account('alice','kitten',2)
+    self.assertTrue(hashes == ['kitten', 'kitten'])
+
+
+
+  def test_create_accounts(self):
+
+    records = [('user'+str(num), 'password'+str(num), num % 3) for num in range(50)]
+
+    sequential = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+    for (username, password, shares) in records:
+      sequential.create_account(username, password, shares)
+
+    for processes in [1, 2]:
+      pph = polypasswordhasher.PolyPasswordHasher(threshold = 4, passwordfile = None)
+      counts = []
+      self.assertTrue(pph.create_accounts(iter(records), processes,
+          chunksize = 16, progress = counts.append) == 50)
+      self.assertTrue(counts == [16, 32, 48, 50])
+
+      # the same share numbers as creating them one at a time
+      self.assertTrue(pph.nextavailableshare == sequential.nextavailableshare)
+      for (username, password, shares) in records:
+        self.assertTrue([entry['sharenumber'] for entry in pph.accountdict[username]] ==
+            [entry['sharenumber'] for entry in sequential.accountdict[username]])
+        self.assertTrue(pph.is_valid_login(username, password) == True)
+        self.assertTrue(pph.is_valid_login(username, 'wrong') == False)
+
+      # stops at the first bad record, keeping the ones before it
+      self.assertRaises(ValueError, pph.create_accounts, [('new1', 'a', 1),
+          ('user1', 'b', 1), ('new2', 'c', 1)], processes)
+      self.assertRaises(ValueError, pph.create_accounts, [('new3', 'a', 256)],
+          processes)
+      self.assertTrue('new1' in pph.accountdict)
+      self.assertTrue('new2' not in pph.accountdict)
+      self.assertTrue('new3' not in pph.accountdict)
+
+
+
+  def test_is_valid_prehashed_login(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD,
+            passwordfile = None, isolated_check_bits = 2,
+            hashengine = hashengine.PBKDF2Engine(1000))
+
+    pph.create_account('admin','correct horse',THRESHOLD/2)
+    pph.create_account('root','battery staple',THRESHOLD/2)
+    pph.create_account('alice','kitten',1)
+    pph.create_account('dennis','menace',0)
+
+    # what a front end would do...
+    def prehash(username, password):
+      (salt, enginename, parameters) = pph.get_login_parameters(username)
+      return hashengine.get_engine(enginename, parameters).hash(salt, password)
+
+    pairs = [('alice','kitten'), ('alice','nyancat!'), ('admin','correct horse'),
+        ('dennis','menace'), ('dennis','password')]
+    for (username, password) in pairs:
+      self.assertTrue(pph.is_valid_prehashed_login(username,
+          prehash(username, password)) == pph.is_valid_login(username, password))
+
+    self.assertRaises(ValueError, pph.get_login_parameters, 'mallory')
+    self.assertRaises(ValueError, pph.is_valid_prehashed_login, 'mallory', 'x' * 32)
+    self.assertRaises(ValueError, pph.is_valid_prehashed_login, 'alice', 'x' * 31)
+
+    # an account without entries is refused by both
+    accounts = pph.accountdict
+    pph.accountdict = accounts.with_accounts([('nobody', [])])
+    self.assertRaises(ValueError, pph.get_login_parameters, 'nobody')
+    self.assertRaises(ValueError, pph.is_valid_prehashed_login, 'nobody', 'x' * 32)
+    pph.accountdict = accounts
+
+    pph.write_password_data(self.passwordfile)
+
+    # while bootstrapping
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = THRESHOLD,
+            passwordfile = self.passwordfile, isolated_check_bits = 2)
+    pph.create_account('bootstrapper','password',0)
+    for (username, password) in [('bootstrapper','password'),
+        ('bootstrapper','nopassword'), ('alice','kitten'), ('alice','kitty')]:
+      self.assertTrue(pph.is_valid_prehashed_login(username,
+          prehash(username, password)) == pph.is_valid_login(username, password))
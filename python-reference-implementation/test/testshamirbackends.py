@@ -0,0 +1,162 @@
+import polypasswordhasher
+import shamirbackend
+import shamirsecret
+
+from unittest import TestCase
+
+import os
+import shutil
+import tempfile
+
+# The same checks for every Shamir backend that can be imported here.   They
+# all must give the same shares and coefficients as the pure Python one.
+
+class TestShamirBackends(TestCase):
+
+  def setUp(self):
+    # the password files the tests write go here
+    self.tempdir = tempfile.mkdtemp()
+    self.passwordfile = os.path.join(self.tempdir, 'securepasswords')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
+  def test_get_backend(self):
+
+    self.assertTrue(shamirbackend.available_backends()[-1] == 'shamirsecret')
+    self.assertTrue(shamirbackend.get_backend('shamirsecret') is shamirsecret)
+    # PolyPasswordHasher uses the default one
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 2)
+    self.assertTrue(type(pph.shamirsecretobj).__module__ ==
+        shamirbackend.get_backend().__name__)
+
+    try:
+      shamirbackend.get_backend('notabackend')
+    except ValueError:
+      pass
+    else:
+      self.fail("An unknown backend was returned")
+
+
+
+  def test_same_results(self):
+
+    for threshold in [1, 2, 3, 10, 253]:
+      original = shamirsecret.ShamirSecret(threshold, os.urandom(32))
+      shares = original.compute_shares(range(1, 256))
+
+      for backend in _backends():
+        # recover from shares that aren't in order...
+        recovered = backend.ShamirSecret(threshold)
+        recovered.recover_secretdata(shares[::-1][:threshold])
+        self.assertTrue(recovered.secretdata == original.secretdata)
+        self.assertTrue(recovered._coefficients == original._coefficients)
+        self.assertTrue(recovered.compute_shares(range(1, 256)) == shares)
+
+        # ...with surplus shares...
+        self.assertTrue(backend.ShamirSecret(threshold).recover_secret_at_zero(
+            shares[:threshold+2]) == original.secretdata)
+        surplus = backend.ShamirSecret(threshold)
+        surplus.recover_secretdata(shares[:threshold+2])
+        self.assertTrue(surplus._coefficients == original._coefficients)
+
+        # ...and one at a time
+        added = backend.ShamirSecret(threshold)
+        for share in shares[-threshold:]:
+          added.add_share(share)
+        self.assertTrue(added.secretdata == original.secretdata)
+        self.assertTrue(added.incremental_share_count() == 0)
+
+        # a new secret's shares can be recovered by the pure Python one
+        created = backend.ShamirSecret(threshold, 'a secret')
+        check = shamirsecret.ShamirSecret(threshold)
+        check.recover_secretdata(created.compute_shares(range(1, threshold+1)))
+        self.assertTrue(check._coefficients == created._coefficients)
+
+
+
+  def test_bad_shares(self):
+
+    original = shamirsecret.ShamirSecret(3, 'hello')
+    shares = original.compute_shares(range(1, 8))
+    badshares = list(shares)
+    badshares[2] = (3, bytearray('jello'))
+
+    for backend in _backends():
+      try:
+        backend.ShamirSecret(3).recover_secret_at_zero(badshares)
+      except ValueError:
+        pass
+      else:
+        self.fail("A wrong surplus share was accepted by "+backend.__name__)
+
+      robust = backend.ShamirSecret(3)
+      self.assertTrue(robust.recover_secretdata_robust(badshares) == [3])
+      self.assertTrue(robust.secretdata == 'hello')
+      self.assertTrue(robust.is_valid_share(shares[2]))
+      self.assertTrue(robust.is_valid_share(badshares[2]) is False)
+      self.assertTrue(robust.is_valid_sharedata(4, memoryview(shares[3][1])))
+
+      try:
+        backend.ShamirSecret(3).recover_secretdata([shares[0], (1,
+          bytearray('jello')), shares[1]])
+      except ValueError:
+        pass
+      else:
+        self.fail("Shares with the same x were accepted by "+backend.__name__)
+
+      try:
+        robust.compute_share(0)
+      except ValueError:
+        pass
+      else:
+        self.fail("A share at 0 was computed by "+backend.__name__)
+
+
+
+  def test_polypasswordhasher(self):
+
+    # PolyPasswordHasher works the same with each of them
+    oldbackend = polypasswordhasher.shamirsecret
+    try:
+      for backend in _backends():
+        polypasswordhasher.shamirsecret = backend
+
+        pph = polypasswordhasher.PolyPasswordHasher(threshold = 3)
+        pph.create_account('admin', 'correct horse', 2)
+        pph.create_account('root', 'battery staple', 2)
+        pph.create_account('alice', 'kitten', 1)
+        pph.create_account('dennis', 'menace', 0)
+        pph.write_password_data(self.passwordfile)
+
+        pph = polypasswordhasher.PolyPasswordHasher(threshold = 3,
+            passwordfile = self.passwordfile)
+        pph.unlock_password_data([('admin', 'correct horse'),
+            ('root', 'battery staple')])
+        self.assertTrue(pph.is_valid_login('alice', 'kitten'))
+        self.assertTrue(pph.is_valid_login('alice', 'puppy') is False)
+        self.assertTrue(pph.is_valid_login('dennis', 'menace'))
+    finally:
+      polypasswordhasher.shamirsecret = oldbackend
+
+
+
+  def test_numpy_tables(self):
+
+    try:
+      import numpyshamirsecret
+    except ImportError:
+      self.skipTest("NumPy is not installed")
+
+    for a in range(256):
+      for b in range(256):
+        self.assertTrue(numpyshamirsecret._MUL[a, b] ==
+            shamirsecret._gf256_mul(a, b))
+
+
+
+
+def _backends():
+  return [shamirbackend.get_backend(name) for name in
+      shamirbackend.available_backends()]
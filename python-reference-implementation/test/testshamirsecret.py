@@ -1,6 +1,8 @@
 import shamirsecret
 from unittest import TestCase
 
+import os
+
 #  Basic tests for this module.   Should output nothing on success.
 class TestShamirSecret(TestCase):
 
@@ -9,6 +11,36 @@ class TestShamirSecret(TestCase):
     self.assertTrue(shamirsecret._multiply_polynomials([1,3,4],[4,5]) == [4,9,31,20])
     self.assertTrue(shamirsecret._full_lagrange([2,4,5],[14,30,32]) == [43, 168, 150])
 
+  def test_full_lagrange_recovers_polynomial(self):
+    # interpolating enough points of a polynomial must give it back...
+    coefficients = [7, 0, 200, 13, 1, 99, 42, 255, 3, 128]
+    xs = [1, 2, 3, 50, 77, 100, 128, 200, 254, 255]
+    fxs = [shamirsecret._f(x, coefficients) for x in xs]
+    self.assertTrue(shamirsecret._full_lagrange(xs, fxs) == coefficients)
+
+    # ...and extra points just give zero higher order terms
+    xs.append(9)
+    fxs.append(shamirsecret._f(9, coefficients))
+    self.assertTrue(shamirsecret._full_lagrange(xs, fxs) == coefficients+[0])
+
+  def test_tables(self):
+    # the multiplication table and powers must agree with the logs...
+    for a in range(1, 256):
+      for b in range(1, 256):
+        self.assertTrue(shamirsecret._gf256_mul(a, b) == shamirsecret._GF256_EXP[
+            (shamirsecret._GF256_LOG[a] + shamirsecret._GF256_LOG[b]) % 255])
+      self.assertTrue(shamirsecret._gf256_mul(a, 0) == 0)
+      self.assertTrue(shamirsecret._gf256_powers(a)[255] == 1)
+
+    # ...and the shares for many xs at once must be what _f gives (whichever
+    # way around they are computed)
+    coefficients = [bytearray(os.urandom(5)) for pos in range(4)]
+    for xs in [[3], range(1, 256)]:
+      shares = shamirsecret._evaluate_shares(xs, coefficients)
+      for pos in range(len(xs)):
+        self.assertTrue(shares[pos] == bytearray([shamirsecret._f(xs[pos],
+            thesecoefficients) for thesecoefficients in coefficients]))
+
   def test_shamirsecret(self):
 
     s = shamirsecret.ShamirSecret(2,'hello')
@@ -91,3 +123,115 @@ class TestShamirSecret(TestCase):
     # but not now...
     self.assertTrue(newsecret.is_valid_share(d) is False)
 
+
+
+  def test_recover_secret_at_zero(self):
+
+    s = shamirsecret.ShamirSecret(3,'my shared secret')
+    shares = s.compute_shares([3, 9, 27, 81, 243])
+
+    t = shamirsecret.ShamirSecret(3)
+    self.assertTrue(t.recover_secret_at_zero(shares) == 'my shared secret')
+    # this doesn't store anything...
+    self.assertTrue(t.secretdata is None)
+
+    # duplicates are fine, but the same x with different data is not
+    self.assertTrue(t.recover_secret_at_zero(shares+shares[:2]) == 'my shared secret')
+    badshare = (shares[0][0], bytearray(shares[0][1]))
+    badshare[1][0] ^= 1
+    self.assertRaises(ValueError, t.recover_secret_at_zero, shares+[badshare])
+
+    # a bad surplus share is caught...
+    badshare = (shares[4][0], bytearray(shares[4][1]))
+    badshare[1][5] ^= 1
+    self.assertRaises(ValueError, t.recover_secret_at_zero, shares[:4]+[badshare])
+    self.assertRaises(ValueError, t.recover_secretdata, shares[:4]+[badshare])
+    self.assertTrue(t.secretdata is None)
+
+    # ...and without it everything decodes
+    t.recover_secretdata(shares[:4])
+    self.assertTrue(t.secretdata == 'my shared secret')
+    self.assertTrue(t.is_valid_share(shares[4]))
+
+
+  def test_add_share(self):
+
+    s = shamirsecret.ShamirSecret(4,'my shared secret')
+    shares = s.compute_shares([200, 3, 17, 99, 4])
+
+    t = shamirsecret.ShamirSecret(4)
+    self.assertTrue(t.add_share(shares[0]) is False)
+    self.assertTrue(t.add_share(shares[1]) is False)
+    # duplicates are ignored...
+    self.assertTrue(t.add_share(shares[1]) is False)
+    self.assertTrue(t.incremental_share_count() == 2)
+    # ...but the same x with different data is not
+    badshare = (shares[1][0], bytearray(shares[1][1]))
+    badshare[1][0] ^= 1
+    self.assertRaises(ValueError, t.add_share, badshare)
+
+    self.assertTrue(t.add_share(shares[2]) is False)
+    self.assertTrue(t.add_share(shares[3]) is True)
+    self.assertTrue(t.incremental_share_count() == 0)
+
+    self.assertTrue(t.secretdata == 'my shared secret')
+    self.assertTrue(t._coefficients == s._coefficients)
+    self.assertTrue(t.is_valid_share(shares[4]))
+    self.assertRaises(ValueError, t.add_share, shares[4])
+
+
+  def test_recover_secretdata_robust(self):
+
+    s = shamirsecret.ShamirSecret(3,'my shared secret')
+    shares = s.compute_shares(range(1, 10))
+
+    # 9 shares with threshold 3 can correct 3 wrong ones
+    for pos in [0, 4, 7]:
+      shares[pos] = (shares[pos][0], bytearray('not the right one'[:16]))
+
+    t = shamirsecret.ShamirSecret(3)
+    self.assertTrue(t.recover_secretdata_robust(shares) == [1, 5, 8])
+    self.assertTrue(t.secretdata == 'my shared secret')
+
+    # but not 4
+    shares[2] = (shares[2][0], bytearray('not the right one'[:16]))
+    t = shamirsecret.ShamirSecret(3)
+    self.assertRaises(ValueError, t.recover_secretdata_robust, shares)
+    self.assertTrue(t.secretdata is None)
+
+
+  def test_xor_into(self):
+
+    a = 'correct horse battery staple!!!!'
+    b = bytearray(range(34))
+    out = bytearray(32)
+    shamirsecret.xor_into(out, a, memoryview(b)[:32])
+    self.assertTrue(out == bytearray([ord(a[pos]) ^ pos for pos in range(32)]))
+
+    # lengths that aren't whole words work too
+    out = bytearray(5)
+    shamirsecret.xor_into(out, 'hello', 'hello')
+    self.assertTrue(out == bytearray(5))
+
+    self.assertRaises(ValueError, shamirsecret.xor_into, bytearray(32), a, 'short')
+
+    # shares can be checked from any buffer
+    s = shamirsecret.ShamirSecret(2, 'hello')
+    share = s.compute_share(3)
+    self.assertTrue(s.is_valid_sharedata(3, memoryview(share[1])))
+    self.assertTrue(s.is_valid_sharedata(4, memoryview(share[1])) is False)
+
+
+  def test_is_valid_hashed_share(self):
+
+    from hashlib import sha256
+
+    s = shamirsecret.ShamirSecret(2, 'a'*32)
+    share = s.compute_share(3)
+    saltedhash = sha256('saltkitten').digest()
+    stored = bytearray(32)
+    shamirsecret.xor_into(stored, saltedhash, share[1])
+
+    self.assertTrue(s.is_valid_hashed_share(3, 'saltkitten', stored) == True)
+    self.assertTrue(s.is_valid_hashed_share(3, 'saltpuppy', stored) == False)
+    self.assertTrue(s.is_valid_hashed_share(4, 'saltkitten', memoryview(stored)) == False)
@@ -0,0 +1,169 @@
+import polypasswordhasher
+import verificationdaemon
+
+from unittest import TestCase
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+class TestVerificationDaemon(TestCase):
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.socketpath = os.path.join(self.tempdir, 'pph.sock')
+    self.passwordfile = os.path.join(self.tempdir, 'securepasswords')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
+
+  def test_verificationdaemon(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 3)
+    pph.create_account('admin', 'correct horse', 2)
+    pph.create_account('root', 'battery staple', 2)
+    pph.create_account('alice', 'kitten', 1)
+    pph.create_account('dennis', 'menace', 0)
+    pph.write_password_data(self.passwordfile)
+
+    # the daemon loads it locked, just like a worker would
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 3,
+        passwordfile = self.passwordfile)
+    server = verificationdaemon.VerificationServer(pph, self.socketpath,
+        workers = 2)
+    server.start()
+    client = verificationdaemon.VerificationClient(self.socketpath,
+        batchsize = 3, window = 2)
+    try:
+      self.assertTrue(os.stat(self.socketpath).st_mode & 0o777 == 0o600)
+      self.assertRaises(ValueError, client.is_valid_login, 'alice', 'kitten')
+      self.assertRaises(ValueError, client.create_account, 'bob', 'puppy', 1)
+
+      self.assertRaises(ValueError, client.unlock_password_data,
+          [('admin', 'correct horse'), ('root', 'wrong')])
+      client.unlock_password_data([('admin', 'correct horse'),
+          ('root', 'battery staple')])
+      self.assertTrue(pph.knownsecret)
+
+      client.create_account('bob', 'puppy', 1)
+      self.assertRaises(ValueError, client.create_account, 'bob', 'puppy', 1)
+      self.assertTrue(pph.is_valid_login('bob', 'puppy'))
+
+      # several batches, sent a window at a time
+      pairs = [('alice', 'kitten'), ('alice', 'puppy'), ('dennis', 'menace'),
+          ('bob', 'puppy'), ('bob', 'kitten'), ('admin', 'correct horse'),
+          ('root', 'battery staple')]
+      self.assertTrue(client.is_valid_login_many(pairs) ==
+          pph.is_valid_login_many(pairs))
+      self.assertTrue(client.is_valid_login('dennis', 'menace') is True)
+      self.assertRaises(ValueError, client.is_valid_login, 'eve', 'iamevil')
+
+      # from several threads at once, sharing the pooled connections
+      failures = []
+      def check_logins():
+        for num in range(20):
+          if client.is_valid_login_many(pairs) != [True, False, True, True,
+              False, True, True]:
+            failures.append(num)
+      threads = [threading.Thread(target=check_logins) for num in range(4)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      self.assertTrue(failures == [])
+      self.assertTrue(len(client._pool) <= client.poolsize)
+
+      # a garbled request gets an error and the connection carries on
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      sock.connect(self.socketpath)
+      sock.sendall(verificationdaemon._HEADER.pack(7, 1, 99) + 'x')
+      (requestid, bodylength, status) = verificationdaemon._HEADER.unpack(
+          verificationdaemon._recv_exactly(sock, verificationdaemon._HEADER.size))
+      self.assertTrue(requestid == 7 and status == verificationdaemon.ERROR)
+      sock.close()
+
+      # a server is already there
+      self.assertRaises(ValueError, verificationdaemon.VerificationServer, pph,
+          self.socketpath)
+    finally:
+      client.close()
+      server.shutdown()
+
+    self.assertTrue(not os.path.exists(self.socketpath))
+
+
+
+  def test_load_shedding(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 3)
+    pph.create_account('admin', 'correct horse', 3)
+
+    # hold up the worker until all the requests are in
+    go = threading.Event()
+    is_valid_login_many = pph.is_valid_login_many
+    def wait_then_check(pairs):
+      go.wait()
+      return is_valid_login_many(pairs)
+    pph.is_valid_login_many = wait_then_check
+
+    server = verificationdaemon.VerificationServer(pph, self.socketpath,
+        workers = 1, maxpending = 2)
+    server.start()
+    client = verificationdaemon.VerificationClient(self.socketpath,
+        batchsize = 1)
+    try:
+      timer = threading.Timer(0.2, go.set)
+      timer.start()
+      # the third login is over the limit, so it is refused straight away
+      self.assertRaises(verificationdaemon.ServerBusyError,
+          client.is_valid_login_many, [('admin', 'correct horse')] * 3)
+      timer.join()
+      self.assertTrue(server.shedcount == 1)
+
+      # and once the work is done, logins get in again
+      self.assertTrue(client.is_valid_login_many(
+          [('admin', 'correct horse')] * 2) == [True, True])
+
+      # requests that waited too long are shed too
+      server.maxqueuetime = -1
+      self.assertRaises(verificationdaemon.ServerBusyError,
+          client.is_valid_login, 'admin', 'correct horse')
+      self.assertTrue(server.shedcount == 2)
+    finally:
+      go.set()
+      client.close()
+      server.shutdown()
+
+
+
+  def test_stuck_client(self):
+
+    pph = polypasswordhasher.PolyPasswordHasher(threshold = 3)
+    pph.create_account('admin', 'correct horse', 3)
+    pph.create_account('dennis', 'menace', 0)
+
+    server = verificationdaemon.VerificationServer(pph, self.socketpath,
+        workers = 1, sendtimeout = 0.2)
+    server.start()
+    client = verificationdaemon.VerificationClient(self.socketpath,
+        timeout = 5)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      # a client that sends lots of logins and never reads the answers, so
+      # the worker's writes to it get stuck...
+      sock.connect(self.socketpath)
+      request = verificationdaemon._encode_pairs([('dennis', 'menace')])
+      sock.sendall(''.join([verificationdaemon._HEADER.pack(num,
+          len(request), verificationdaemon.VERIFY) + request for num in
+          range(4000)]))
+
+      # ...is dropped, and then the others get their answers
+      self.assertTrue(client.is_valid_login('dennis', 'menace') is True)
+    finally:
+      sock.close()
+      client.close()
+      server.shutdown()